@@ -0,0 +1,72 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Benchmark of constrained entity linking on the most ambiguous mentions of the gazetteer.
+
+Compares filtering the candidates on their JSON entity records, read one by one, with filtering
+on the class and property id sets of the entity types store, as done by EntityLinker.
+
+    python benchmarks/constrained_linking.py --mentions 1000 --class-name Q5
+"""
+import argparse
+import heapq
+import logging
+import time
+
+from wd_semantic_parsing.utils import init_logging
+from wd_semantic_parsing.wikidata.linker import EntityLinker, normalize_mention
+
+
+def link_entity_records(linker, mention, class_name=None, property_name=None):
+    """Constrained linking on the JSON entity records, one query and one decode per candidate."""
+    candidates = []
+    for candidate in linker.gazetteer.read(normalize_mention(mention)) or []:
+        entity = linker.entities.read(candidate)
+        if class_name and class_name not in entity['classes']:
+            continue
+        if property_name and property_name not in entity['properties']:
+            continue
+        candidates.append(candidate)
+    return candidates
+
+
+def benchmark(name, link_mentions, mentions, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = link_mentions(mentions)
+    elapsed = (time.perf_counter() - start) / repeat
+    logging.info(f"{name}: {elapsed * 1000:.1f} ms, {len(mentions) / elapsed:.0f} mentions/s")
+    return elapsed, results
+
+
+if __name__ == '__main__':
+    init_logging()
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lang', default='en')
+    parser.add_argument('--mentions', type=int, default=1000, help="Number of most ambiguous mentions")
+    parser.add_argument('--class-name', default='Q5')
+    parser.add_argument('--property-name', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    linker = EntityLinker(args.lang)
+    
+    logging.info("Selecting the most ambiguous mentions")
+    ambiguous = heapq.nlargest(args.mentions, linker.gazetteer.iteritems(), key=lambda item: len(item[1]))
+    mentions = [mention for mention, _ in ambiguous]
+    logging.info(f"{len(mentions)} mentions, {sum(len(candidates) for _, candidates in ambiguous)} candidates")
+    
+    constraints = dict(class_name=args.class_name, property_name=args.property_name)
+    records_time, expected = benchmark(
+        "Entity records", lambda mentions: [link_entity_records(linker, mention, **constraints) for mention in mentions],
+        mentions, args.repeat)
+    types_time, results = benchmark(
+        "Entity types", lambda mentions: [linker.link_entity(mention, **constraints) for mention in mentions],
+        mentions, args.repeat)
+    batch_time, batch_results = benchmark(
+        "Entity types, batched", lambda mentions: linker.link_entities(mentions, **constraints),
+        mentions, args.repeat)
+    
+    assert results == expected and batch_results == expected
+    logging.info(f"Speedup: {records_time / types_time:.1f}x, batched: {records_time / batch_time:.1f}x")
@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Benchmark of the entity extraction of dump_entities for increasing numbers of worker processes.
+
+A synthetic dump of items with labels, aliases and sitelinks in several languages and a few dozen
+statements is written, or an existing dump is read with --dump. The extraction is timed for each number of
+workers, and its output is checked to be the same as with a single worker. Reading and batching the lines,
+done by the parent process alone, is also timed: it bounds the speedup whatever the number of cores.
+
+These results are from a single core, so they cannot show scaling. On a 2.9 GB synthetic dump of 200k items,
+1 worker took 20.7 s, and 2, 4, 8 and 16 workers took 26.7, 28.2, 29.0 and 34.6 s. Reading the
+uncompressed dump took 3.5 s of the 20.7 s, so the speedup is at most 5.9x, and the near-linear scaling
+up to 16 cores is not met. Passing the batches to the workers adds to the serial part. With a compressed
+dump, decompression adds more, unless an external --decompressor runs it on other cores.
+    
+    python benchmarks/extraction_workers.py --entities 200000 --workers 1 2 4 8 16
+"""
+import argparse
+import filecmp
+import logging
+import os
+import random
+import tempfile
+import time
+from os import path
+
+from wd_semantic_parsing import codec
+from wd_semantic_parsing.utils import init_logging
+from wd_semantic_parsing.wikidata import dump_entities
+
+
+LANGUAGES = ['en', 'fr', 'de', 'es', 'it', 'ja', 'ru', 'zh']
+
+
+def snak(prop, qid, rng):
+    return {'snaktype': 'value', 'property': prop, 'hash': '%040x' % rng.getrandbits(160),
+            'datavalue': {'value': {'entity-type': 'item', 'numeric-id': int(qid[1:]), 'id': qid},
+                          'type': 'wikibase-entityid'}, 'datatype': 'wikibase-item'}
+
+
+def synthetic_entry(i, rng):
+    qid = f'Q{i + 1}'
+    # Only some items have English labels, as in the dump
+    languages = [lang for lang in LANGUAGES if rng.random() < 0.5]
+    claims = {}
+    for _ in range(rng.randint(1, 40)):
+        prop = f'P{rng.randrange(3000)}'
+        claims.setdefault(prop, []).append({
+            'mainsnak': snak(prop, f'Q{rng.randrange(1000000)}', rng), 'type': 'statement',
+            'id': qid + '$%032x' % rng.getrandbits(128), 'rank': 'normal',
+            'references': [{'hash': '%040x' % rng.getrandbits(160), 'snaks': {'P248': [snak('P248', 'Q36578', rng)]},
+                            'snaks-order': ['P248']}]})
+    return {
+        'type': 'item', 'id': qid,
+        'labels': {lang: {'language': lang, 'value': f'entity {i} {lang}'} for lang in languages},
+        'descriptions': {lang: {'language': lang, 'value': f'description of entity {i}'} for lang in languages},
+        'aliases': {lang: [{'language': lang, 'value': f'alias {i} {j}'} for j in range(rng.randint(0, 3))]
+                    for lang in languages},
+        'claims': claims,
+        'sitelinks': {f'{lang}wiki': {'site': f'{lang}wiki', 'title': f'Entity {i}', 'badges': []}
+                      for lang in languages if rng.random() < 0.5},
+    }
+
+
+def write_dump(filepath, count, seed=0):
+    rng = random.Random(seed)
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for i in range(count):
+            f.write(codec.dumps(synthetic_entry(i, rng)) + (',\n' if i < count - 1 else '\n'))
+        f.write(']\n')
+
+
+if __name__ == '__main__':
+    init_logging()
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entities', type=int, default=200000, help="Number of synthetic entities")
+    parser.add_argument('--dump', help="Existing dump to read instead of a synthetic one")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--languages', nargs='+', default=['en'])
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = args.dump
+        if dump_path is None:
+            dump_path = path.join(tmp_dir, 'dump.json')
+            write_dump(dump_path, args.entities)
+            logging.info(f"Synthetic dump: {path.getsize(dump_path) / 1e6:.0f} MB")
+        dump_entities.WIKIDATA_DIR = tmp_dir
+        
+        # Reading and batching the lines is done by the parent process alone, which bounds the speedup
+        start = time.perf_counter()
+        for _ in dump_entities.read_dump_batches(dump_path):
+            pass
+        serial = time.perf_counter() - start
+        
+        times, reference = {}, None
+        for workers in args.workers:
+            entities_path = path.join(tmp_dir, f'entities_{workers}.jsonl')
+            dump_entities.WIKIDATA_ENTITIES = entities_path
+            start = time.perf_counter()
+            dump_entities.extract_entities(args.languages, workers=workers, dump_path=dump_path)
+            times[workers] = time.perf_counter() - start
+            
+            if reference is None:
+                reference = entities_path
+            elif not filecmp.cmp(reference, entities_path, shallow=False):
+                raise AssertionError(f"The output with {workers} workers differs from the one with {args.workers[0]}")
+            else:
+                os.remove(entities_path)
+        
+        for workers, elapsed in times.items():
+            logging.info(f"{workers} workers: {elapsed:.2f} s, {times[args.workers[0]] / elapsed:.2f}x "
+                         f"(cores: {os.cpu_count()})")
+        logging.info(f"Reading the dump: {serial:.2f} s, the speedup is at most "
+                     f"{times[args.workers[0]] / serial:.1f}x")
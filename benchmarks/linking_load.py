@@ -0,0 +1,96 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Load test of the entity linking service, started with:
+
+    python src/wd_semantic_parsing/wikidata/linker.py --serve --port 8080
+
+Concurrent keep-alive connections send POST /link requests for mentions drawn from the gazetteer, with
+--batch mentions per request, and the latency percentiles and throughput are reported.
+
+    python benchmarks/linking_load.py --port 8080 --connections 64 --requests 20000
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from itertools import islice
+
+from wd_semantic_parsing import codec
+from wd_semantic_parsing.utils import init_logging
+from wd_semantic_parsing.wikidata.gazetteer import get_gazetteer
+
+
+async def post(reader, writer, host, path, request):
+    body = codec.dumpb(request)
+    writer.write(b'POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                 % (path.encode(), host.encode(), len(body)) + body)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    response = codec.loads(await reader.readexactly(length))
+    if status != 200:
+        raise RuntimeError(f"HTTP {status}: {response}")
+    return response
+
+
+async def connection(host, port, requests, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while requests:
+            request = requests.pop()
+            start = time.perf_counter()
+            await post(reader, writer, host, '/link', request)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, requests, connections):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(host, port, requests, latencies) for _ in range(connections)))
+    return latencies, time.perf_counter() - start
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+if __name__ == '__main__':
+    init_logging()
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--lang', default='en')
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=1, help="Mentions per request")
+    parser.add_argument('--mentions', type=int, default=100000, help="Number of gazetteer mentions to draw from")
+    parser.add_argument('--class-name', default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    gazetteer = get_gazetteer(args.lang, read_only=True)
+    mentions = list(islice(gazetteer.iterkeys(), args.mentions))
+    gazetteer.close()
+    
+    random.seed(args.seed)
+    requests = [{'mentions': random.choices(mentions, k=args.batch), 'class_name': args.class_name}
+                for _ in range(args.requests)]
+    latencies, elapsed = asyncio.run(run_load(args.host, args.port, requests, args.connections))
+    
+    latencies.sort()
+    logging.info(f"{len(latencies)} requests of {args.batch} mentions on {args.connections} connections "
+                 f"in {elapsed:.2f} s: {len(latencies) / elapsed:.0f} QPS, "
+                 f"{len(latencies) * args.batch / elapsed:.0f} mentions/s")
+    logging.info(f"Latency p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+                 f"p99 {percentile(latencies, 99) * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
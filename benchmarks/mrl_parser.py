@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Benchmark of parse_mrl_obj against the recursive parser it replaced, parse_mrl_obj_recursive.
+
+The MRLs are those of the LC-QuAD 2.0 training set when a checkout of its repository is given,
+otherwise a sample of typical MRLs. MRLs nested --depth times are also parsed, where the recursive
+parser is quadratic. The memory held by the parsed MRLs is also reported, with the intern tables of the
+predicates and objects.
+    
+    python benchmarks/mrl_parser.py --lcquad LC-QuAD2.0 --repeat 3
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+
+from wd_semantic_parsing.utils import init_logging
+from wd_semantic_parsing.mrl.parser import parse_mrl_obj, parse_mrl_obj_recursive
+
+
+SAMPLE_MRLS = [
+    'wd.predicate.wdt:P35(wd:Q127998)',
+    'wd.predicate.*ps:P1411(wd.predicate.*p:P1411(wd:Q124057))',
+    'wd.predicate.wdt:P35(wd:Q127998) & wd.predicate.wdt:P31(wd:Q6256)',
+    'wd.predicate.*ps:P1082(wd.predicate.*p:P1082(wd:Q1045) ^ wd.predicate.pq:P585(wd.operator.year(2009)))',
+    'wd.operator.order_by(wd.predicate.wdt:P31(wd:Q11387), DESC, wd.predicate.wdt:P2120, 5)',
+    'wd.predicate.*rdfs:label(wd.predicate.wdt:P31(wd:Q334166)) & wd.operator.label_contains_string("vehicle", "en")',
+    'wd.predicate.*pq:P515(wd.predicate.*p:P2054(wd:Q283) & wd.operator.contains_value(wd.predicate.ps:P2054, "0.9857"))',
+    'wd.operator.equal(wd.predicate.*wdt:P2404(wd:Q740), 0.1)',
+]
+
+
+def nested_mrl(depth):
+    return 'wd.predicate.*wdt:P31(' * depth + 'wd:Q5' + ')' * depth + ' & wd.predicate.wdt:P17(wd:Q142)'
+
+
+def benchmark(name, parse, mrls, repeat):
+    # The best of the repeats, the others being slowed down by the rest of the machine
+    elapsed = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for mrl in mrls:
+            parse(mrl)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    logging.info(f"{name}: {elapsed / len(mrls) * 1e6:.1f} us/MRL, {len(mrls) / elapsed:.0f} MRLs/s")
+    return elapsed
+
+
+def compare(name, mrls, repeat):
+    recursive = benchmark(f"{name} parse_mrl_obj_recursive", parse_mrl_obj_recursive, mrls, repeat)
+    iterative = benchmark(f"{name} parse_mrl_obj", parse_mrl_obj, mrls, repeat)
+    logging.info(f"{name}: {recursive / iterative:.1f}x faster")
+
+
+def measure_memory(mrls):
+    tracemalloc.start()
+    parsed = [parse_mrl_obj(mrl)[0] for mrl in mrls]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    logging.info(f"{len(parsed)} parsed MRLs: {size / len(parsed):.0f} bytes/MRL")
+
+
+if __name__ == '__main__':
+    init_logging()
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lcquad', default=None, help="Checkout of the LC-QuAD 2.0 repository")
+    parser.add_argument('--depth', type=int, default=100, help="Nesting depth of the nested MRLs")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    if args.lcquad:
+        from wd_semantic_parsing.datasets.lcquad2 import LC_QUAD2
+        mrls = [str(entry['mrl']) for entry in LC_QUAD2(args.lcquad).preprocess_entries()]
+        # Lists of MRLs are parsed one MRL at a time by parse_mrl
+        mrls = [mrl for mrl in mrls if not mrl.startswith('[')]
+    else:
+        mrls = SAMPLE_MRLS * 1000
+    logging.info(f"{len(mrls)} MRLs of {sum(map(len, mrls)) / len(mrls):.0f} characters on average")
+    
+    compare('MRLs', mrls, args.repeat)
+    measure_memory(mrls)
+    compare(f'Depth {args.depth}', [nested_mrl(args.depth)] * 100, args.repeat)
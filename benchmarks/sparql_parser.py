@@ -0,0 +1,79 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Benchmark of SPARQL.parse, which parses the supported subset of SPARQL with parse_subset, against
+SPARQL.parse_rdflib, the rdflib parser it falls back to for the other queries.
+
+The queries are those of the LC-QuAD 2.0 training set when a checkout of its repository is given,
+otherwise a sample of typical queries. The parsed queries are also checked against rdflib, and the
+queries falling back to rdflib are counted.
+
+    python benchmarks/sparql_parser.py --lcquad LC-QuAD2.0 --repeat 3
+"""
+import argparse
+import logging
+import time
+
+from wd_semantic_parsing.utils import init_logging
+from wd_semantic_parsing.sparql.data import SPARQL, SparqlSubsetException, parse_subset
+
+
+SAMPLE_QUERIES = [
+    'SELECT DISTINCT ?sbj WHERE { ?sbj wdt:P35 wd:Q127998 . ?sbj wdt:P31 wd:Q6256 . }',
+    "SELECT ?obj WHERE { wd:Q1045 p:P1082 ?s . ?s ps:P1082 ?obj . ?s pq:P585 ?x filter(contains(YEAR(?x),'2009')) }",
+    'select ?ent where { ?ent wdt:P31 wd:Q11387 . ?ent wdt:P2120 ?obj } ORDER BY DESC(?obj)LIMIT 5 ',
+    "SELECT DISTINCT ?sbj ?sbj_label WHERE { ?sbj wdt:P31 wd:Q334166 . ?sbj rdfs:label ?sbj_label . "
+    "FILTER(CONTAINS(lcase(?sbj_label), 'vehicle')) . FILTER (lang(?sbj_label) = 'en') } LIMIT 25 ",
+    "ASK WHERE { wd:Q740 wdt:P2404 ?obj filter(?obj = 0.1) } ",
+    'SELECT (COUNT(?obj) AS ?value ) { wd:Q71231 wdt:P97 ?obj }',
+    "ASK WHERE { wd:Q16975 wdt:P937 wd:Q220 . wd:Q16975 wdt:P937 wd:Q1726 }",
+]
+
+
+def benchmark(name, parse, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            try:
+                parse(query)
+            except Exception:
+                pass
+    elapsed = (time.perf_counter() - start) / repeat
+    logging.info(f"{name}: {elapsed / len(queries) * 1e6:.1f} us/query, {len(queries) / elapsed:.0f} queries/s")
+    return elapsed
+
+
+def check(queries):
+    """Number of queries parsed by parse_subset, which are checked against rdflib."""
+    subset = 0
+    for query in queries:
+        try:
+            sparql = parse_subset(query)
+        except SparqlSubsetException:
+            continue
+        subset += 1
+        if str(sparql) != str(SPARQL.parse_rdflib(query)):
+            logging.error(f"Different results from rdflib: {query}")
+    return subset
+
+
+if __name__ == '__main__':
+    init_logging()
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lcquad', default=None, help="Checkout of the LC-QuAD 2.0 repository")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    if args.lcquad:
+        from wd_semantic_parsing.datasets.lcquad2 import LC_QUAD2
+        queries = [entry['sparql_wikidata'] for entry in LC_QUAD2(args.lcquad).load_entries()]
+        queries = [query for query in queries if query]
+    else:
+        queries = SAMPLE_QUERIES * 100
+    subset = check(queries)
+    logging.info(f"{len(queries)} queries, {subset / len(queries):.1%} parsed by parse_subset, the others by rdflib")
+    
+    rdflib = benchmark('SPARQL.parse_rdflib', SPARQL.parse_rdflib, queries, args.repeat)
+    fast = benchmark('SPARQL.parse', SPARQL.parse, queries, args.repeat)
+    logging.info(f"{rdflib / fast:.1f}x faster")
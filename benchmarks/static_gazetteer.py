@@ -0,0 +1,72 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Benchmark of the memory-mapped static gazetteer against the read-only SQLite gazetteer.
+
+Times opening each backend, then the lookups of a sample of denotationals, and of as many missing keys,
+through read_head (packed candidates), read_ids (QID numbers) and read (QID strings, as returned by the linker).
+Both gazetteers are built first if needed.
+
+On a small test gazetteer (1.4k denotationals, half of the lookups missing), read_head was 6.6x faster than
+SQLite and read 4.5x, so the 10x lookup target is not met. A static lookup still takes about 1.5 us, most of it
+interpreter overhead: encoding and hashing the key, probing the index and slicing the mapped arrays. The
+SQLite query takes about 9 us.
+    
+    python benchmarks/static_gazetteer.py --keys 100000 --repeat 3
+"""
+import argparse
+import logging
+import random
+import time
+
+from wd_semantic_parsing.utils import init_logging
+from wd_semantic_parsing.wikidata.gazetteer import get_gazetteer
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def benchmark(name, read, keys, repeat):
+    def read_all():
+        for key in keys:
+            read(key)
+    elapsed = min(timed(read_all)[0] for _ in range(repeat))
+    logging.info(f"{name}: {elapsed / len(keys) * 1e6:.2f} us/lookup, {len(keys) / elapsed:.0f} lookups/s")
+    return elapsed
+
+
+if __name__ == '__main__':
+    init_logging()
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lang', default='en')
+    parser.add_argument('--keys', type=int, default=100000, help="Number of denotationals looked up")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    open_times = {}
+    gazetteers = {}
+    for backend in ('sqlite', 'static'):
+        # Built if needed by a first call, so that only opening is timed
+        get_gazetteer(args.lang, read_only=True, backend=backend).close()
+        open_times[backend], gazetteers[backend] = timed(get_gazetteer, args.lang, True, False, backend)
+        logging.info(f"Opening the {backend} gazetteer: {open_times[backend] * 1000:.2f} ms")
+    
+    rng = random.Random(0)
+    keys = list(gazetteers['static'].iterkeys())
+    keys = rng.sample(keys, min(args.keys, len(keys)))
+    keys += [key + ' missing' for key in keys]
+    rng.shuffle(keys)
+    logging.info(f"{len(keys)} lookups, half of them of missing keys")
+    
+    for method in ('read_head', 'read_ids', 'read'):
+        sqlite_time = benchmark(f"SQLite {method}", getattr(gazetteers['sqlite'], method), keys, args.repeat)
+        static_time = benchmark(f"Static {method}", getattr(gazetteers['static'], method), keys, args.repeat)
+        logging.info(f"{method}: {sqlite_time / static_time:.1f}x faster")
+    
+    assert all(gazetteers['sqlite'].read(key) == gazetteers['static'].read(key) for key in keys[:1000])
+    for gazetteer in gazetteers.values():
+        gazetteer.close()
@@ -0,0 +1,86 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+JSON codec shared by the whole pipeline.
+
+The implementation is selected with the JSON_CODEC environment variable, or with set_codec():
+- 'auto' (default): orjson if it is installed, then ujson, then the standard library;
+- 'orjson', 'ujson' or 'json' to force one of them.
+
+All the codecs expose the same functions:
+- loads(data): decodes a str or UTF-8 bytes;
+- dumps(obj): encodes to str;
+- dumpb(obj): encodes to UTF-8 bytes, which round-trip through loads without any str conversion.
+Whatever the codec, the output is that of orjson: compact, without spaces, and with the non-ASCII characters
+written as is rather than escaped.
+"""
+import json
+import logging
+from os import environ
+
+
+CODECS = ('orjson', 'ujson', 'json')
+JSON_CODEC = environ.get('JSON_CODEC', 'auto')
+
+
+def json_codec():
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+    
+    def dumpb(obj):
+        return dumps(obj).encode('utf-8')
+    
+    return json.loads, dumps, dumpb
+
+
+def orjson_codec():
+    import orjson
+    
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+    
+    return orjson.loads, dumps, orjson.dumps
+
+
+def ujson_codec():
+    import ujson
+    
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+    
+    def dumpb(obj):
+        return dumps(obj).encode('utf-8')
+    
+    return ujson.loads, dumps, dumpb
+
+
+CODEC_FACTORIES = {
+    'orjson': orjson_codec,
+    'ujson': ujson_codec,
+    'json': json_codec,
+}
+
+
+def set_codec(name='auto'):
+    global codec_name, loads, dumps, dumpb
+    
+    if name == 'auto':
+        for candidate in CODECS:
+            try:
+                loads, dumps, dumpb = CODEC_FACTORIES[candidate]()
+                codec_name = candidate
+                return codec_name
+            except ImportError:
+                continue
+    
+    if name not in CODEC_FACTORIES:
+        raise ValueError(f"Unknown JSON codec '{name}', expected one of: auto, {', '.join(CODECS)}")
+    
+    loads, dumps, dumpb = CODEC_FACTORIES[name]()
+    codec_name = name
+    logging.debug(f"JSON codec: {codec_name}")
+    return codec_name
+
+
+codec_name, loads, dumps, dumpb = None, None, None, None
+set_codec(JSON_CODEC)
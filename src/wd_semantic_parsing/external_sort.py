@@ -0,0 +1,98 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+External merge sort for streams of records that do not fit in memory.
+
+Records are buffered until their estimated size reaches the memory budget, then sorted and spilled to a
+temporary file as a run. Iterating the sorter k-way merges the runs, reading them back one block at a time.
+Blocks hold 1/MERGE_FAN_IN of the records of a run, and runs are merged into one as soon as there are
+MERGE_FAN_IN of them, so merging stays within the budget and the number of open files is bounded.
+"""
+import heapq
+import pickle
+import sys
+import tempfile
+from itertools import islice
+
+
+DEFAULT_MEMORY_BUDGET = 1 << 30
+MERGE_FAN_IN = 64
+
+
+def record_size(record):
+    """Rough size in bytes of a record held in a list: the pointer, the object, and the fields of a tuple."""
+    size = 8 + sys.getsizeof(record)
+    if isinstance(record, tuple):
+        size += sum(sys.getsizeof(field) for field in record)
+    return size
+
+
+def read_run(run):
+    run.seek(0)
+    try:
+        while True:
+            yield from pickle.load(run)
+    except EOFError:
+        pass
+    finally:
+        run.close()
+
+
+class ExternalSorter:
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, key=None, tmp_dir=None):
+        self.memory_budget = memory_budget
+        self.key = key
+        self.tmp_dir = tmp_dir
+        self.buffer, self.buffer_size = [], 0
+        self.runs = []
+        self.block_size = None
+        self.count = 0
+    
+    def add(self, record):
+        self.buffer.append(record)
+        self.buffer_size += record_size(record)
+        self.count += 1
+        if self.buffer_size >= self.memory_budget:
+            self.spill()
+    
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+        return self
+    
+    def write_run(self, records):
+        run = tempfile.TemporaryFile(dir=self.tmp_dir)
+        records = iter(records)
+        while True:
+            block = list(islice(records, self.block_size))
+            if not block:
+                break
+            pickle.dump(block, run, protocol=pickle.HIGHEST_PROTOCOL)
+        return run
+    
+    def spill(self):
+        if self.block_size is None:
+            self.block_size = max(1, len(self.buffer) // MERGE_FAN_IN)
+        self.buffer.sort(key=self.key)
+        self.runs.append(self.write_run(self.buffer))
+        self.buffer, self.buffer_size = [], 0
+        
+        if len(self.runs) >= MERGE_FAN_IN:
+            runs, self.runs = self.runs, []
+            self.runs.append(self.write_run(heapq.merge(*map(read_run, runs), key=self.key)))
+    
+    def __iter__(self):
+        """Yields the records in sorted order, the sort is stable. A sorter can be iterated only once."""
+        if not self.runs:
+            # Popped from the end of the reversed buffer, so that the records are released as they are consumed
+            self.buffer.sort(key=self.key)
+            self.buffer.reverse()
+            buffer, self.buffer, self.buffer_size = self.buffer, [], 0
+            while buffer:
+                yield buffer.pop()
+            return
+        
+        if self.buffer:
+            self.spill()
+        runs, self.runs = self.runs, []
+        yield from heapq.merge(*map(read_run, runs), key=self.key)
@@ -1,17 +1,36 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
-from wd_semantic_parsing.sparql.data import Object
+from wd_semantic_parsing.sparql.data import Immutable, Object, add_interned
 
 
-class Predicate:
-    def __init__(self, obj, reverse=False, ns='wd', ptype='predicate'):
-        self.ns = ns
-        self.ptype = ptype
-        self.obj = obj
-        self.reverse = reverse
+class Predicate(Immutable):
+    """
+    Interned like Object, compared and hashed by (obj, reverse, ns, ptype). The obj of the operators
+    is the operator name.
+    """
+    __slots__ = ('ns', 'ptype', 'obj', 'reverse', '_hash')
+    interned = {}
+    parsed = {}
+    
+    def __new__(cls, obj, reverse=False, ns='wd', ptype='predicate'):
+        key = (obj, reverse, ns, ptype)
+        pred = cls.interned.get(key)
+        if pred is None:
+            pred = object.__new__(cls)
+            object.__setattr__(pred, 'ns', ns)
+            object.__setattr__(pred, 'ptype', ptype)
+            object.__setattr__(pred, 'obj', obj)
+            object.__setattr__(pred, 'reverse', reverse)
+            object.__setattr__(pred, '_hash', hash(key))
+            add_interned(cls.interned, key, pred)
+        return pred
     
     @staticmethod
     def parse(pred_str):
+        pred = Predicate.parsed.get(pred_str)
+        if pred is not None:
+            return pred
+        
         tokens = pred_str.split('.')
         if len(tokens) != 3:
             raise Exception('Malformed predicate string: "%s"' % pred_str)
@@ -24,7 +43,27 @@ class Predicate:
             reverse = False
         obj = Object.parse(pred_id)
         
-        return Predicate(obj, reverse, ns, ptype)
+        pred = Predicate(obj, reverse, ns, ptype)
+        add_interned(Predicate.parsed, pred_str, pred)
+        return pred
+    
+    def forward(self):
+        """The same predicate, not reversed."""
+        return Predicate(self.obj, False, self.ns, self.ptype) if self.reverse else self
+    
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self._hash == other._hash and self.obj == other.obj and self.reverse == other.reverse
+                and self.ns == other.ns and self.ptype == other.ptype)
+    
+    def __hash__(self):
+        return self._hash
+    
+    def __reduce__(self):
+        return Predicate, (self.obj, self.reverse, self.ns, self.ptype)
     
     def __str__(self):
         reverse = '*' if self.reverse else ''
@@ -32,6 +71,8 @@ class Predicate:
 
 
 class MRL:
+    __slots__ = ('predicate', 'args', 'conditions', 'temporal_condition')
+    
     def __init__(self, predicate=None):
         self.predicate = predicate
         self.args = []
@@ -1,5 +1,7 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import re
+
 from wd_semantic_parsing.mrl.data import MRL, Predicate, Object
 
 class MRL_ParsingException(Exception): pass
@@ -12,7 +14,8 @@ def debug_info(depth, msg):
 
 
 EXP_START, MRL_OBJ, MRL_STR, STRING_START, VAR_OR_PRED = 0, 1, 2, 3, 4
-def parse_mrl_obj(text, i=0, depth=0, gobble_operator=True):
+def parse_mrl_obj_recursive(text, i=0, depth=0, gobble_operator=True):
+    # Reference implementation of parse_mrl_obj, one character at a time and recursive.
     # The following state machine either:
     # - return a Object
     # - return a String
@@ -86,7 +89,7 @@ def parse_mrl_obj(text, i=0, depth=0, gobble_operator=True):
             break
         
         elif c in {'(', ','}:
-            arg, i = parse_mrl_obj(text, i+1, depth)
+            arg, i = parse_mrl_obj_recursive(text, i+1, depth)
             if arg:
                 mrl.args.append(arg)
                 debug_info(depth, 'ARG: %s (type: %s)    -> "%s"' % (arg, type(arg), text[i:]))
@@ -112,11 +115,11 @@ def parse_mrl_obj(text, i=0, depth=0, gobble_operator=True):
             break
         
         elif c == '&':
-            condition, i = parse_mrl_obj(text, i+1, depth, gobble_operator=False)
+            condition, i = parse_mrl_obj_recursive(text, i+1, depth, gobble_operator=False)
             mrl.conditions.append(condition)
         
         elif c == '^':
-            condition, i = parse_mrl_obj(text, i+1, depth, gobble_operator=False)
+            condition, i = parse_mrl_obj_recursive(text, i+1, depth, gobble_operator=False)
             if mrl.temporal_condition:
                 raise MRL_ParsingException("We can express only one temporal condition: %s" % text)
             mrl.temporal_condition = condition
@@ -127,6 +130,242 @@ def parse_mrl_obj(text, i=0, depth=0, gobble_operator=True):
     return mrl, i
 
 
+NON_SPACE = re.compile(r'\S')
+# Characters ending a variable or an object, or starting the arguments of a predicate
+VAR_OR_PRED_END = re.compile(r'[(),]')
+OBJ_DELIMITER = re.compile(r'[\[\]"]')
+OPERATOR_OR_END = re.compile(r'[,)&^]')
+# States of the MRL nodes on the stack of parse_mrl_obj, the last two wait for the condition being parsed
+ARGS, OPERATORS, CONDITION, TEMPORAL_CONDITION = 0, 1, 2, 3
+CANONICAL_DELIMITERS = {')', ',', '&', '^'}
+
+
+def parse_term(text, i):
+    """
+    Parses the string, object or variable starting at i, with the position following it, None when an
+    argument list ends at i, or a new MRL when a predicate starts at i, with the position of its parenthesis.
+    """
+    if i < len(text) and not text[i].isspace():
+        start = i
+    else:
+        match = NON_SPACE.search(text, i)
+        if match is None:
+            raise MRL_ParsingException("Unexpected end of the expression: %s" % text)
+        start = match.start()
+    c = text[start]
+    
+    if c == '[':
+        # Object up to the matching square bracket, skipping the strings
+        brackets, i = 1, start + 1
+        while True:
+            match = OBJ_DELIMITER.search(text, i)
+            if match is None:
+                raise MRL_ParsingException("Unexpected end of the expression: %s" % text)
+            i = match.end()
+            c = match.group()
+            if c == '"':
+                i = text.find('"', i) + 1
+                if not i:
+                    raise MRL_ParsingException("Unexpected end of the expression: %s" % text)
+            elif c == '[':
+                brackets += 1
+            else:
+                brackets -= 1
+                if not brackets:
+                    return Object.parse(text[start:i].strip()), i
+    
+    if c == '"':
+        end = text.find('"', start + 1) + 1
+        if not end:
+            raise MRL_ParsingException("Unexpected end of the expression: %s" % text)
+        return text[start:end], end
+    
+    if c == ')':
+        return None, start
+    
+    match = VAR_OR_PRED_END.search(text, start + 1)
+    if match is None:
+        # A variable up to the end of the text, of at least two characters as for parse_mrl_obj_recursive
+        if start + 1 == len(text):
+            raise MRL_ParsingException("Unexpected end of the expression: %s" % text)
+        return Object.parse(text[start:].strip()), len(text)
+    i = match.start()
+    if text[i] == '(':
+        return MRL(Predicate.parse(text[start:i])), i
+    return Object.parse(text[start:i].strip()), i
+
+
+def parse_canonical(text, i=0):
+    """
+    Parses the MRL starting at i as parse_mrl_obj, when the rest of the text is an MRL in canonical form: a
+    predicate whose arguments are MRLs, variables, objects or strings separated by commas, followed by conditions
+    that are MRLs, with spaces only between tokens. Returns None for any other text, which parse_mrl_obj parses.
+    
+    The tokens are split by str methods rather than searched one at a time. The MRL being parsed is kept in
+    local variables, and the MRLs it is nested in on an explicit stack of (mrl, gobble_operator, state).
+    """
+    if ' (' in text:
+        # A space between a predicate and its parenthesis belongs to the predicate
+        return None
+    # Split on spaces and delimiters: the predicates keep their opening parenthesis, the other delimiters are
+    # tokens of their own
+    tokens = (text[i:] if i else text).replace('(', '( ').replace(')', ' ) ').replace(',', ' , ').replace(
+        '&', ' & ').replace('^', ' ^ ').split()
+    n, k = len(tokens), 0
+    # The interned predicates and objects are looked up directly, parsed only the first time
+    predicates, objects = Predicate.parsed, Object.parsed
+    delimiters = CANONICAL_DELIMITERS
+    stack = []
+    mrl = gobble_operator = state = None
+    next_gobble_operator = True
+    while True:
+        if k == n:
+            return None
+        token = tokens[k]
+        k += 1
+        c = token[0]
+        if token[-1] == '(' and c != '"' and c != '[':
+            if token == '(':
+                return None
+            if mrl is not None:
+                stack.append((mrl, gobble_operator, state))
+            name = token[:-1]
+            mrl = MRL(predicates.get(name) or Predicate.parse(name))
+            gobble_operator, state = next_gobble_operator, ARGS
+            if k == n or tokens[k] != ')':
+                next_gobble_operator = True
+                continue
+            k += 1
+        else:
+            # Only the arguments can be variables, objects or strings, without spaces or delimiters
+            if state != ARGS or token in delimiters:
+                return None
+            if c == '"':
+                if token == '"' or token[-1] != '"' or token.count('"') != 2:
+                    return None
+                value = token
+            elif c == '[':
+                if token[-1] != ']' or token.count('[') != 1 or token.count(']') != 1 or '"' in token:
+                    return None
+                value = Object.parse(token)
+            else:
+                value = objects.get(token) or Object.parse(token)
+            mrl.args.append(value)
+            delimiter = tokens[k] if k < n else None
+            k += 1
+            if delimiter == ',':
+                next_gobble_operator = True
+                continue
+            if delimiter != ')':
+                return None
+        
+        # The arguments of the MRL are closed: it takes its operators, if any, then it is passed to the
+        # enclosing MRL, until one of them expects another term
+        while True:
+            if gobble_operator and k < n:
+                operator = tokens[k]
+                if operator == '&' or operator == '^':
+                    state = CONDITION if operator == '&' else TEMPORAL_CONDITION
+                    k += 1
+                    next_gobble_operator = False
+                    break
+            
+            if not stack:
+                return (mrl, len(text)) if k == n else None
+            value = mrl
+            mrl, gobble_operator, state = stack.pop()
+            if state == CONDITION:
+                mrl.conditions.append(value)
+            elif state == TEMPORAL_CONDITION:
+                if mrl.temporal_condition:
+                    return None
+                mrl.temporal_condition = value
+            else:
+                mrl.args.append(value)
+                delimiter = tokens[k] if k < n else None
+                k += 1
+                if delimiter == ',':
+                    next_gobble_operator = True
+                    break
+                if delimiter != ')':
+                    return None
+
+
+def parse_mrl_obj(text, i=0, gobble_operator=True):
+    """
+    Parses the MRL, object, variable or string starting at i, returns it with the position following it.
+    
+    Same grammar and results as parse_mrl_obj_recursive, but the delimiters are found with regular
+    expressions rather than one character at a time, and the MRL nodes being parsed are kept on an
+    explicit stack of [mrl, gobble_operator, state], so that the nesting depth is not bounded by the
+    recursion limit. Operators following a condition apply to the MRL the condition belongs to.
+    MRLs in canonical form are parsed by parse_canonical.
+    """
+    if gobble_operator:
+        parsed = parse_canonical(text, i)
+        if parsed is not None:
+            return parsed
+    
+    end = len(text)
+    stack = []
+    while True:
+        value, i = parse_term(text, i)
+        parsed = value.__class__ is not MRL
+        if not parsed:
+            stack.append([value, gobble_operator, ARGS])
+        
+        # Passes the parsed value to the enclosing MRLs, until one of them expects another term
+        while stack:
+            frame = stack[-1]
+            mrl, state = frame[0], frame[2]
+            if parsed:
+                if state == ARGS:
+                    if value:
+                        mrl.args.append(value)
+                    if value.__class__ is MRL and i < end and text[i] == ')':
+                        i += 1
+                        state = OPERATORS
+                elif state == CONDITION:
+                    mrl.conditions.append(value)
+                    state = OPERATORS
+                else:
+                    if mrl.temporal_condition:
+                        raise MRL_ParsingException("We can express only one temporal condition: %s" % text)
+                    mrl.temporal_condition = value
+                    state = OPERATORS
+            
+            if state == ARGS:
+                match = VAR_OR_PRED_END.search(text, i)
+                if match is None:
+                    i = end
+                    state = OPERATORS
+                else:
+                    i = match.end()
+                    if text[i - 1] == ')':
+                        state = OPERATORS
+                    else:
+                        frame[2] = ARGS
+                        gobble_operator = True
+                        break
+            
+            if frame[1]:
+                match = OPERATOR_OR_END.search(text, i)
+                if match is None:
+                    i = end
+                else:
+                    i = match.start()
+                    c = text[i]
+                    if c == '&' or c == '^':
+                        frame[2] = CONDITION if c == '&' else TEMPORAL_CONDITION
+                        i += 1
+                        gobble_operator = False
+                        break
+            value = stack.pop()[0]
+            parsed = True
+        else:
+            return value, i
+
+
 def parse_mrl_expr(text: str):
     obj, i = parse_mrl_obj(text)
     return obj, text[i:].strip()
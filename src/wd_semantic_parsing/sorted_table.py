@@ -0,0 +1,321 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Immutable tables of string keys, sorted in UTF-8 byte order and memory-mapped from disk.
+
+File layout:
+- header: magic (8 bytes), number of keys n (uint64);
+- key offsets: n+1 uint64, relative to the start of the key blob;
+- values: n fixed-width values (e.g. int64 counts);
+- key blob: the concatenated UTF-8 keys;
+- for array tables, the item blob: the concatenated arrays of values, 8-byte aligned;
+- optionally, the hash index, 8-byte aligned: a power of two of uint32 slots holding 1 + the index of
+  a key, 0 for an empty slot, placed by the CRC32 of the key with linear probing.
+
+Loading a table is O(1), lookups are binary searches over the key blob, or one or two probes of the
+hash index when there is one, and the pages are shared through the OS page cache by every process
+reading the same file.
+"""
+import heapq
+import mmap
+import os
+import shutil
+import struct
+from array import array
+from collections.abc import Mapping
+from operator import itemgetter
+from zlib import crc32
+
+
+HEADER = struct.Struct('=8sQ')
+OFFSET_TYPECODE = 'Q'
+SLOT_TYPECODE = 'I'
+ALIGNMENT = 8
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class SortedTable(Mapping):
+    MAGIC = None
+    VALUE_TYPECODE = None
+    
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, self.n = HEADER.unpack_from(self.mm)
+        if magic != self.MAGIC:
+            raise ValueError(f"{filepath} is not a {type(self).__name__} file")
+        
+        view = memoryview(self.mm)
+        start = HEADER.size
+        end = start + (self.n + 1) * array(OFFSET_TYPECODE).itemsize
+        self.offsets = view[start:end].cast(OFFSET_TYPECODE)
+        start, end = end, end + self.n * array(self.VALUE_TYPECODE).itemsize
+        self.values = view[start:end].cast(self.VALUE_TYPECODE)
+        self.keys_start = end
+        
+        hash_start = align(self.data_end())
+        if hash_start < len(self.mm):
+            self.slots = view[hash_start:].cast(SLOT_TYPECODE)
+            self.mask = len(self.slots) - 1
+        else:
+            self.slots = None
+    
+    @classmethod
+    def has_format(cls, filepath):
+        """Whether the file is a table of this class."""
+        with open(filepath, 'rb') as f:
+            header = f.read(HEADER.size)
+        return len(header) == HEADER.size and HEADER.unpack(header)[0] == cls.MAGIC
+    
+    def data_end(self):
+        """End of the data sections, where the hash index starts if any."""
+        return self.keys_start + self.offsets[self.n]
+    
+    def key_bytes(self, i):
+        return self.mm[self.keys_start + self.offsets[i]:self.keys_start + self.offsets[i + 1]]
+    
+    def key(self, i):
+        return self.key_bytes(i).decode('utf-8')
+    
+    def bisect(self, key_bytes):
+        """Index of the first key greater or equal to key_bytes."""
+        mm, offsets, base = self.mm, self.offsets, self.keys_start
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if mm[base + offsets[mid]:base + offsets[mid + 1]] < key_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def find(self, key):
+        """Index of the key, or -1 when it is missing."""
+        key_bytes = key.encode('utf-8')
+        if self.slots is not None:
+            mm, offsets, base, slots, mask = self.mm, self.offsets, self.keys_start, self.slots, self.mask
+            j = crc32(key_bytes) & mask
+            while True:
+                i = slots[j]
+                if not i:
+                    return -1
+                i -= 1
+                if mm[base + offsets[i]:base + offsets[i + 1]] == key_bytes:
+                    return i
+                j = (j + 1) & mask
+        
+        i = self.bisect(key_bytes)
+        if i < self.n and self.key_bytes(i) == key_bytes:
+            return i
+        return -1
+    
+    def __getitem__(self, key):
+        i = self.find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.values[i]
+    
+    def __contains__(self, key):
+        return self.find(key) >= 0
+    
+    def __len__(self):
+        return self.n
+    
+    def __iter__(self):
+        for i in range(self.n):
+            yield self.key(i)
+    
+    def items(self):
+        """(key, value) pairs in key order, read sequentially."""
+        for i in range(self.n):
+            yield self.key(i), self.values[i]
+    
+    def close(self):
+        self.offsets.release()
+        self.values.release()
+        if self.slots is not None:
+            self.slots.release()
+        self.mm.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *_):
+        self.close()
+
+
+class CountTable(SortedTable):
+    MAGIC = b'WDCOUNT1'
+    VALUE_TYPECODE = 'q'
+
+
+class ArrayTable(SortedTable):
+    """
+    Table of variable-length arrays of ITEM_TYPECODE values. The fixed-width values are the end offsets
+    of the arrays in the item blob, and lookups return memoryviews of the mapped arrays, without any copy.
+    """
+    MAGIC = b'WDARRAY1'
+    VALUE_TYPECODE = 'Q'
+    ITEM_TYPECODE = 'I'
+    
+    def __init__(self, filepath):
+        super().__init__(filepath)
+        start = align(self.keys_start + self.offsets[self.n])
+        end = start + self.n_items() * array(self.ITEM_TYPECODE).itemsize
+        self.items_view = memoryview(self.mm)[start:end].cast(self.ITEM_TYPECODE)
+    
+    def n_items(self):
+        return self.values[self.n - 1] if self.n else 0
+    
+    def data_end(self):
+        return align(self.keys_start + self.offsets[self.n]) + self.n_items() * array(self.ITEM_TYPECODE).itemsize
+    
+    def array(self, i):
+        return self.items_view[self.values[i - 1] if i else 0:self.values[i]]
+    
+    def __getitem__(self, key):
+        i = self.find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.array(i)
+    
+    def items(self):
+        for i in range(self.n):
+            yield self.key(i), self.array(i)
+    
+    def close(self):
+        self.items_view.release()
+        super().close()
+
+
+def write_padding(f):
+    offset = f.tell()
+    f.write(bytes(align(offset) - offset))
+
+
+def write_hash_index(f, hashes):
+    size = 1
+    while size < 2 * len(hashes):
+        size *= 2
+    mask = size - 1
+    
+    slots = array(SLOT_TYPECODE, [0]) * size
+    for i, h in enumerate(hashes, 1):
+        j = h & mask
+        while slots[j]:
+            j = (j + 1) & mask
+        slots[j] = i
+    slots.tofile(f)
+
+
+class SortedTableWriter:
+    """
+    Writes a table_class file from (key, value) items added strictly sorted by key, for example as
+    produced by sum_sorted_counts. For array tables, the values are iterables of items.
+    With hash_index, keys are looked up in a hash index rather than by binary search.
+    The file is moved in place on close.
+    """
+    def __init__(self, filepath, table_class, hash_index=False):
+        self.filepath = filepath
+        self.table_class = table_class
+        self.hash_index = hash_index
+        self.item_typecode = getattr(table_class, 'ITEM_TYPECODE', None)
+        self.offsets, self.values = array(OFFSET_TYPECODE, [0]), array(table_class.VALUE_TYPECODE)
+        self.hashes = array(SLOT_TYPECODE)
+        self.keys_path, self.items_path = filepath + '.keys.tmp', filepath + '.items.tmp'
+        self.keys_file, self.items_file = open(self.keys_path, 'wb'), open(self.items_path, 'wb')
+        self.size, self.n_items, self.previous = 0, 0, None
+    
+    def add(self, key, value):
+        key = key.encode('utf-8')
+        if self.previous is not None and key <= self.previous:
+            raise ValueError(f"Keys are not strictly sorted: {self.previous} >= {key}")
+        self.keys_file.write(key)
+        self.size += len(key)
+        self.offsets.append(self.size)
+        if self.item_typecode is not None:
+            value = array(self.item_typecode, value)
+            value.tofile(self.items_file)
+            self.n_items += len(value)
+            value = self.n_items
+        self.values.append(value)
+        if self.hash_index:
+            self.hashes.append(crc32(key))
+        self.previous = key
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def close(self):
+        self.keys_file.close()
+        self.items_file.close()
+        
+        tmp_path = self.filepath + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(self.table_class.MAGIC, len(self.values)))
+            self.offsets.tofile(f)
+            self.values.tofile(f)
+            with open(self.keys_path, 'rb') as keys_file:
+                shutil.copyfileobj(keys_file, f, 1 << 20)
+            if self.item_typecode is not None:
+                write_padding(f)
+                with open(self.items_path, 'rb') as items_file:
+                    shutil.copyfileobj(items_file, f, 1 << 20)
+            if self.hash_index:
+                write_padding(f)
+                write_hash_index(f, self.hashes)
+        os.remove(self.keys_path)
+        os.remove(self.items_path)
+        os.replace(tmp_path, self.filepath)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        else:
+            self.keys_file.close()
+            self.items_file.close()
+            os.remove(self.keys_path)
+            os.remove(self.items_path)
+
+
+def write_sorted_table(filepath, table_class, items, presorted=False, hash_index=False):
+    """
+    Writes the (key, value) items, or the items of a mapping, as a table_class file, see SortedTableWriter.
+    Unless presorted is set, the items are sorted by key in memory; otherwise they are streamed
+    and must come strictly sorted by key.
+    """
+    if isinstance(items, Mapping):
+        items = items.items()
+    if not presorted:
+        items = sorted(items, key=itemgetter(0))
+    
+    with SortedTableWriter(filepath, table_class, hash_index) as writer:
+        for key, value in items:
+            writer.add(key, value)
+
+
+def write_count_table(filepath, counts, presorted=False):
+    write_sorted_table(filepath, CountTable, counts, presorted)
+
+
+def sum_sorted_counts(*sorted_items):
+    """Merges streams of (key, count) pairs sorted by key, adding up the counts of equal keys."""
+    no_key = object()
+    current_key, total = no_key, 0
+    for key, count in heapq.merge(*sorted_items, key=itemgetter(0)):
+        if key != current_key:
+            if current_key is not no_key:
+                yield current_key, total
+            current_key, total = key, 0
+        total += count
+    
+    if current_key is not no_key:
+        yield current_key, total
@@ -5,25 +5,80 @@ See SPARQL 1.1 Query Language
 https://www.w3.org/TR/2013/REC-sparql11-query-20130321/
 """
 import logging
+import re
 
 from pyparsing import ParseException
 
+from rdflib.namespace import XSD
 from rdflib.plugins.sparql.parser import parseQuery
-from rdflib.term import Variable
+from rdflib.term import Literal, Variable
 
 
-class Object:
-    def __init__(self, name, prefix=None):
-        self.name = name
-        self.prefix = prefix
+# Bound of the intern tables of the immutable nodes, which are cleared when they are full
+INTERN_TABLE_SIZE = 1 << 20
+
+
+def add_interned(table, key, value):
+    if len(table) >= INTERN_TABLE_SIZE:
+        table.clear()
+    table[key] = value
+
+
+class Immutable:
+    """Nodes whose fields are set once in __new__, compared and hashed by value."""
+    __slots__ = ()
+    
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+    
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+class Object(Immutable):
+    """
+    Interned: creating or parsing an object equal to a recent one returns the same instance, and the
+    equality and hash are those of (name, prefix).
+    """
+    __slots__ = ('name', 'prefix', '_hash')
+    interned = {}
+    parsed = {}
+    
+    def __new__(cls, name, prefix=None):
+        key = (name, prefix)
+        obj = cls.interned.get(key)
+        if obj is None:
+            obj = object.__new__(cls)
+            object.__setattr__(obj, 'name', name)
+            object.__setattr__(obj, 'prefix', prefix)
+            object.__setattr__(obj, '_hash', hash(key))
+            add_interned(cls.interned, key, obj)
+        return obj
     
     @staticmethod
     def parse(obj_str):
-        if ':' in obj_str:
-            prefix, name = obj_str.split(':')
-        else:
-            prefix, name = None, obj_str
-        return Object(name, prefix)
+        obj = Object.parsed.get(obj_str)
+        if obj is None:
+            if ':' in obj_str:
+                prefix, name = obj_str.split(':')
+            else:
+                prefix, name = None, obj_str
+            obj = Object(name, prefix)
+            add_interned(Object.parsed, obj_str, obj)
+        return obj
+    
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._hash == other._hash and self.name == other.name and self.prefix == other.prefix
+    
+    def __hash__(self):
+        return self._hash
+    
+    def __reduce__(self):
+        return Object, (self.name, self.prefix)
     
     def __str__(self):
         if self.prefix:
@@ -232,6 +287,13 @@ class SPARQL:
     
     @staticmethod
     def parse(sparql_str):
+        try:
+            return parse_subset(sparql_str)
+        except SparqlSubsetException:
+            return SPARQL.parse_rdflib(sparql_str)
+    
+    @staticmethod
+    def parse_rdflib(sparql_str):
         results = parseQuery(sparql_str)
         assert len(results) == 2
         assert not results[0]
@@ -271,3 +333,217 @@ class SPARQL:
             sparql.order_by = OrderBy(get_expr(order_by['expr']), order_by['order'])
         
         return sparql
+
+
+class SparqlSubsetException(Exception): pass
+
+
+# Tokens of the queries parsed by parse_subset, the other queries are parsed by rdflib
+TOKEN = re.compile(r"""
+    (?P<space>[ \t\r\n]+)
+    | (?P<var>\?[A-Za-z0-9_]+)
+    | (?P<pname>[A-Za-z](?:[A-Za-z0-9_.-]*[A-Za-z0-9_-])?:[A-Za-z0-9_](?:[A-Za-z0-9_.-]*[A-Za-z0-9_-])?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<double>(?:[0-9]+\.[0-9]*|\.[0-9]+|[0-9]+)[eE][+-]?[0-9]+)
+    | (?P<decimal>[0-9]*\.[0-9]+)
+    | (?P<integer>[0-9]+)
+    | (?P<string>'[^'\\\n\r]*'(?!')|"[^"\\\n\r]*"(?!"))
+    | (?P<iri><[^<>"{}|^`\\\x00-\x20]*>)
+    | (?P<punct>!=|<=|>=|[{}().,=<>])
+""", re.X)
+NUMBER_TYPES = {'integer': XSD.integer, 'decimal': XSD.decimal, 'double': XSD.double}
+RELATIONAL_OPERATORS = {'=', '!=', '<', '>', '<=', '>='}
+UNARY_BUILTINS = {'YEAR': YearExpr, 'LANG': LangExpr, 'LCASE': LCaseExpr}
+BINARY_BUILTINS = {'CONTAINS': ContainsExpr, 'STRSTARTS': StrStartsExpr}
+AGGREGATES = {'COUNT', 'SUM'}
+END = ('end', None)
+
+
+def tokenize(sparql_str):
+    """
+    (kind, value) tokens, the words being upper-cased as keywords are case-insensitive, ending with END.
+    The characters outside of the tokens of the subset, such as comments or IRIs, are not supported, nor
+    a question mark right after a prefixed name, which rdflib reads as a property path modifier.
+    """
+    tokens, i = [], 0
+    while i < len(sparql_str):
+        match = TOKEN.match(sparql_str, i)
+        if match is None or match.lastgroup == 'iri':
+            raise SparqlSubsetException(f"Unsupported token at {i}: {sparql_str}")
+        kind, i = match.lastgroup, match.end()
+        if kind == 'pname' and sparql_str.startswith('?', i):
+            raise SparqlSubsetException(f"Unsupported property path at {i}: {sparql_str}")
+        if kind == 'word':
+            tokens.append((kind, match.group().upper()))
+        elif kind != 'space':
+            tokens.append((kind, match.group()))
+    tokens.append(END)
+    return tokens
+
+
+def expect(tokens, i, value):
+    if tokens[i][1] != value:
+        raise SparqlSubsetException(f"Expected {value} instead of {tokens[i][1]}")
+    return i + 1
+
+
+def expect_var(tokens, i):
+    kind, value = tokens[i]
+    if kind != 'var':
+        raise SparqlSubsetException(f"Expected a variable instead of {value}")
+    return Variable(value[1:]), i + 1
+
+
+def parse_node(tokens, i):
+    """Variable or prefixed name of a triple."""
+    kind, value = tokens[i]
+    if kind == 'pname':
+        prefix, name = value.split(':')
+        return Object(name, prefix), i + 1
+    return expect_var(tokens, i)
+
+
+def parse_primary(tokens, i):
+    kind, value = tokens[i]
+    if kind == 'var':
+        return Variable(value[1:]), i + 1
+    if kind == 'string':
+        return LiteralExpr(value[1:-1]), i + 1
+    if kind in NUMBER_TYPES:
+        return Literal(value, datatype=NUMBER_TYPES[kind]), i + 1
+    if value == '(':
+        expr, i = parse_subset_expression(tokens, i + 1)
+        return expr, expect(tokens, i, ')')
+    if value in UNARY_BUILTINS:
+        arg, i = parse_subset_expression(tokens, expect(tokens, i + 1, '('))
+        return UNARY_BUILTINS[value](arg), expect(tokens, i, ')')
+    if value in BINARY_BUILTINS:
+        arg1, i = parse_subset_expression(tokens, expect(tokens, i + 1, '('))
+        arg2, i = parse_subset_expression(tokens, expect(tokens, i, ','))
+        return BINARY_BUILTINS[value](arg1, arg2), expect(tokens, i, ')')
+    raise SparqlSubsetException(f"Unsupported expression: {value}")
+
+
+def parse_subset_expression(tokens, i):
+    """Same expressions as parse_expression, parsed from the tokens."""
+    expr, i = parse_primary(tokens, i)
+    op = tokens[i][1]
+    if op in RELATIONAL_OPERATORS:
+        other, i = parse_primary(tokens, i + 1)
+        return RelationalExpr(expr, op, other), i
+    return expr, i
+
+
+def parse_projection(tokens, i, sparql):
+    start = i
+    while True:
+        kind, value = tokens[i]
+        if kind == 'var':
+            sparql.variables.append(value[1:])
+            i += 1
+        elif value == '(':
+            aggregate = tokens[i + 1][1]
+            if aggregate not in AGGREGATES:
+                raise SparqlSubsetException(f"Unsupported SELECT expression: {aggregate}")
+            var, i = expect_var(tokens, expect(tokens, i + 2, '('))
+            i = expect(tokens, expect(tokens, i, ')'), 'AS')
+            _, i = expect_var(tokens, i)
+            i = expect(tokens, i, ')')
+            if aggregate == 'COUNT':
+                sparql.count = str(var)
+            else:
+                sparql.sum = str(var)
+        elif i == start:
+            raise SparqlSubsetException(f"Expected a projection instead of {value}")
+        else:
+            return i
+
+
+def parse_group(tokens, i, sparql):
+    """Triples and filters of the group pattern, each triple ending with a dot unless a filter or the group follows."""
+    i = expect(tokens, i, '{')
+    parts = 0
+    while True:
+        value = tokens[i][1]
+        if value == '}':
+            break
+        parts += 1
+        if value == 'FILTER':
+            i += 1
+            if tokens[i][1] == '(':
+                expr, i = parse_subset_expression(tokens, i + 1)
+                i = expect(tokens, i, ')')
+            elif tokens[i][1] in UNARY_BUILTINS or tokens[i][1] in BINARY_BUILTINS:
+                expr, i = parse_primary(tokens, i)
+            else:
+                raise SparqlSubsetException(f"Unsupported filter: {tokens[i][1]}")
+            sparql.filters.append(expr)
+            if tokens[i][1] == '.':
+                i += 1
+        else:
+            sbj, i = parse_node(tokens, i)
+            pred, i = parse_node(tokens, i)
+            obj, i = parse_node(tokens, i)
+            sparql.triples.append((sbj, pred, obj))
+            if tokens[i][1] == '.':
+                i += 1
+            elif tokens[i][1] not in {'}', 'FILTER'}:
+                raise SparqlSubsetException(f"Expected the end of a triple instead of {tokens[i][1]}")
+    
+    if not parts:
+        raise SparqlSubsetException("Empty group pattern")
+    return i + 1
+
+
+def parse_order_by(tokens, i, sparql):
+    i = expect(tokens, expect(tokens, i, 'ORDER'), 'BY')
+    while tokens[i][1] in {'ASC', 'DESC'}:
+        order = tokens[i][1]
+        expr, i = parse_subset_expression(tokens, expect(tokens, i + 1, '('))
+        i = expect(tokens, i, ')')
+        if sparql.order_by is None:
+            if not isinstance(expr, Variable):
+                raise SparqlSubsetException(f"Unsupported ORDER BY expression: {expr}")
+            sparql.order_by = OrderBy(expr, order)
+    
+    if sparql.order_by is None:
+        raise SparqlSubsetException(f"Unsupported ORDER BY condition: {tokens[i][1]}")
+    return i
+
+
+def parse_subset(sparql_str):
+    """
+    Parses the SELECT and ASK queries of triples and filters supported by SPARQL, with the same results as
+    SPARQL.parse_rdflib, directly from a list of tokens. Raises SparqlSubsetException on anything else,
+    including the queries that SPARQL.parse_rdflib rejects, so that they are parsed, and fail, with rdflib.
+    """
+    tokens = tokenize(sparql_str)
+    form = tokens[0][1]
+    if form not in {SPARQL_SELECT, SPARQL_ASK}:
+        raise SparqlSubsetException(f"Unsupported query form: {form}")
+    sparql = SPARQL(form)
+    i = 1
+    
+    if form == SPARQL_SELECT:
+        if tokens[i][1] == 'DISTINCT':
+            sparql.distinct = True
+            i += 1
+        i = parse_projection(tokens, i, sparql)
+    
+    if tokens[i][1] == 'WHERE':
+        i += 1
+    i = parse_group(tokens, i, sparql)
+    
+    if tokens[i][1] == 'ORDER':
+        i = parse_order_by(tokens, i, sparql)
+    
+    if tokens[i][1] == 'LIMIT':
+        kind, value = tokens[i + 1]
+        if kind != 'integer':
+            raise SparqlSubsetException(f"Expected an integer instead of {value}")
+        sparql.limit = int(value)
+        i += 2
+    
+    if tokens[i] != END:
+        raise SparqlSubsetException(f"Unsupported clause: {tokens[i][1]}")
+    return sparql
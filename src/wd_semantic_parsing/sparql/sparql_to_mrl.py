@@ -54,7 +54,7 @@ def compile_year_filter(f, triples, ns='wd'):
     year = operator_mrl('year', [f.arg2.s], ns=ns)
     
     year_node = triples.get_var_name(f.arg1.var)
-    year_node.predicate.reverse = False
+    year_node.predicate = year_node.predicate.forward()
     temporal_condition = MRL(year_node.predicate)
     temporal_condition.args.append(year)
     
@@ -76,7 +76,7 @@ def compile_contains_filter(f, triples, ns='wd'):
     
     value_node = triples.get_var_name(var)
     fact_node = value_node.args[0]
-    value_node.predicate.reverse = False
+    value_node.predicate = value_node.predicate.forward()
     fact_node.conditions.append(contains_value_mrl(value_node.predicate, f.arg2, ns))
     return True
 
@@ -217,7 +217,7 @@ def sparql_to_mrl(sparql_str, ns='wd'):
     
     if query.order_by:
         order_by = triples.get_var_name(query.order_by.var)
-        order_by.predicate.reverse = False
+        order_by.predicate = order_by.predicate.forward()
         ans = order_by_mrl(ans, query.order_by.order, order_by.predicate, query.limit)
     
     return ans
@@ -2,15 +2,22 @@
 # SPDX-License-Identifier: MIT-0
 import os
 import io
+import sys
+import shlex
 from os import path
-import json
 import sqlite3
-from datetime import timedelta, date
+import threading
+import time
+from datetime import datetime, timedelta, date
 from typing import Iterable
 import logging
-from collections import Counter
+from collections import Counter, OrderedDict, deque
+from itertools import islice
 from pathlib import Path
 import subprocess
+from array import array
+
+from wd_semantic_parsing import codec
 
 
 def init_logging(debug=False):
@@ -58,24 +65,113 @@ def dump_counter(filename, counter, minimum_count=None):
     return counter
 
 
+def dump_count_items(filename, items):
+    with io.open(filename, encoding="utf-8", mode='w') as f:
+        for string, count in items:
+            f.write("%s\t%d\n" % (string, count))
+
+
+COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+}
+
+
+class ProcessOutput(io.RawIOBase):
+    """
+    Standard output of a command, which raises CalledProcessError at the end of the output, or on close,
+    when the command failed, so that a failed decompression is not read as a truncated input.
+    """
+    def __init__(self, cmd, stdin=None):
+        self.cmd = cmd
+        self.process = subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE, bufsize=0)
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, b):
+        n = self.process.stdout.readinto(b)
+        if not n:
+            self.check(self.process.wait())
+        return n
+    
+    def check(self, returncode):
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.cmd)
+    
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        self.process.stdout.close()
+        returncode = self.process.wait()
+        # A negative code is a signal, such as SIGPIPE when the output is closed before its end
+        if returncode > 0:
+            self.check(returncode)
+
+
+def open_input(filepath, compression='infer', decompressor=None, encoding=None):
+    """
+    Opens a possibly compressed file for reading, '-' reads from the standard input.
+    - compression: 'infer' from the file extension, 'gzip', 'bz2', 'zstd' or None for plain files.
+    - decompressor: external command (e.g. 'pigz -dc') reading the file, or the standard input, and writing
+                    the decompressed data to its standard output, so that decompression runs on other cores.
+                    Reading raises CalledProcessError when the command fails.
+    Returns a binary stream, or a text stream when an encoding is given.
+    """
+    if decompressor:
+        cmd = shlex.split(decompressor) + ([] if filepath == '-' else [filepath])
+        logging.info(' '.join(cmd))
+        f = io.BufferedReader(ProcessOutput(cmd, sys.stdin if filepath == '-' else None))
+    else:
+        if compression == 'infer':
+            compression = COMPRESSION_EXTENSIONS.get(path.splitext(filepath)[1])
+        
+        # The wrappers opened from a path close their file, those reading the standard input leave it open
+        source = sys.stdin.buffer if filepath == '-' else filepath
+        if compression is None:
+            f = sys.stdin.buffer if filepath == '-' else io.open(filepath, mode='rb')
+        elif compression == 'gzip':
+            import gzip
+            f = gzip.open(source, 'rb')
+        elif compression == 'bz2':
+            import bz2
+            f = bz2.open(source, 'rb')
+        elif compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("Reading zstd files requires the zstandard module: pip install zstandard")
+            raw = sys.stdin.buffer if filepath == '-' else io.open(filepath, mode='rb')
+            f = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True,
+                                                                              closefd=filepath != '-'))
+        else:
+            raise ValueError(f"Unsupported compression: {compression}")
+    
+    if encoding:
+        return io.TextIOWrapper(f, encoding=encoding)
+    return f
+
+
 def get_json_lines(filepath,
                    throw_errors=True,
                    gzipped=False,
-                   encoding="utf-8"):
-    if gzipped:
-        import gzip
-        f = gzip.open(filepath, mode='rt', encoding=encoding)
-    else:
-        f = io.open(filepath, mode='r', encoding=encoding)
+                   encoding="utf-8",
+                   compression='infer',
+                   decompressor=None):
+    f = open_input(filepath, 'gzip' if gzipped else compression, decompressor, encoding)
     
     line_no = 0
     while True:
+        # Read errors, such as a failed decompressor, are raised even without throw_errors
+        line_no += 1
+        line = f.readline()
+        if line == '':
+            break
         try:
-            line_no += 1
-            line = f.readline()
-            if line == '':
-                break
-            yield json.loads(line)
+            yield codec.loads(line)
         except Exception as e:
             logging.error("Error loading line %d in: %s" % (line_no, filepath))
             if throw_errors:
@@ -87,14 +183,20 @@ class JsonEntries:
                  filepath: str,
                  append: bool = False):
         self.filepath = filepath
-        self.file = open(filepath, 'a' if append else 'w')
+        self.file = open(filepath, 'a' if append else 'w', encoding='utf-8')
         self.count = 0
     
     def save_entry(self, entry):
-        self.file.write(json.dumps(entry) + '\n')
+        self.file.write(codec.dumps(entry) + '\n')
         self.count += 1
         return self
     
+    def save_encoded_entries(self, encoded_entries):
+        for encoded in encoded_entries:
+            self.file.write(encoded + '\n')
+            self.count += 1
+        return self
+    
     def save_entries(self, entries):
         for entry in entries:
             try:
@@ -103,6 +205,10 @@ class JsonEntries:
                 logging.warn("Fail to save entry due to %s." % e)
         return self
     
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    
     def close(self):
         self.file.close()
     
@@ -111,57 +217,412 @@ class JsonEntries:
 
 
 
+BULK_BATCH_SIZE = 10000
+BULK_LOAD_CACHE_KB = 1 << 20
+# Below SQLite's default limit on the number of query parameters
+READ_MANY_CHUNK_SIZE = 900
+# Seconds between two checks of the file of a cached store
+CACHE_CHECK_INTERVAL = 1.0
+# Capped by SQLite to its compile-time maximum
+READ_ONLY_MMAP_SIZE = 1 << 40
+
+
 class JsonSQLite:
-    def __init__(self, filepath, auto_commit=False):
+    """
+    Key-value store of JSON values in a SQLite table.
+    
+    With read_only, the file is opened as an immutable read-only database with memory-mapped I/O, and
+    every thread reading from the store gets its own connection, so one store can be shared by the
+    threads of a server. The file must not be modified while it is open, only replaced.
+    
+    With bulk_load, the store is meant to be populated through write_many: journaling and syncing are
+    turned off, so an interrupted load leaves a corrupt file that has to be rebuilt, and a new table
+    is created without any index, the unique key index being built once when the store is closed.
+    """
+    # Stored in the user_version of new files, subclasses storing other value formats set their own
+    FORMAT_VERSION = 0
+    
+    def __init__(self, filepath, auto_commit=False, bulk_load=False, read_only=False):
+        self.filepath = filepath
+        self.read_only = read_only
+        self.auto_commit = auto_commit
+        self.indexed = True
+        
+        if read_only:
+            self.local = threading.local()
+            self.lock = threading.Lock()
+            self.connections = []
+            self.db = self.connect_read_only()
+            self.cursor = self.local.cursor
+            self.__opened = True
+            return
+        
         new_db = not path.exists(filepath)
         
         self.db = sqlite3.connect(filepath)
         self.cursor = self.db.cursor()
-        self.auto_commit = auto_commit
+        
+        if bulk_load:
+            self.cursor.execute('PRAGMA journal_mode=OFF')
+            self.cursor.execute('PRAGMA synchronous=OFF')
+            self.cursor.execute('PRAGMA locking_mode=EXCLUSIVE')
+            self.cursor.execute('PRAGMA cache_size=%d' % -BULK_LOAD_CACHE_KB)
         
         if new_db:
-            self.cursor.execute('CREATE TABLE data (key TEXT PRIMARY KEY, value TEXT)')
+            if bulk_load:
+                self.cursor.execute('CREATE TABLE data (key TEXT, value TEXT)')
+                self.indexed = False
+            else:
+                self.cursor.execute('CREATE TABLE data (key TEXT PRIMARY KEY, value TEXT)')
+            self.cursor.execute('PRAGMA user_version=%d' % self.FORMAT_VERSION)
             self.db.commit()
         
         self.__opened = True
     
+    @classmethod
+    def has_format(cls, filepath):
+        """Whether the file stores values in the format of this class."""
+        db = sqlite3.connect(Path(filepath).resolve().as_uri() + '?mode=ro', uri=True)
+        try:
+            return db.execute('PRAGMA user_version').fetchone()[0] == cls.FORMAT_VERSION
+        finally:
+            db.close()
+    
+    def connect_read_only(self):
+        """Opens a read-only connection for the calling thread and adds it to the pool."""
+        if not path.exists(self.filepath):
+            raise FileNotFoundError(self.filepath)
+        
+        # immutable: the file is never modified in place, rebuilds replace it with a new file
+        uri = Path(self.filepath).resolve().as_uri() + '?mode=ro&immutable=1'
+        db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        db.execute('PRAGMA mmap_size=%d' % READ_ONLY_MMAP_SIZE)
+        self.local.cursor = db.cursor()
+        with self.lock:
+            self.connections.append(db)
+        return db
+    
+    def get_cursor(self):
+        """The shared cursor, or in read-only mode the cursor of the calling thread."""
+        if not self.read_only:
+            return self.cursor
+        
+        cursor = getattr(self.local, 'cursor', None)
+        if cursor is None:
+            self.connect_read_only()
+            cursor = self.local.cursor
+        return cursor
+    
+    def reopen(self):
+        """Reopens the file after it was replaced, e.g. by a rebuild. Reads in progress end on the old file."""
+        if self.read_only:
+            # Old connections stay in the pool until the store is closed
+            self.local = threading.local()
+            self.db = self.connect_read_only()
+            self.cursor = self.local.cursor
+        else:
+            self.db.commit()
+            self.db.close()
+            self.db = sqlite3.connect(self.filepath)
+            self.cursor = self.db.cursor()
+    
     def close(self):
         if self.__opened:
             self.__opened = False
+            if self.read_only:
+                with self.lock:
+                    connections, self.connections = self.connections, []
+                for db in connections:
+                    db.close()
+                return
+            
+            self.create_index()
             self.db.commit()
             self.db.close()
     
+    def create_index(self):
+        if self.indexed:
+            return
+        
+        logging.info("Creating key index")
+        # Without a journal a failed statement cannot be rolled back, the rows are committed before
+        self.db.commit()
+        try:
+            self.cursor.execute('CREATE UNIQUE INDEX data_key ON data (key)')
+        except sqlite3.IntegrityError:
+            # As with REPLACE, the last value written for a duplicated key wins
+            self.cursor.execute('DELETE FROM data WHERE rowid NOT IN (SELECT MAX(rowid) FROM data GROUP BY key)')
+            self.cursor.execute('CREATE UNIQUE INDEX data_key ON data (key)')
+        self.db.commit()
+        self.indexed = True
+    
+    def encode(self, value):
+        """Encodes a value to store, subclasses can override it together with decode for other formats."""
+        return codec.dumpb(value)
+    
+    def decode(self, data):
+        return codec.loads(data)
+    
     def write(self, key, value):
-        self.cursor.execute("REPLACE INTO data VALUES (?, ?)", (key, json.dumps(value)))
+        self.cursor.execute("REPLACE INTO data VALUES (?, ?)", (key, self.encode(value)))
         if self.auto_commit:
             self.commit()
     
+    def write_many(self, items, batch_size=BULK_BATCH_SIZE):
+        items, encode = iter(items), self.encode
+        while True:
+            batch = [(key, encode(value)) for key, value in islice(items, batch_size)]
+            if not batch:
+                break
+            self.write_encoded(batch)
+        self.commit()
+    
+    def write_encoded(self, rows):
+        """Writes (key, data) rows whose values were already encoded by encode, without committing."""
+        self.cursor.executemany("REPLACE INTO data VALUES (?, ?)", rows)
+    
     def commit(self):
         self.db.commit()
     
     def read(self, key):
-        self.cursor.execute('SELECT value FROM data WHERE key=?', (key, ))
-        row = self.cursor.fetchone()
+        cursor = self.get_cursor()
+        cursor.execute('SELECT value FROM data WHERE key=?', (key, ))
+        row = cursor.fetchone()
         if row is None: return None
-        return json.loads(row[0])
+        return self.decode(row[0])
+    
+    def read_many(self, keys):
+        """Reads a set of keys in as few queries as possible, returns a dict of the keys found."""
+        keys = list(dict.fromkeys(keys))
+        cursor = self.get_cursor()
+        values = {}
+        for start in range(0, len(keys), READ_MANY_CHUNK_SIZE):
+            chunk = keys[start:start + READ_MANY_CHUNK_SIZE]
+            query = 'SELECT key, value FROM data WHERE key IN (%s)' % ','.join('?' * len(chunk))
+            for key, value in cursor.execute(query, chunk):
+                values[key] = self.decode(value)
+        return values
+    
+    def iterkeys(self):
+        # On a cursor of its own, so that reads during the iteration do not reset it
+        for key, in self.get_cursor().connection.execute('SELECT key FROM data'):
+            yield key
     
     def iteritems(self):
-        for key, value in self.cursor.execute('SELECT key, value FROM data'):
-            yield (key, json.loads(value))
+        for key, value in self.get_cursor().connection.execute('SELECT key, value FROM data'):
+            yield (key, self.decode(value))
     
     def __enter__(self):
         return self
     
     def __del__(self):
-        self.db.close()
+        if self.read_only:
+            self.close()
+        else:
+            self.db.close()
     
     def __len__(self):
-        return self.cursor.execute("SELECT COUNT(*) FROM data").fetchone()[0]
+        return self.get_cursor().execute("SELECT COUNT(*) FROM data").fetchone()[0]
     
     def __exit__(self , *_ ):
         self.close()
 
 
+def object_size(obj):
+    """Rough size in bytes of a decoded JSON value, including its nested containers and strings."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(object_size(key) + object_size(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(object_size(item) for item in obj)
+    return size
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache, bounded in number of entries and/or in bytes as estimated
+    by sizeof. Hits, misses and evictions are counted, see stats().
+    """
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=object_size):
+        if max_entries is None and max_bytes is None:
+            raise ValueError("An LRU cache needs max_entries or max_bytes")
+        
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits, self.misses, self.evictions = 0, 0, 0
+    
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            
+            while self.entries and ((self.max_entries is not None and len(self.entries) > self.max_entries)
+                                    or (self.max_bytes is not None and self.size > self.max_bytes)):
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+    
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.size,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+    
+    def __len__(self):
+        return len(self.entries)
+
+
+def file_signature(filepath):
+    stat = os.stat(filepath)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class CachedStore:
+    """
+    LRU cache in front of the reads of a JsonSQLite store, missing keys included.
+    The file of the store is checked at most every check_interval seconds: once it was rebuilt,
+    the store is reopened, the cache is cleared and the generation is incremented.
+    The store can be shared by threads: only one of them checks the file and reopens the store at a time.
+    """
+    MISSING = object()
+    
+    def __init__(self, store, cache, check_interval=CACHE_CHECK_INTERVAL):
+        self.store = store
+        self.cache = cache
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.signature = file_signature(store.filepath)
+        self.next_check = time.monotonic() + check_interval
+    
+    def check(self):
+        """Invalidates the cache if the file was rebuilt, returns whether it was."""
+        if time.monotonic() < self.next_check:
+            return False
+        
+        with self.lock:
+            # Another thread may have checked the file while this one was waiting
+            now = time.monotonic()
+            if now < self.next_check:
+                return False
+            self.next_check = now + self.check_interval
+            
+            signature = file_signature(self.store.filepath)
+            if signature == self.signature:
+                return False
+            
+            logging.info(f"{self.store.filepath} was rebuilt, reopening it")
+            self.signature = signature
+            self.store.reopen()
+            self.cache.clear()
+            self.generation += 1
+            return True
+    
+    def put(self, generation, key, value):
+        """Caches a value read in the generation, unless the store was reopened since it was read."""
+        with self.lock:
+            if generation == self.generation:
+                self.cache.put(key, value)
+    
+    def read(self, key):
+        self.check()
+        generation = self.generation
+        value = self.cache.get(key, self.MISSING)
+        if value is self.MISSING:
+            value = self.store.read(key)
+            self.put(generation, key, value)
+        return value
+    
+    def read_many(self, keys):
+        self.check()
+        generation = self.generation
+        values, missing = {}, []
+        for key in dict.fromkeys(keys):
+            value = self.cache.get(key, self.MISSING)
+            if value is self.MISSING:
+                missing.append(key)
+            elif value is not None:
+                values[key] = value
+        
+        if missing:
+            found = self.store.read_many(missing)
+            for key in missing:
+                value = found.get(key)
+                self.put(generation, key, value)
+                if value is not None:
+                    values[key] = value
+        return values
+    
+    def read_head(self, key, k=None):
+        """Packed candidates of a gazetteer key, see Gazetteer.read_head, cached by key and k."""
+        self.check()
+        generation = self.generation
+        cache_key = ('read_head', key, k)
+        value = self.cache.get(cache_key, self.MISSING)
+        if value is self.MISSING:
+            items = self.store.read_head(key, k)
+            # Copied, so that the cache does not hold views of the store rows or of its memory-mapped file
+            value = None if items is None else array(items.format, items)
+            self.put(generation, cache_key, value)
+        return value
+    
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def parallel_map(func, iterable, workers=1, max_pending=None, ordered=True):
+    """
+    Equivalent of map(func, iterable) running on a pool of worker processes.
+    Results are yielded in the input order, or as soon as they are ready when ordered is False.
+    At most max_pending items (default: two per worker) are submitted ahead of the consumer,
+    so a fast producer cannot pile up the whole input in memory.
+    """
+    if workers <= 1:
+        yield from map(func, iterable)
+        return
+    
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        
+        def results(max_left):
+            while len(pending) > max_left:
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                        yield future.result()
+        
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            yield from results(max_pending - 1)
+        yield from results(0)
+
+
 def interactive(cli_handler, prompt='\n> ', history_name=None, exit_msg=('quit', 'exit')):
     if history_name:
         set_cli_history(history_name)
@@ -201,6 +662,10 @@ def format_date(date):
     return date.strftime("%Y%m%d")
 
 
+def parse_date(date_str):
+    return datetime.strptime(date_str, "%Y%m%d")
+
+
 def wget(src, trg):
     logging.info(f"Downloading: {src}")
     cmd = ['wget', '--no-check-certificate', '--continue', '-O', trg, src]
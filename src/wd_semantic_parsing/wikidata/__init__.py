@@ -12,6 +12,7 @@ WIKIDATA_DUMP_PATH = path.join(WIKIDATA_DIR, 'latest-all.json.gz')
 WIKIDATA_ENTITIES = path.join(WIKIDATA_DIR, 'entities.jsonl')
 WIKIDATA_PAGEVIEWS_DIR = path.join(WIKIDATA_DIR, 'pageviews')
 WIKIDATA_PAGEVIEWS = path.join(WIKIDATA_DIR, 'pageviews.counts')
+WIKIDATA_PAGEVIEWS_WINDOW = path.join(WIKIDATA_DIR, 'pageviews.window')
 WIKIDATA_ENTITIES_WITH_PAGEVIEWS = path.join(WIKIDATA_DIR, 'entities_pageviews.jsonl')
 
 WIKIMEDIA_DISAMBIGUATION_PAGE = 'Q4167410'
@@ -1,13 +1,22 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import argparse
-import io
-import gzip
+import os
+from os import path
 import json
 import logging
+import warnings
+from collections import Counter
+from functools import partial
 
+from wd_semantic_parsing import codec
 from wd_semantic_parsing.wikidata import WIKIDATA_DIR, WIKIDATA_DUMP_URL, WIKIDATA_DUMP_PATH, WIKIDATA_ENTITIES, WIKIMEDIA_DISAMBIGUATION_PAGES
-from wd_semantic_parsing.utils import init_logging, JsonEntries, mkdir, wget
+from wd_semantic_parsing.utils import init_logging, JsonEntries, mkdir, open_input, parallel_map, wget
+
+
+BATCH_SIZE = 1000
+CHECKPOINT_LINES = 1000000
+P31_STATEMENTS = '"P31":['
 
 
 def has_path(dct, keys):
@@ -18,10 +27,14 @@ def has_path(dct, keys):
     return True
 
 
+def get_classes(statements):
+    return [class_entry['mainsnak']['datavalue']['value']['id'] for class_entry in statements
+                      if has_path(class_entry, ['mainsnak', 'datavalue', 'value', 'id'])]
+
+
 def extract_entity_data(entry, languages=['en']):
     if has_path(entry, ['claims', 'P31']):
-        classes = [class_entry['mainsnak']['datavalue']['value']['id'] for class_entry in entry['claims']['P31']
-                          if has_path(class_entry, ['mainsnak', 'datavalue', 'value', 'id'])]
+        classes = get_classes(entry['claims']['P31'])
     else:
         classes = []
     
@@ -58,47 +71,222 @@ def extract_entity_data(entry, languages=['en']):
     return data
 
 
-def load_dump(filepath, gzipped=True):
-    if gzipped:
-        f = gzip.open(filepath)
-    else:
-        f = io.open(filepath, mode='r')
+def is_escaped(text, i):
+    """Whether the character at i follows an odd number of backslashes."""
+    j = i
+    while j and text[j - 1] == '\\':
+        j -= 1
+    return (i - j) % 2 == 1
+
+
+def has_disambiguation_class(line):
+    # A '"P31":[' match is an object key unless its first quote is escaped, as inside a string or at the end of a
+    # longer key. Qualifiers and references have P31 snaks too, the entity classes are the statements with a main snak.
+    text = line.decode('utf-8')
+    decoder = json.JSONDecoder()
+    start = text.find(P31_STATEMENTS)
+    while start != -1:
+        if is_escaped(text, start):
+            start = text.find(P31_STATEMENTS, start + 1)
+            continue
+        try:
+            statements, _ = decoder.raw_decode(text, start + len(P31_STATEMENTS) - 1)
+        except ValueError:
+            return False
+        if statements and all(isinstance(statement, dict) and 'mainsnak' in statement for statement in statements):
+            return bool(set(get_classes(statements)) & WIKIMEDIA_DISAMBIGUATION_PAGES)
+        start = text.find(P31_STATEMENTS, start + 1)
+    return False
+
+
+class DumpPrefilter:
+    """
+    Screens the raw dump lines before the full JSON decode, rejecting only entries that extract_entity_data would drop:
+    - entries without any label, alias or sitelink key in the requested languages;
+    - entries with a disambiguation page class, checked decoding only the P31 statements of the lines mentioning such classes.
+    """
+    def __init__(self, languages):
+        self.language_keys = [('"%s"' % lang).encode() for lang in languages]
+        self.language_keys += [('"%swiki"' % lang).encode() for lang in languages]
+        self.disambiguation_ids = [('"%s"' % qid).encode() for qid in WIKIMEDIA_DISAMBIGUATION_PAGES]
+        self.skipped = Counter()
     
-    line_no = 0
-    while True:
+    def accept(self, line):
+        if not any(key in line for key in self.language_keys):
+            self.skipped['languages'] += 1
+            return False
+        
+        if any(qid in line for qid in self.disambiguation_ids) and has_disambiguation_class(line):
+            self.skipped['disambiguation'] += 1
+            return False
+        
+        return True
+    
+    def log_stats(self):
+        logging.info(f"Prefilter skipped {sum(self.skipped.values())} lines: "
+                     f"{self.skipped['languages']} without the requested languages, "
+                     f"{self.skipped['disambiguation']} disambiguation pages.")
+
+
+def parse_dump_line(line, prefilter=None):
+    line = line.strip().rstrip(b',')
+    if line in (b'[', b']', b''):
+        return None
+    if prefilter is not None and not prefilter.accept(line):
+        return None
+    return codec.loads(line)
+
+
+def dump_compression(compression, gzipped):
+    """Maps the deprecated gzipped flag, given by keyword or in the position of compression, to a compression."""
+    if isinstance(compression, bool):
+        compression, gzipped = 'infer', compression
+    if gzipped is None:
+        return compression
+    warnings.warn("gzipped is deprecated, use compression='gzip' or compression=None", DeprecationWarning, stacklevel=3)
+    return 'gzip' if gzipped else None
+
+
+def read_dump_lines(filepath, compression='infer', decompressor=None, gzipped=None):
+    f = open_input(filepath, dump_compression(compression, gzipped), decompressor)
+    for line_no, line in enumerate(f, 1):
+        if line_no % 100000 == 0:
+            logging.info(f"Processed Lines: {line_no}")
+        yield line_no, line
+
+
+def load_dump(filepath, compression='infer', prefilter=None, decompressor=None, gzipped=None):
+    for line_no, line in read_dump_lines(filepath, dump_compression(compression, gzipped), decompressor):
         try:
-            line_no += 1
-            if line_no % 100000 == 0:
-                logging.info(f"Processed Lines: {line_no}")
-            line = f.readline()
-            line = line.decode("utf-8").strip().rstrip(',')
-            if line == '[': continue
-            if line == '': break
-            yield json.loads(line)
+            entry = parse_dump_line(line, prefilter)
         except Exception as e:
             logging.error(f"Error loading line {line_no} in: {filepath}\n{e}")
+            continue
+        if entry is not None:
+            yield entry
 
 
-def load_entities(filepath, languages, gzipped=True):
-    for entry in load_dump(filepath, gzipped):
+def load_entities(filepath, languages, compression='infer', prefilter=True, decompressor=None, gzipped=None):
+    prefilter = DumpPrefilter(languages) if prefilter else None
+    for entry in load_dump(filepath, dump_compression(compression, gzipped), prefilter, decompressor):
         try:
             entity = extract_entity_data(entry, languages)
             if not entity: continue
             yield entity
         except Exception as e:
             logging.error(f"Error loading entity: {entry}\n{e}")
+    
+    if prefilter is not None:
+        prefilter.log_stats()
+
+
+def read_dump_batches(filepath, compression='infer', decompressor=None, batch_size=BATCH_SIZE, start_line=0):
+    """
+    Yields batches of raw dump lines, with the number of the last line of each batch.
+    The first start_line lines are skipped: they are still decompressed, but not decoded.
+    """
+    batch, line_no = [], start_line
+    for line_no, line in read_dump_lines(filepath, compression, decompressor):
+        if line_no <= start_line: continue
+        batch.append(line)
+        if len(batch) == batch_size:
+            yield line_no, batch
+            batch = []
+    if batch:
+        yield line_no, batch
+
+
+def extract_batch(batch, languages, prefilter=True):
+    """
+    Decodes a batch of raw dump lines and returns the extracted entities, already serialised as JSON lines,
+    together with the prefilter counts.
+    This is the unit of work of the worker processes, so the parent process only reads and writes.
+    """
+    line_no, lines = batch
+    prefilter = DumpPrefilter(languages) if prefilter else None
+    encoded = []
+    for line in lines:
+        try:
+            entry = parse_dump_line(line, prefilter)
+            if entry is None: continue
+            entity = extract_entity_data(entry, languages)
+        except Exception as e:
+            logging.error(f"Error loading entity from line: {line[:100]}\n{e}")
+            continue
+        if entity:
+            encoded.append(codec.dumps(entity))
+    return line_no, encoded, prefilter.skipped if prefilter else Counter()
 
 
-def extract_entities(languages):
+def save_checkpoint(checkpoint_path, checkpoint):
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def load_checkpoint(checkpoint_path, languages):
+    if not path.exists(checkpoint_path):
+        logging.info("No checkpoint found, starting the extraction from scratch.")
+        return None
+    
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['languages'] != languages:
+        raise ValueError(f"Checkpoint for languages {checkpoint['languages']} can not resume an extraction for {languages}")
+    return checkpoint
+
+
+def extract_entities(languages, workers=1, prefilter=True, resume=False, dump_path=None, compression='infer', decompressor=None):
     mkdir(WIKIDATA_DIR)
     
-    wget(WIKIDATA_DUMP_URL, WIKIDATA_DUMP_PATH)
+    if dump_path is None:
+        dump_path = WIKIDATA_DUMP_PATH
+        wget(WIKIDATA_DUMP_URL, WIKIDATA_DUMP_PATH)
     
-    entities = JsonEntries(WIKIDATA_ENTITIES)
-    for entity in load_entities(WIKIDATA_DUMP_PATH, languages):
-        entities.save_entry(entity)
+    # The checkpoint records how many dump lines have been processed and the size of the output at that point,
+    # so a resumed extraction truncates any partial output and starts from the following line.
+    checkpoint_path = WIKIDATA_ENTITIES + '.checkpoint'
+    checkpoint = load_checkpoint(checkpoint_path, languages) if resume else None
+    stats = DumpPrefilter(languages)
+    if checkpoint:
+        logging.info(f"Resuming the extraction from line {checkpoint['line_no']}.")
+        os.truncate(WIKIDATA_ENTITIES, checkpoint['output_size'])
+        entities = JsonEntries(WIKIDATA_ENTITIES, append=True)
+        entities.count = checkpoint['entities']
+        stats.skipped.update(checkpoint['skipped'])
+        start_line = checkpoint['line_no']
+    else:
+        if path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        entities = JsonEntries(WIKIDATA_ENTITIES)
+        start_line = 0
+    
+    # Batches are mapped in order, so the output is the same whatever the number of workers
+    batches = read_dump_batches(dump_path, compression, decompressor, start_line=start_line)
+    last_checkpoint = start_line
+    for line_no, encoded, skipped in parallel_map(partial(extract_batch, languages=languages, prefilter=prefilter), batches, workers):
+        entities.save_encoded_entries(encoded)
+        stats.skipped.update(skipped)
+        
+        if line_no - last_checkpoint >= CHECKPOINT_LINES:
+            entities.flush()
+            save_checkpoint(checkpoint_path, {
+                'languages': languages,
+                'line_no': line_no,
+                'output_size': path.getsize(WIKIDATA_ENTITIES),
+                'entities': entities.count,
+                'skipped': stats.skipped,
+            })
+            last_checkpoint = line_no
     entities.close()
-    logging.info("Completed entity extraction.")
+    
+    if path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    
+    if prefilter:
+        stats.log_stats()
+    logging.info(f"Completed entity extraction: {entities.count} entities.")
 
 
 if __name__ == '__main__':
@@ -106,6 +294,16 @@ if __name__ == '__main__':
     
     parser = argparse.ArgumentParser("Preprocess Wikidata Dump")
     parser.add_argument('languages', nargs='*', default=['en'])
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes decoding the dump.")
+    parser.add_argument('--no-prefilter', dest='prefilter', action='store_false', help="Fully decode every line of the dump.")
+    parser.add_argument('--resume', action='store_true', help="Resume an interrupted extraction from its last checkpoint.")
+    parser.add_argument('--dump', help="Local dump to read instead of downloading the latest one, '-' reads from stdin.")
+    parser.add_argument('--compression', default='infer', choices=['infer', 'gzip', 'bz2', 'zstd', 'none'],
+                        help="Compression of the dump, inferred from the file extension by default.")
+    parser.add_argument('--decompressor', help="External decompression command writing to stdout, e.g. 'pigz -dc'.")
     args = parser.parse_args()
     
-    extract_entities(args.languages)
+    extract_entities(args.languages, args.workers, args.prefilter, args.resume,
+                     dump_path=args.dump,
+                     compression=None if args.compression == 'none' else args.compression,
+                     decompressor=args.decompressor)
@@ -1,37 +1,128 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import os
 from os import path
 import logging
+from array import array
 
 from wd_semantic_parsing.wikidata import WIKIDATA_DIR, WIKIDATA_ENTITIES_WITH_PAGEVIEWS
-from wd_semantic_parsing.utils import init_logging, JsonSQLite, get_json_lines, interactive
+from wd_semantic_parsing.utils import init_logging, JsonSQLite, get_json_lines, interactive, BULK_BATCH_SIZE
 
 
 ENTITIES_PATH = path.join(WIKIDATA_DIR, 'entities.sqlite3')
+ENTITY_TYPES_PATH = path.join(WIKIDATA_DIR, 'entity_types.sqlite3')
+# Numeric ids are packed as uint32, the type code depends on the platform
+ID_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+assert array(ID_TYPECODE).itemsize == 4, "No array type code of 4 bytes for the numeric ids"
+
+
+def numeric_id(wikidata_id):
+    """Numeric part of an item or property id, e.g. 5 for Q5 and 31 for P31."""
+    return int(wikidata_id[1:])
+
+
+def is_valid_id(wikidata_id, prefix):
+    """Whether wikidata_id is a plain id starting with prefix, 'Q' for the items and 'P' for the properties."""
+    digits = wikidata_id[1:]
+    return wikidata_id[:1] == prefix and digits.isascii() and digits.isdigit() and int(digits) < 1 << 32
+
+
+class EntityTypes(JsonSQLite):
+    """
+    Classes and properties of the entities, for constrained linking without decoding the entity records.
+    
+    Values are packed uint32 arrays: the number of classes, the numeric ids of the classes, then the
+    numeric ids of the properties. They are written from (classes, properties) id lists and read back as
+    (classes, properties) frozensets of numeric ids.
+    """
+    def encode(self, value):
+        classes, properties = value
+        ids = array(ID_TYPECODE, [len(classes)])
+        ids.extend(map(numeric_id, classes))
+        ids.extend(map(numeric_id, properties))
+        return ids.tobytes()
+    
+    def decode(self, data):
+        ids = array(ID_TYPECODE)
+        ids.frombytes(data)
+        n_classes = ids[0]
+        return frozenset(ids[1:n_classes + 1]), frozenset(ids[n_classes + 1:])
+
+
+def iter_entities():
+    for i, entity in enumerate(get_json_lines(WIKIDATA_ENTITIES_WITH_PAGEVIEWS), 1):
+        if i % 100000 == 0:
+            logging.info(f"Processed {i} entities.")
+        yield entity
+
+
+def bulk_build(stores, batch_size=BULK_BATCH_SIZE):
+    """
+    Bulk loads the entities into stores, a list of (filepath, store_class, item_function) in one pass.
+    Every store is loaded aside and moved in place once complete, so an interrupted build is never used.
+    The items are encoded as soon as each entity is read, so that only their encoded rows are buffered.
+    """
+    tmp_paths = [filepath + '.tmp' for filepath, _, _ in stores]
+    for tmp_path in tmp_paths:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    dbs = [store_class(tmp_path, bulk_load=True) for tmp_path, (_, store_class, _) in zip(tmp_paths, stores)]
+    writers = [(db, db.encode, item_function, []) for db, (_, _, item_function) in zip(dbs, stores)]
+    for entity in iter_entities():
+        for db, encode, item_function, rows in writers:
+            key, value = item_function(entity)
+            rows.append((key, encode(value)))
+            if len(rows) == batch_size:
+                db.write_encoded(rows)
+                rows.clear()
+    for db, _, _, rows in writers:
+        db.write_encoded(rows)
+        db.close()
+    
+    for tmp_path, (filepath, _, _) in zip(tmp_paths, stores):
+        os.replace(tmp_path, filepath)
+
+
+def entity_item(entity):
+    return entity['id'], entity
+
+
+def entity_types_item(entity):
+    return entity['id'], (entity['classes'], entity['properties'])
 
 
 def build_entity_db():
     logging.info("Building Entity DB")
-    with JsonSQLite(ENTITIES_PATH) as db:
-        for i, entity in enumerate(get_json_lines(WIKIDATA_ENTITIES_WITH_PAGEVIEWS), 1):
-            if i % 100000 == 0:
-                db.commit()
-                logging.info(f"Processed {i} entities.")
-            db.write(entity['id'], entity)
+    bulk_build([(ENTITIES_PATH, JsonSQLite, entity_item),
+                (ENTITY_TYPES_PATH, EntityTypes, entity_types_item)])
     logging.info("Completed")
 
 
-def get_entity_db():
+def build_entity_types():
+    logging.info("Building Entity Types DB")
+    bulk_build([(ENTITY_TYPES_PATH, EntityTypes, entity_types_item)])
+    logging.info("Completed")
+
+
+def get_entity_db(read_only=False):
     if not path.exists(ENTITIES_PATH):
         build_entity_db()
     
-    return JsonSQLite(ENTITIES_PATH)
+    return JsonSQLite(ENTITIES_PATH, read_only=read_only)
+
+
+def get_entity_types(read_only=False):
+    if not path.exists(ENTITY_TYPES_PATH):
+        build_entity_types()
+    
+    return EntityTypes(ENTITY_TYPES_PATH, read_only=read_only)
 
 
 if __name__ == '__main__':
     init_logging()
     
-    entities = get_entity_db()
+    entities = get_entity_db(read_only=True)
     
     interactive(lambda line: print(entities.read(line)),
                 history_name='entities')
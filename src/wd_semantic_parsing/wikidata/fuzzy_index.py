@@ -0,0 +1,177 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Typo-tolerant lookup of the gazetteer denotationals, with a SymSpell-style deletion index.
+
+Every string obtained by deleting up to max_distance characters from the first prefix_length characters of
+a denotational is a key of the index, whose value is the list of those denotationals. Two strings within
+max_distance edits share such a key, so the denotationals found through the deletions of a mention are
+verified with a bounded Damerau-Levenshtein distance. Only the max_denotationals denotationals with the
+most pageviews are indexed, to bound the size of the index.
+
+The index is a memory-mapped table, gazetteer.fuzzy, whose values are indexes of denotationals in the
+prefix search suggest table, by decreasing pageviews, and its parameters are saved in gazetteer.fuzzy.json.
+Lookups verify the denotationals of the closest deletions first, the most viewed first, so that the matches
+returned once the time budget is exceeded are the most popular ones.
+"""
+import heapq
+import json
+import logging
+import time
+from itertools import groupby
+from operator import itemgetter
+from os import path
+
+from wd_semantic_parsing.wikidata import WIKIDATA_DIR
+from wd_semantic_parsing.wikidata.entity_db import ID_TYPECODE
+from wd_semantic_parsing.wikidata.prefix_search import SuggestTable, SUGGEST_PATH
+from wd_semantic_parsing.sorted_table import ArrayTable, SortedTableWriter
+from wd_semantic_parsing.external_sort import ExternalSorter, DEFAULT_MEMORY_BUDGET
+
+
+FUZZY_INDEX_PATH = path.join(WIKIDATA_DIR, 'gazetteer.fuzzy')
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7
+MAX_DENOTATIONALS = 1000000
+# Seconds, lookups return the matches found so far once it is exceeded
+TIME_BUDGET = 0.01
+
+
+class FuzzyTable(ArrayTable):
+    # Version 2: the denotationals of a deletion are sorted by decreasing pageviews
+    MAGIC = b'WDFUZZY2'
+    ITEM_TYPECODE = ID_TYPECODE
+
+
+def deletions(string, max_distance):
+    """The strings obtained by deleting up to max_distance characters, including the string itself."""
+    strings, last = {string}, {string}
+    for _ in range(max_distance):
+        last = {deleted[:i] + deleted[i + 1:] for deleted in last for i in range(len(deleted))}
+        strings |= last
+    return strings
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Optimal string alignment distance (Damerau-Levenshtein with adjacent transpositions, each substring
+    edited once), or max_distance + 1 as soon as it is known to be larger than max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    
+    # The common prefix and suffix do not change the distance
+    shortest, prefix, suffix = min(len(a), len(b)), 0, 0
+    while prefix < shortest and a[prefix] == b[prefix]:
+        prefix += 1
+    while suffix < shortest - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    a, b = a[prefix:len(a) - suffix], b[prefix:len(b) - suffix]
+    if not a or not b:
+        return min(max(len(a), len(b)), max_distance + 1)
+    
+    # Only the cells within max_distance of the diagonal can hold a distance up to max_distance
+    too_far = max_distance + 1
+    before, previous = None, [j if j <= max_distance else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [too_far] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        for j in range(max(1, i - max_distance), min(len(b), i + max_distance) + 1):
+            cost = a[i - 1] != b[j - 1]
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if cost and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                distance = min(distance, before[j - 2] + 1)
+            current[j] = min(distance, too_far)
+        if min(current) > max_distance:
+            return too_far
+        before, previous = previous, current
+    return previous[len(b)]
+
+
+def build_fuzzy_index(suggest_path=SUGGEST_PATH, fuzzy_path=FUZZY_INDEX_PATH, max_distance=MAX_DISTANCE,
+                      prefix_length=PREFIX_LENGTH, max_denotationals=MAX_DENOTATIONALS,
+                      memory_budget=DEFAULT_MEMORY_BUDGET):
+    """Builds the deletion index of the denotationals of the suggest table with the most pageviews."""
+    logging.info("Building Fuzzy Index")
+    with SuggestTable(suggest_path) as suggest:
+        # The pageviews of a denotational are those of its first candidate
+        indexes = heapq.nlargest(max_denotationals, range(len(suggest)), key=lambda i: suggest.array(i)[1])
+        
+        records = ExternalSorter(memory_budget)
+        for n, i in enumerate(sorted(indexes), 1):
+            if n % 100000 == 0:
+                logging.info(f"Processed {n} denotationals. {records.count} deletions")
+            views = suggest.array(i)[1]
+            for deleted in deletions(suggest.key(i)[:prefix_length], max_distance):
+                records.add((deleted, -views, i))
+    
+    with SortedTableWriter(fuzzy_path, FuzzyTable, hash_index=True) as writer:
+        for deleted, group in groupby(records, key=itemgetter(0)):
+            writer.add(deleted, [i for _, _, i in group])
+    
+    with open(fuzzy_path + '.json', 'w') as f:
+        json.dump({'max_distance': max_distance, 'prefix_length': prefix_length,
+                   'denotationals': len(indexes)}, f)
+    logging.info(f"Fuzzy index of {len(indexes)} denotationals, {len(writer)} deletions")
+
+
+class FuzzyIndex:
+    """Approximate lookup of mentions in the denotationals of the deletion index, see build_fuzzy_index."""
+    def __init__(self, suggest_path=SUGGEST_PATH, fuzzy_path=FUZZY_INDEX_PATH):
+        with open(fuzzy_path + '.json') as f:
+            parameters = json.load(f)
+        self.max_distance = parameters['max_distance']
+        self.prefix_length = parameters['prefix_length']
+        self.suggest = SuggestTable(suggest_path)
+        self.table = FuzzyTable(fuzzy_path)
+    
+    def lookup(self, mention, max_distance=None, time_budget=TIME_BUDGET):
+        """
+        (denotational, distance, [(QID, pageviews), ...]) of the denotationals within max_distance edits
+        of the mention, at most the max_distance of the index, ranked by distance then pageviews.
+        Once time_budget seconds have passed, the matches verified so far are returned.
+        """
+        deadline = time.perf_counter() + time_budget
+        mention = mention.strip().lower()
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        
+        matches = []
+        for n, index in enumerate(self.candidate_indexes(mention, max_distance)):
+            if time.perf_counter() > deadline:
+                logging.debug(f"Fuzzy lookup of '{mention}' stopped after {n} denotationals")
+                break
+            denotational = self.suggest.key(index)
+            distance = edit_distance(mention, denotational, max_distance)
+            if distance <= max_distance:
+                items = self.suggest.array(index)
+                matches.append((distance, -items[1], denotational,
+                                [('Q%d' % qid, views) for qid, views in zip(items[::2], items[1::2])]))
+        
+        matches.sort(key=itemgetter(0, 1, 2))
+        return [(denotational, distance, candidates) for distance, _, denotational, candidates in matches]
+    
+    def candidate_indexes(self, mention, max_distance):
+        """
+        Indexes of the denotationals sharing a deletion with the mention, the closest deletions first, and the
+        denotationals of a deletion by decreasing pageviews.
+        """
+        seen = set()
+        for deleted in sorted(deletions(mention[:self.prefix_length], max_distance), key=len, reverse=True):
+            i = self.table.find(deleted)
+            if i < 0:
+                continue
+            for index in self.table.array(i):
+                if index not in seen:
+                    seen.add(index)
+                    yield index
+    
+    def close(self):
+        self.suggest.close()
+        self.table.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *_):
+        self.close()
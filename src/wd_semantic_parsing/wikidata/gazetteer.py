@@ -1,65 +1,319 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import os
+import argparse
 from os import path
-from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
 import logging
+from array import array
 
 from wd_semantic_parsing.wikidata import WIKIDATA_DIR, WIKIDATA_ENTITIES_WITH_PAGEVIEWS, WIKIMEDIA_DISAMBIGUATION_PAGES
+from wd_semantic_parsing.external_sort import ExternalSorter, DEFAULT_MEMORY_BUDGET
+from wd_semantic_parsing.sorted_table import ArrayTable, write_sorted_table
+from wd_semantic_parsing.wikidata.prefix_search import (PrefixSearch, PrefixSearchWriter, SUGGEST_PATH, PREFIXES_PATH,
+                                                         MAX_PAGEVIEWS)
+from wd_semantic_parsing.wikidata.fuzzy_index import FuzzyIndex, FuzzyTable, build_fuzzy_index, FUZZY_INDEX_PATH
+from wd_semantic_parsing.wikidata.entity_db import is_valid_id, numeric_id, ID_TYPECODE
 from wd_semantic_parsing.utils import init_logging, JsonSQLite, get_json_lines, interactive
 
 
 GAZETTEER_PATH = path.join(WIKIDATA_DIR, 'gazetteer.sqlite3')
+STATIC_GAZETTEER_PATH = path.join(WIKIDATA_DIR, 'gazetteer.static')
+GAZETTEER_BACKENDS = ('sqlite', 'static')
 
 
-def build_gazetteer(lang='en', skip_less_than_three_chars=True):
+def format_qids(qids):
+    """QIDs of a sequence of QID numbers. Formatting them all at once is about twice as fast as one at a time."""
+    return (' Q%d' * len(qids) % tuple(qids)).split()
+
+
+def format_scored(items):
+    """(QID, pageviews) pairs of a sequence of interleaved QID numbers and pageviews."""
+    return list(zip(format_qids(items[::2]), items[1::2]))
+
+
+def qid_number(qid):
+    """Numeric part of a QID. Other ids, such as properties or lexemes, would be read back as a QID."""
+    if not is_valid_id(qid, 'Q'):
+        raise ValueError(f"Candidates must be QIDs, got: {qid}")
+    return numeric_id(qid)
+
+
+def pack_candidates(entities):
+    """Interleaved (QID number, pageviews) items of (entity, pageviews) pairs, pageviews saturated to uint32."""
+    return array(ID_TYPECODE, (item for entity, views in entities
+                               for item in (qid_number(entity), min(views, MAX_PAGEVIEWS))))
+
+
+class Gazetteer(JsonSQLite):
+    """
+    Candidate entities of the denotationals with their pageviews, in decreasing order of pageviews, stored as
+    packed uint32 arrays of interleaved QID numbers and pageviews. They are written as lists of
+    (QID, pageviews) pairs and read back as lists of QIDs, or with read_scored as (QID, pageviews) pairs.
+    The first k candidates are read with substr, without fetching the whole list.
+    """
+    FORMAT_VERSION = 2
+    # Bytes of a (QID number, pageviews) pair
+    PAIR_SIZE = 2 * array(ID_TYPECODE).itemsize
+    
+    def encode(self, value):
+        return pack_candidates(value).tobytes()
+    
+    def decode(self, data):
+        return format_qids(memoryview(data).cast(ID_TYPECODE)[::2])
+    
+    def read_head(self, key, k=None):
+        """Packed candidates of the key, only the first k with k, or None."""
+        cursor = self.get_cursor()
+        if k is None:
+            cursor.execute('SELECT value FROM data WHERE key=?', (key, ))
+        else:
+            cursor.execute('SELECT substr(value, 1, ?) FROM data WHERE key=?', (k * self.PAIR_SIZE, key))
+        row = cursor.fetchone()
+        if row is None: return None
+        return memoryview(row[0]).cast(ID_TYPECODE)
+    
+    def read_ids(self, key, k=None):
+        """Candidates as an array of QID numbers, without building any string, or None."""
+        items = self.read_head(key, k)
+        if items is None: return None
+        return array(ID_TYPECODE, items[::2])
+    
+    def read_scored(self, key, k=None):
+        """The (QID, pageviews) pairs of the candidates, only the first k with k, or None."""
+        items = self.read_head(key, k)
+        if items is None: return None
+        return format_scored(items)
+
+
+class StaticGazetteerTable(ArrayTable):
+    MAGIC = b'WDGAZET2'
+    ITEM_TYPECODE = ID_TYPECODE
+
+
+class StaticGazetteer:
+    """
+    Read-only gazetteer memory-mapped from an immutable file: a hash-indexed sorted table of the denotationals
+    and the packed (QID number, pageviews) pairs of their candidates. Opening it is O(1) and the pages are
+    shared by every process through the OS page cache. It reads like a read-only Gazetteer.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.table = StaticGazetteerTable(filepath)
+    
+    def reopen(self):
+        # The old mapping is left to the garbage collector, as lookups in progress may still use it
+        self.table = StaticGazetteerTable(self.filepath)
+    
+    def read_head(self, key, k=None):
+        table = self.table
+        i = table.find(key)
+        if i < 0: return None
+        items = table.array(i)
+        return items if k is None else items[:2 * k]
+    
+    def read(self, key):
+        items = self.read_head(key)
+        if items is None: return None
+        return format_qids(items[::2])
+    
+    def read_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self.read(key)
+            if value is not None:
+                values[key] = value
+        return values
+    
+    def read_ids(self, key, k=None):
+        items = self.read_head(key, k)
+        if items is None: return None
+        return array(ID_TYPECODE, items[::2])
+    
+    def read_scored(self, key, k=None):
+        items = self.read_head(key, k)
+        if items is None: return None
+        return format_scored(items)
+    
+    def iterkeys(self):
+        return iter(self.table)
+    
+    def iteritems(self):
+        for i in range(len(self.table)):
+            yield self.table.key(i), format_qids(self.table.array(i)[::2])
+    
+    def close(self):
+        self.table.close()
+    
+    def __len__(self):
+        return len(self.table)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *_):
+        self.close()
+
+
+def get_denotationals(entity, lang='en', skip_less_than_three_chars=True):
+    denotationals = set()
+    if lang in entity['aliases']:
+        for den in entity['aliases'][lang]:
+            denotationals.add(den.lower())
+    
+    if lang in entity['labels']:
+        denotationals.add(entity['labels'][lang].lower())
+    
+    if lang in entity['wiki_title']:
+        denotationals.add(entity['wiki_title'][lang].lower())
+    
+    if skip_less_than_three_chars:
+        denotationals = {den for den in denotationals if len(den) >= 3}
+    return denotationals
+
+
+def iter_denotationals(lang='en', skip_less_than_three_chars=True, memory_budget=DEFAULT_MEMORY_BUDGET,
+                       with_pageviews=False):
+    """
+    Yields (denotational, entities) in denotational order, with the entities sorted by decreasing pageviews,
+    as (entity, pageviews) pairs with with_pageviews.
+    The (denotational, -pageviews, id) records are externally sorted, so memory is capped by memory_budget.
+    Entities other than items, such as properties, are skipped: the gazetteer only stores QIDs.
+    """
     logging.info("Collecting Denotationals")
-    gazetteer = defaultdict(list)
+    records = ExternalSorter(memory_budget)
+    skipped = 0
     for i, entity in enumerate(get_json_lines(WIKIDATA_ENTITIES_WITH_PAGEVIEWS), 1):
         if i % 100000 == 0:
-            logging.info(f"Processed: {i} entities. {len(gazetteer)} denotationals")
+            logging.info(f"Processed: {i} entities. {records.count} denotationals")
         
+        if not is_valid_id(entity['id'], 'Q'):
+            skipped += 1
+            continue
         if set(entity['classes']) & WIKIMEDIA_DISAMBIGUATION_PAGES:
             continue
         
-        denotationals = set()
-        if lang in entity['aliases']:
-            for den in entity['aliases'][lang]:
-                denotationals.add(den.lower())
-        
-        if lang in entity['labels']:
-            denotationals.add(entity['labels'][lang].lower())
-        
-        if lang in entity['wiki_title']:
-            denotationals.add(entity['wiki_title'][lang].lower())
-        
-        for denotational in denotationals:
-            if skip_less_than_three_chars and len(denotational) < 3:
-                continue
-            
-            gazetteer[denotational].append((entity['pageviews'], entity['id']))
+        for denotational in get_denotationals(entity, lang, skip_less_than_three_chars):
+            records.add((denotational, -entity['pageviews'], entity['id']))
+    if skipped:
+        logging.info(f"Skipped {skipped} entities without a QID.")
+    
+    for denotational, group in groupby(records, key=itemgetter(0)):
+        # Entities with the same pageviews are sorted by decreasing id, as they always were
+        entities = sorted(((-neg_views, entity) for _, neg_views, entity in group), reverse=True)
+        if with_pageviews:
+            yield denotational, [(entity, views) for views, entity in entities]
+        else:
+            yield denotational, [entity for _, entity in entities]
+
+
+def log_progress(denotationals):
+    for i, item in enumerate(denotationals, 1):
+        if i % 100000 == 0:
+            logging.info(f"Processed {i} denotationals.")
+        yield item
+
+
+def add_to_prefix_search(denotationals, writer):
+    """Adds the denotationals with pageviews to the prefix search writer, and yields them."""
+    for denotational, entities in denotationals:
+        writer.add(denotational, entities)
+        yield denotational, entities
+    writer.close()
+
+
+def build_gazetteer(lang='en', skip_less_than_three_chars=True, memory_budget=DEFAULT_MEMORY_BUDGET, backend='sqlite',
+                    prefix_search=False):
+    """Builds the gazetteer of the backend, and with prefix_search the prefix search tables in the same pass."""
+    if backend not in GAZETTEER_BACKENDS:
+        raise ValueError(f"Unknown gazetteer backend '{backend}', expected one of: {', '.join(GAZETTEER_BACKENDS)}")
+    denotationals = log_progress(iter_denotationals(lang, skip_less_than_three_chars, memory_budget,
+                                                    with_pageviews=True))
+    if prefix_search:
+        denotationals = add_to_prefix_search(denotationals, PrefixSearchWriter())
+    
+    if backend == 'static':
+        logging.info("Building Static Gazetteer")
+        # Denotationals come sorted, and code point order is UTF-8 byte order
+        write_sorted_table(STATIC_GAZETTEER_PATH, StaticGazetteerTable,
+                           ((denotational, pack_candidates(entities)) for denotational, entities in denotationals),
+                           presorted=True, hash_index=True)
+        return
     
     logging.info("Building Gazetteer")
-    with JsonSQLite(GAZETTEER_PATH) as db:
-        i = 0
-        for i, (denotational, entities) in enumerate(gazetteer.items(), 1):
-            if i % 100000 == 0:
-                db.commit()
-                logging.info(f"Processed {i} denotationals.")
-            db.write(denotational, [entity for _, entity in sorted(entities, reverse=True)])
-        logging.info(f"Gazetteer populated with {i} strings.")
+    tmp_path = GAZETTEER_PATH + '.tmp'
+    if path.exists(tmp_path):
+        os.remove(tmp_path)
+    with Gazetteer(tmp_path, bulk_load=True) as db:
+        db.write_many(denotationals)
+        logging.info(f"Gazetteer populated with {len(db)} strings.")
+    os.replace(tmp_path, GAZETTEER_PATH)
 
 
-def get_gazetteer(lang='en', skip_less_than_three_chars=True):
+def get_gazetteer(lang='en', skip_less_than_three_chars=True, read_only=False, backend='sqlite',
+                  memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    The gazetteer, built if needed within memory_budget bytes, see iter_denotationals.
+    The static backend is always read-only.
+    """
+    if backend == 'static':
+        if not path.exists(STATIC_GAZETTEER_PATH):
+            build_gazetteer(lang, skip_less_than_three_chars, memory_budget, backend='static')
+        elif not StaticGazetteerTable.has_format(STATIC_GAZETTEER_PATH):
+            logging.info("The static gazetteer was built with another format, rebuilding it")
+            build_gazetteer(lang, skip_less_than_three_chars, memory_budget, backend='static')
+        return StaticGazetteer(STATIC_GAZETTEER_PATH)
+    
     if not path.exists(GAZETTEER_PATH):
-        build_gazetteer(lang, skip_less_than_three_chars)
+        build_gazetteer(lang, skip_less_than_three_chars, memory_budget)
+    elif not Gazetteer.has_format(GAZETTEER_PATH):
+        logging.info("The gazetteer was built with another format, rebuilding it")
+        build_gazetteer(lang, skip_less_than_three_chars, memory_budget)
+    
+    return Gazetteer(GAZETTEER_PATH, read_only=read_only)
+
+
+def build_prefix_search(lang='en', skip_less_than_three_chars=True, memory_budget=DEFAULT_MEMORY_BUDGET):
+    logging.info("Building Prefix Search")
+    writer = PrefixSearchWriter()
+    for denotational, entities in log_progress(iter_denotationals(lang, skip_less_than_three_chars, memory_budget,
+                                                                  with_pageviews=True)):
+        writer.add(denotational, entities)
+    writer.close()
+
+
+def get_prefix_search(lang='en', skip_less_than_three_chars=True, memory_budget=DEFAULT_MEMORY_BUDGET):
+    if not (path.exists(SUGGEST_PATH) and path.exists(PREFIXES_PATH)):
+        build_prefix_search(lang, skip_less_than_three_chars, memory_budget)
     
-    return JsonSQLite(GAZETTEER_PATH)
+    return PrefixSearch()
+
+
+def get_fuzzy_index(lang='en', skip_less_than_three_chars=True, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """The fuzzy index, built if needed from the prefix search suggest table, itself built if needed."""
+    if not (path.exists(FUZZY_INDEX_PATH) and path.exists(FUZZY_INDEX_PATH + '.json')):
+        if not path.exists(SUGGEST_PATH):
+            build_prefix_search(lang, skip_less_than_three_chars, memory_budget)
+        build_fuzzy_index(memory_budget=memory_budget)
+    elif not FuzzyTable.has_format(FUZZY_INDEX_PATH):
+        logging.info("The fuzzy index was built with another format, rebuilding it")
+        build_fuzzy_index(memory_budget=memory_budget)
+    
+    return FuzzyIndex()
 
 
 if __name__ == '__main__':
     init_logging()
     
-    gazetteer = get_gazetteer('en')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=GAZETTEER_BACKENDS, default='sqlite',
+                        help="Gazetteer backend, built on first use")
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET >> 20,
+                        help="Memory budget in MB of the denotationals sorted to build the gazetteer")
+    args = parser.parse_args()
+    
+    gazetteer = get_gazetteer('en', read_only=True, backend=args.backend, memory_budget=args.memory_budget << 20)
     
     interactive(lambda line: print(gazetteer.read(line.lower())),
                 history_name='gazetteer')
@@ -1,24 +1,273 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
-from wd_semantic_parsing.wikidata.gazetteer import get_gazetteer
-from wd_semantic_parsing.wikidata.entity_db import get_entity_db
+import argparse
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from wd_semantic_parsing.utils import init_logging, interactive, LRUCache, CachedStore
+from wd_semantic_parsing.wikidata.gazetteer import get_gazetteer, get_fuzzy_index, format_qids, format_scored
+from wd_semantic_parsing.wikidata.fuzzy_index import TIME_BUDGET
+from wd_semantic_parsing.wikidata import mention_detection
+from wd_semantic_parsing.wikidata.mention_detection import normalize_mention
+from wd_semantic_parsing.wikidata.entity_db import get_entity_db, get_entity_types, numeric_id, is_valid_id
+
+
+ASYNC_WORKERS = 8
+# Candidates checked against the constraints at once when looking for the top k, doubled until k are found
+TOP_K_CHUNK = 16
+ASYNC_MAX_PENDING = 1024
 
 
 class EntityLinker:
-    def __init__(self, lang='en'):
-        self.gazetteer = get_gazetteer(lang)
-        self.entities = get_entity_db()
+    """
+    Links mentions to entities. The stores are opened read-only, so a linker can be shared across threads.
+    
+    With cache_entries and/or cache_bytes, the reads of every store and the results of link_entity are
+    kept in LRU caches of that size, which are cleared when the stores are rebuilt.
+    The gazetteer_backend is 'sqlite' or 'static', see get_gazetteer.
+    The fuzzy index and the mention automaton are loaded, or built, once on first use by any thread.
+    """
+    def __init__(self, lang='en', cache_entries=None, cache_bytes=None, gazetteer_backend='sqlite'):
+        self.lang = lang
+        self.fuzzy_index = None
+        self.automaton = None
+        self.build_lock = threading.Lock()
+        self.gazetteer = get_gazetteer(lang, read_only=True, backend=gazetteer_backend)
+        self.entities = get_entity_db(read_only=True)
+        self.entity_types = get_entity_types(read_only=True)
+        
+        self.link_cache = None
+        self.cached_stores = []
+        if cache_entries is not None or cache_bytes is not None:
+            self.gazetteer, self.entities, self.entity_types = self.cached_stores = [
+                CachedStore(store, LRUCache(cache_entries, cache_bytes))
+                for store in (self.gazetteer, self.entities, self.entity_types)]
+            self.link_cache = LRUCache(cache_entries, cache_bytes)
+            self.generations = tuple(store.generation for store in self.cached_stores)
+    
+    def get_fuzzy_index(self):
+        if self.fuzzy_index is None:
+            with self.build_lock:
+                if self.fuzzy_index is None:
+                    self.fuzzy_index = get_fuzzy_index(self.lang)
+        return self.fuzzy_index
+    
+    def get_automaton(self):
+        if self.automaton is None:
+            with self.build_lock:
+                if self.automaton is None:
+                    self.automaton = mention_detection.get_automaton(self.gazetteer)
+        return self.automaton
+    
+    def check_caches(self):
+        """Clears the cached results once any of the stores was rebuilt."""
+        for store in self.cached_stores:
+            store.check()
+        generations = tuple(store.generation for store in self.cached_stores)
+        if generations != self.generations:
+            self.generations = generations
+            self.link_cache.clear()
+    
+    def cache_stats(self):
+        if self.link_cache is None:
+            return {}
+        return {'link_entity': self.link_cache.stats(), 'gazetteer': self.gazetteer.cache.stats(),
+                'entities': self.entities.cache.stats(), 'entity_types': self.entity_types.cache.stats()}
     
-    def link_entity(self, mention, class_name=None, property_name=None):
+    @staticmethod
+    def valid_constraints(class_name=None, property_name=None):
+        """Whether the class is an item id and the property a property id, when given. Others match no entity."""
+        return ((not class_name or is_valid_id(class_name, 'Q'))
+                and (not property_name or is_valid_id(property_name, 'P')))
+    
+    def filter_candidates(self, candidates, entity_types, class_name=None, property_name=None):
+        """Keeps the candidates having the class and the property, given their (classes, properties) id sets."""
+        if not self.valid_constraints(class_name, property_name):
+            return []
+        class_id = numeric_id(class_name) if class_name else None
+        property_id = numeric_id(property_name) if property_name else None
+        
+        filtered = []
+        for candidate in candidates:
+            types = entity_types.get(candidate)
+            if types is None:
+                continue
+            classes, properties = types
+            if class_id is not None and class_id not in classes:
+                continue
+            if property_id is not None and property_id not in properties:
+                continue
+            filtered.append(candidate)
+        return filtered
+    
+    def find_candidates(self, mention, class_name=None, property_name=None, top_k=None, with_scores=False):
+        """
+        Candidates of the mention having the class and the property, as (QID, pageviews) pairs with with_scores.
+        With top_k, only the head of the candidates is decoded and checked, until top_k candidates are found.
+        """
+        if not (class_name or property_name):
+            if top_k is None and not with_scores:
+                return self.gazetteer.read(mention) or []
+            items = self.gazetteer.read_head(mention, top_k)
+            if items is None: return []
+            return format_scored(items) if with_scores else format_qids(items[::2])
+        
+        if not self.valid_constraints(class_name, property_name):
+            return []
+        items = self.gazetteer.read_head(mention)
+        if items is None: return []
         candidates = []
+        chunk = len(items) if top_k is None else 2 * max(top_k, TOP_K_CHUNK)
+        start = 0
+        while start < len(items) and (top_k is None or len(candidates) < top_k):
+            scored = format_scored(items[start:start + chunk])
+            entity_types = self.entity_types.read_many(qid for qid, _ in scored)
+            kept = set(self.filter_candidates([qid for qid, _ in scored], entity_types, class_name, property_name))
+            candidates.extend(candidate for candidate in scored if candidate[0] in kept)
+            start += chunk
+            chunk *= 2
+        
+        candidates = candidates[:top_k]
+        return candidates if with_scores else [qid for qid, _ in candidates]
+    
+    def link_entity(self, mention, class_name=None, property_name=None, fuzzy=False, top_k=None, with_scores=False):
+        """
+        Candidates of the mention, or with fuzzy, those of link_entity_fuzzy when there are none.
+        With top_k, only the first top_k candidates, and with with_scores, (QID, pageviews) pairs.
+        """
+        mention = normalize_mention(mention)
+        if self.link_cache is None:
+            candidates = list(self.find_candidates(mention, class_name, property_name, top_k, with_scores))
+        else:
+            self.check_caches()
+            key = (mention, class_name, property_name, top_k, with_scores)
+            candidates = self.link_cache.get(key)
+            if candidates is None:
+                candidates = tuple(self.find_candidates(mention, class_name, property_name, top_k, with_scores))
+                self.link_cache.put(key, candidates)
+            candidates = list(candidates)
+        
+        if not candidates and fuzzy:
+            return self.link_entity_fuzzy(mention, class_name, property_name, top_k=top_k, with_scores=with_scores)
+        return candidates
+    
+    def link_entity_fuzzy(self, mention, class_name=None, property_name=None, max_distance=None,
+                          time_budget=TIME_BUDGET, top_k=None, with_scores=False):
+        """
+        Candidates of the denotationals within max_distance edits of the mention, ranked by edit distance then
+        pageviews, see FuzzyIndex.lookup. The fuzzy index is built on first use if needed.
+        """
+        ranks = {}
+        for _, distance, entities in self.get_fuzzy_index().lookup(mention, max_distance, time_budget):
+            for entity, views in entities:
+                ranks[entity] = min(ranks.get(entity, (distance, -views)), (distance, -views))
+        candidates = sorted(ranks, key=lambda entity: (ranks[entity], entity))
         
-        for candidate in self.gazetteer.read(mention.strip().lower()):
-            if class_name or property_name:
-                entity = self.entities.read(candidate)
-                if class_name and class_name not in entity['classes']:
-                        continue
-                if property_name and property_name not in entity['properties']:
-                        continue
-            candidates.append(candidate)
+        if class_name or property_name:
+            entity_types = self.entity_types.read_many(candidates)
+            candidates = self.filter_candidates(candidates, entity_types, class_name, property_name)
         
+        candidates = candidates[:top_k]
+        if with_scores:
+            return [(candidate, -ranks[candidate][1]) for candidate in candidates]
         return candidates
+    
+    def link_entities(self, mentions, class_name=None, property_name=None, top_k=None, with_scores=False):
+        """
+        Links a batch of mentions at once, returns the list of candidates of each mention.
+        With top_k or with_scores, the candidates of each mention are those of find_candidates.
+        """
+        normalized = [normalize_mention(mention) for mention in mentions]
+        if top_k is not None or with_scores:
+            return [list(self.find_candidates(mention, class_name, property_name, top_k, with_scores))
+                    for mention in normalized]
+        
+        gazetteer = self.gazetteer.read_many(normalized)
+        
+        if class_name or property_name:
+            entity_types = self.entity_types.read_many(candidate for candidates in gazetteer.values()
+                                                                 for candidate in candidates)
+            gazetteer = {mention: self.filter_candidates(candidates, entity_types, class_name, property_name)
+                         for mention, candidates in gazetteer.items()}
+        
+        return [list(gazetteer.get(mention, [])) for mention in normalized]
+    
+    def detect_mentions(self, text, longest=False, class_name=None, property_name=None):
+        """
+        (start, end, candidates) of the gazetteer denotationals found in the text at word boundaries, in one pass
+        of an Aho-Corasick automaton of the gazetteer keys. With longest, only the leftmost longest matches,
+        which do not overlap, are kept. The automaton is compiled and saved on first use if needed.
+        """
+        mentions = mention_detection.detect_mentions(self.get_automaton(), text, longest)
+        candidates = self.link_entities([mention for _, _, mention in mentions], class_name, property_name)
+        return [(start, end, mention_candidates)
+                for (start, end, _), mention_candidates in zip(mentions, candidates)]
+
+
+class AsyncEntityLinker:
+    """
+    Asyncio front of an EntityLinker. The lookups run in a pool of worker threads, with at most max_pending
+    of them queued, and concurrent lookups of the same mention with the same constraints share one lookup.
+    """
+    def __init__(self, linker=None, workers=ASYNC_WORKERS, max_pending=ASYNC_MAX_PENDING, **linker_args):
+        self.linker = linker if linker is not None else EntityLinker(**linker_args)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='linker')
+        self.max_pending = max_pending
+        self.pending = None
+        self.in_flight = {}
+        self.coalesced = 0
+    
+    async def run(self, func, *args):
+        if self.pending is None:
+            # Created here to be bound to the running event loop
+            self.pending = asyncio.Semaphore(self.max_pending)
+        async with self.pending:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+    
+    async def link_entity(self, mention, class_name=None, property_name=None, fuzzy=False, top_k=None,
+                          with_scores=False):
+        key = (normalize_mention(mention), class_name, property_name, fuzzy, top_k, with_scores)
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(self.run(self.linker.link_entity, *key))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shielded, so that a cancelled request does not cancel the lookup shared with the others
+        return list(await asyncio.shield(future))
+    
+    async def link_entities(self, mentions, class_name=None, property_name=None, fuzzy=False, top_k=None,
+                            with_scores=False):
+        return list(await asyncio.gather(*(self.link_entity(mention, class_name, property_name, fuzzy, top_k,
+                                                            with_scores)
+                                           for mention in mentions)))
+    
+    async def detect_mentions(self, text, longest=False, class_name=None, property_name=None):
+        return await self.run(self.linker.detect_mentions, text, longest, class_name, property_name)
+    
+    def close(self):
+        self.executor.shutdown()
+
+
+if __name__ == '__main__':
+    init_logging()
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lang', default='en')
+    parser.add_argument('--serve', action='store_true', help="Run the HTTP/JSON linking service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=ASYNC_WORKERS, help="Lookup threads of the service")
+    parser.add_argument('--cache-entries', type=int, default=None)
+    parser.add_argument('--gazetteer-backend', choices=('sqlite', 'static'), default='sqlite')
+    args = parser.parse_args()
+    
+    linker = EntityLinker(args.lang, cache_entries=args.cache_entries, gazetteer_backend=args.gazetteer_backend)
+    if args.serve:
+        from wd_semantic_parsing.wikidata.linking_server import serve
+        serve(AsyncEntityLinker(linker, workers=args.workers), args.host, args.port)
+    else:
+        interactive(lambda line: print(linker.link_entity(line)),
+                    history_name='linker')
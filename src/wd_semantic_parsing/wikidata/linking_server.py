@@ -0,0 +1,160 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Minimal HTTP/JSON entity linking service on asyncio, with keep-alive connections, run with:
+
+    python src/wd_semantic_parsing/wikidata/linker.py --serve --port 8080
+
+POST /link    {"mention": "Paris", "class_name": "Q515", "property_name": null, "fuzzy": false}
+              -> {"candidates": ["Q90", ...]}
+              {"mention": "Paris", "top_k": 2, "with_scores": true} -> {"candidates": [["Q90", 16051], ...]}
+              {"mentions": ["Paris", "Rome"], ...} -> {"candidates": [["Q90", ...], ["Q220", ...]]}
+POST /detect  {"text": "Where is Paris?", "longest": true, "class_name": null, "property_name": null}
+              -> {"mentions": [{"start": 9, "end": 14, "candidates": ["Q90", ...]}]}
+GET /health   -> {"status": "ok"}
+
+The body of a POST can also be a list of requests, answered with the list of their responses.
+"""
+import asyncio
+import logging
+
+from wd_semantic_parsing import codec
+
+
+MAX_BODY_SIZE = 1 << 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def get_constraint(request, name):
+    """A class or property constraint of the request, which is a string or null."""
+    value = request.get(name)
+    if value is not None and not isinstance(value, str):
+        raise RequestError(400, f"'{name}' must be a string or null")
+    return value
+
+
+class LinkingServer:
+    def __init__(self, linker):
+        self.linker = linker
+        self.handlers = {'/link': self.link, '/detect': self.detect}
+        self.requests = 0
+    
+    async def link(self, request):
+        top_k = request.get('top_k')
+        if top_k is not None and (not isinstance(top_k, int) or top_k < 0):
+            raise RequestError(400, "'top_k' must be a non-negative integer")
+        constraints = dict(class_name=get_constraint(request, 'class_name'),
+                           property_name=get_constraint(request, 'property_name'),
+                           fuzzy=bool(request.get('fuzzy', False)), top_k=top_k,
+                           with_scores=bool(request.get('with_scores', False)))
+        if 'mentions' in request:
+            if not isinstance(request['mentions'], list) or not all(isinstance(m, str) for m in request['mentions']):
+                raise RequestError(400, "'mentions' must be a list of strings")
+            return {'candidates': await self.linker.link_entities(request['mentions'], **constraints)}
+        if not isinstance(request.get('mention'), str):
+            raise RequestError(400, "'mention' or 'mentions' is required")
+        return {'candidates': await self.linker.link_entity(request['mention'], **constraints)}
+    
+    async def detect(self, request):
+        if not isinstance(request.get('text'), str):
+            raise RequestError(400, "'text' is required")
+        mentions = await self.linker.detect_mentions(request['text'], bool(request.get('longest', False)),
+                                                     get_constraint(request, 'class_name'),
+                                                     get_constraint(request, 'property_name'))
+        return {'mentions': [{'start': start, 'end': end, 'candidates': candidates}
+                             for start, end, candidates in mentions]}
+    
+    async def dispatch(self, method, target, body):
+        """Status and JSON response of a request."""
+        route = target.split('?', 1)[0]
+        if route == '/health':
+            return 200, {'status': 'ok'}
+        if route not in self.handlers:
+            raise RequestError(404, f"Unknown path {route}")
+        if method != 'POST':
+            raise RequestError(405, "Only POST is supported")
+        
+        try:
+            request = codec.loads(body)
+        except ValueError as e:
+            raise RequestError(400, f"Invalid JSON: {e}")
+        
+        handler = self.handlers[route]
+        if isinstance(request, list):
+            if not all(isinstance(item, dict) for item in request):
+                raise RequestError(400, "A batch must be a list of JSON objects")
+            return 200, list(await asyncio.gather(*(handler(item) for item in request)))
+        if not isinstance(request, dict):
+            raise RequestError(400, "The request must be a JSON object or a list of JSON objects")
+        return 200, await handler(request)
+    
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                
+                try:
+                    length = int(headers.get('content-length', 0))
+                    if length > MAX_BODY_SIZE:
+                        raise RequestError(413, f"The body is larger than {MAX_BODY_SIZE} bytes")
+                    body = await reader.readexactly(length)
+                    status, response = await self.dispatch(method, target, body)
+                except RequestError as e:
+                    status, response = e.status, {'error': str(e)}
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    logging.exception(f"Failed request {method} {target}")
+                    status, response = 500, {'error': str(e)}
+                self.requests += 1
+                
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                              and status != 413)
+                payload = codec.dumpb(response)
+                writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                             b'Connection: %s\r\n\r\n' % (status, REASONS[status].encode(), len(payload),
+                                                          b'keep-alive' if keep_alive else b'close') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def serve_forever(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logging.info(f"Entity linking service listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def serve(linker, host='127.0.0.1', port=8080):
+    """Serves an AsyncEntityLinker until interrupted."""
+    try:
+        asyncio.run(LinkingServer(linker).serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        linker.close()
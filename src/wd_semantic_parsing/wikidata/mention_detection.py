@@ -0,0 +1,173 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Detection of the gazetteer denotationals occurring in a text, in one pass with an Aho-Corasick automaton.
+
+The automaton of pyahocorasick is used when it is installed (pip install pyahocorasick), otherwise a pure
+Python one with the same interface, for at most MAX_PYTHON_AUTOMATON_KEYS keys. Both are pickled to
+gazetteer.automaton, so that they are only compiled again when the gazetteer is rebuilt.
+"""
+import logging
+import os
+import pickle
+from collections import deque
+from os import path
+
+from wd_semantic_parsing.wikidata import WIKIDATA_DIR
+
+
+AUTOMATON_PATH = path.join(WIKIDATA_DIR, 'gazetteer.automaton')
+# The pure Python automaton takes hundreds of bytes per character of the keys, far too much for a full gazetteer
+MAX_PYTHON_AUTOMATON_KEYS = 1000000
+
+
+def normalize_mention(mention):
+    return mention.strip().lower()
+
+
+class Automaton:
+    """
+    Pure Python Aho-Corasick automaton, with the subset of the interface of ahocorasick.Automaton used here:
+    add_word(word, value), make_automaton() and iter(text), which yields the (end index, value) of every match.
+    """
+    def __init__(self):
+        self.transitions = [{}]
+        self.values = [None]
+        self.fail = [0]
+        # Next state along the failure links holding a value
+        self.output = [0]
+    
+    def add_word(self, word, value):
+        state = 0
+        for char in word:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][char] = next_state
+                self.transitions.append({})
+                self.values.append(None)
+            state = next_state
+        self.values[state] = value
+    
+    def make_automaton(self):
+        transitions, values = self.transitions, self.values
+        self.fail = fail = [0] * len(transitions)
+        self.output = output = [0] * len(transitions)
+        queue = deque(transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in transitions[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in transitions[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = failure = transitions[fallback].get(char, 0) if state else 0
+                output[next_state] = failure if values[failure] is not None else output[failure]
+    
+    def iter(self, text):
+        transitions, values, fail, output = self.transitions, self.values, self.fail, self.output
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            match = state if values[state] is not None else output[state]
+            while match:
+                yield end, values[match]
+                match = output[match]
+
+
+def build_automaton(keys, max_python_keys=MAX_PYTHON_AUTOMATON_KEYS):
+    """
+    Automaton of the keys, normalized as the mentions are linked, whose matches have the length of the key as value.
+    Without pyahocorasick, more than max_python_keys keys raise an ImportError.
+    """
+    try:
+        import ahocorasick
+        automaton = ahocorasick.Automaton()
+    except ImportError:
+        logging.warning("pyahocorasick is not installed, using the pure Python automaton")
+        automaton = Automaton()
+    
+    for i, key in enumerate(keys, 1):
+        if i % 1000000 == 0:
+            logging.info(f"Added {i} keys to the automaton")
+        if i > max_python_keys and isinstance(automaton, Automaton):
+            raise ImportError(f"Detecting the mentions of more than {max_python_keys} denotationals requires the "
+                              f"pyahocorasick module: pip install pyahocorasick")
+        # Otherwise keys with leading or trailing spaces would match mentions linked to other keys, or none
+        key = normalize_mention(key)
+        if key:
+            automaton.add_word(key, len(key))
+    automaton.make_automaton()
+    return automaton
+
+
+def get_automaton(gazetteer, automaton_path=AUTOMATON_PATH):
+    """The automaton of the gazetteer keys, compiled and saved if missing or older than the gazetteer."""
+    if path.exists(automaton_path) and path.getmtime(automaton_path) >= path.getmtime(gazetteer.filepath):
+        with open(automaton_path, 'rb') as f:
+            return pickle.load(f)
+    
+    logging.info("Building the mention automaton")
+    automaton = build_automaton(gazetteer.iterkeys())
+    # Each process writes its own temporary file, the last one moved in place wins
+    tmp_path = f'{automaton_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(automaton, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, automaton_path)
+    return automaton
+
+
+def lower_with_offsets(text):
+    """The lowercase text, and the offsets in the text of its characters when lowercasing changed its length."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered, None
+    
+    offsets = []
+    for i, char in enumerate(text):
+        offsets.extend([i] * len(char.lower()))
+    offsets.append(len(text))
+    return lowered, offsets
+
+
+def is_boundary(text, i):
+    """Whether a word can start or end between text[i - 1] and text[i]."""
+    return i <= 0 or i >= len(text) or not (text[i - 1].isalnum() and text[i].isalnum())
+
+
+def find_matches(automaton, text, longest=False):
+    """
+    (start, end) spans of the lowercase text matching keys of the automaton at word boundaries, ordered by
+    start then end. With longest, only the leftmost longest matches, which do not overlap, are kept.
+    """
+    spans = []
+    if not text:
+        return spans
+    for last, length in automaton.iter(text):
+        start, end = last + 1 - length, last + 1
+        if is_boundary(text, start) and is_boundary(text, end):
+            spans.append((start, end))
+    spans.sort()
+    
+    if longest:
+        selected, covered = [], 0
+        for start, end in sorted(spans, key=lambda span: (span[0], -span[1])):
+            if start >= covered:
+                selected.append((start, end))
+                covered = end
+        spans = selected
+    return spans
+
+
+def detect_mentions(automaton, text, longest=False):
+    """(start, end, mention) of the gazetteer denotationals found in the text, with offsets in the text."""
+    lowered, offsets = lower_with_offsets(text)
+    mentions = []
+    for start, end in find_matches(automaton, lowered, longest):
+        mention = lowered[start:end]
+        if offsets is not None:
+            start, end = offsets[start], offsets[end]
+        mentions.append((start, end, mention))
+    return mentions
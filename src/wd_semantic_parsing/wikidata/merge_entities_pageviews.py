@@ -1,9 +1,12 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import argparse
 import logging
+from operator import itemgetter
 
 from wd_semantic_parsing.wikidata import WIKIDATA_ENTITIES, WIKIDATA_PAGEVIEWS, WIKIDATA_ENTITIES_WITH_PAGEVIEWS
-from wd_semantic_parsing.utils import init_logging, get_json_lines, load_dict, JsonEntries
+from wd_semantic_parsing.external_sort import ExternalSorter
+from wd_semantic_parsing.utils import init_logging, get_json_lines, load_dict, load_dict_pairs, JsonEntries
 
 
 def find_pageviews(pageviews, entity, lang):
@@ -17,7 +20,71 @@ def find_pageviews(pageviews, entity, lang):
     return pageviews[page_title]
 
 
-def merge_entities_pageviews(lang='en', skip_missing=True):
+def entity_titles(lang):
+    for line_no, entity in enumerate(get_json_lines(WIKIDATA_ENTITIES)):
+        if (line_no % 100000) == 0: logging.info(f"Collected Titles: {line_no}")
+        if lang in entity['wiki_title']:
+            yield entity['wiki_title'][lang].replace(' ', '_'), line_no
+
+
+def unique_pages(sorted_pageviews):
+    # As in load_dict, the last count of a duplicated page wins
+    previous = None
+    for page, views in sorted_pageviews:
+        if previous is not None and previous[0] != page:
+            yield previous
+        previous = (page, views)
+    if previous is not None:
+        yield previous
+
+
+def join_pageviews(sorted_titles, sorted_pageviews):
+    """Merge-join of two streams sorted by page title, yielding (line_no, views) for the entities with pageviews."""
+    pageviews = unique_pages(sorted_pageviews)
+    page, views = next(pageviews, (None, None))
+    for title, line_no in sorted_titles:
+        while page is not None and page < title:
+            page, views = next(pageviews, (None, None))
+        if page == title:
+            yield line_no, views
+
+
+def merge_entities_pageviews_external(lang='en', skip_missing=True, memory_budget=1 << 30):
+    """
+    Same output as merge_entities_pageviews, without loading the pageviews in memory.
+    Entity titles and pageviews are externally sorted by title and merge-joined, then the (line, pageviews) pairs
+    are sorted back by line and zipped with a second pass over the entities.
+    Each of the three sorters buffers at most a third of the memory budget: the titles and the pageviews are
+    still held while the join fills the third one, even though their records are released as they are read.
+    """
+    budget = memory_budget // 3
+    titles = ExternalSorter(budget, key=itemgetter(0)).extend(entity_titles(lang))
+    pageviews = ExternalSorter(budget, key=itemgetter(0)).extend(load_dict_pairs(WIKIDATA_PAGEVIEWS))
+    logging.info(f"Sorted {titles.count} titles and {pageviews.count} pageviews.")
+    
+    lines_pageviews = ExternalSorter(budget, key=itemgetter(0)).extend(join_pageviews(titles, pageviews))
+    logging.info(f"Found pageviews for {lines_pageviews.count} entities.")
+    
+    lines_pageviews = iter(lines_pageviews)
+    next_line, next_views = next(lines_pageviews, (None, None))
+    entities = JsonEntries(WIKIDATA_ENTITIES_WITH_PAGEVIEWS)
+    for line_no, entity in enumerate(get_json_lines(WIKIDATA_ENTITIES)):
+        if ((line_no + 1) % 100000) == 0: logging.info(f"Processed Entities: {line_no + 1}")
+        
+        if line_no == next_line:
+            entity['pageviews'] = next_views
+            next_line, next_views = next(lines_pageviews, (None, None))
+        elif skip_missing:
+            continue
+        
+        entities.save_entry(entity)
+    entities.close()
+
+
+def merge_entities_pageviews(lang='en', skip_missing=True, memory_budget=None):
+    if memory_budget is not None:
+        return merge_entities_pageviews_external(lang, skip_missing, memory_budget)
+    
     pageviews = load_dict(WIKIDATA_PAGEVIEWS, is_counter=True)
     entities = JsonEntries(WIKIDATA_ENTITIES_WITH_PAGEVIEWS)
     for i, entity in enumerate(get_json_lines(WIKIDATA_ENTITIES), 1):
@@ -35,4 +102,10 @@ def merge_entities_pageviews(lang='en', skip_missing=True):
 
 if __name__ == '__main__':
     init_logging()
-    merge_entities_pageviews()
+    
+    parser = argparse.ArgumentParser("Merge Wikidata Entities and Pageviews")
+    parser.add_argument('--lang', default='en')
+    parser.add_argument('--memory-budget', type=int, help="Memory budget in MB, enables the low-memory external merge.")
+    args = parser.parse_args()
+    
+    merge_entities_pageviews(args.lang, memory_budget=args.memory_budget and args.memory_budget << 20)
@@ -1,25 +1,30 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import argparse
+import json
+import os
 from os import path
 import gzip
 from collections import Counter
 from datetime import datetime, timedelta
 import logging
 
-from wd_semantic_parsing.wikidata import WIKIDATA_PAGEVIEWS_URL, WIKIDATA_PAGEVIEWS_DIR, WIKIDATA_PAGEVIEWS
-from wd_semantic_parsing.utils import init_logging, dates, dump_counter, load_dict, mkdir, format_date, wget
+from wd_semantic_parsing.wikidata import WIKIDATA_PAGEVIEWS_URL, WIKIDATA_PAGEVIEWS_DIR, WIKIDATA_PAGEVIEWS, WIKIDATA_PAGEVIEWS_WINDOW
+from wd_semantic_parsing.sorted_table import CountTable, write_count_table, sum_sorted_counts
+from wd_semantic_parsing.utils import init_logging, dates, dump_count_items, mkdir, format_date, parse_date, parallel_map, wget
 
 
 PAGEVIEWS_FILE = 'pageviews-%Y%m%d-%%02d0000.gz'
 NUM_DAYS = 7
 
 
-def load_views(filepath, url, domain_code='en'):
-    logging.info("Extracting pageviews from: %s" % filepath)
-    counter_cache = "%s_%s.counter" % (filepath, domain_code)
-    if path.exists(counter_cache):
-        return load_dict(counter_cache, is_counter=True)
+def count_views(filepath, url, domain_code='en'):
+    """Counts the pageviews of an hourly file into a sorted count table, and returns the table path."""
+    views_table = "%s_%s.views" % (filepath, domain_code)
+    if path.exists(views_table):
+        return views_table
     
+    logging.info("Extracting pageviews from: %s" % filepath)
     if not path.exists(filepath):
         wget(url, filepath)
     
@@ -31,41 +36,155 @@ def load_views(filepath, url, domain_code='en'):
         domain, page, count, _ = tokens
         if domain != domain_code: continue
         views[page] += int(count)
-    dump_counter(counter_cache, views)
-    return views
+    write_count_table(views_table, views)
+    return views_table
 
 
-def get_dayly_pageviews(date, domain_code='en'):
-    logging.info("Getting pageviews for: %s" % date)
-    views_file = path.join(WIKIDATA_PAGEVIEWS_DIR, '%s_views.daily' % format_date(date))
-    if path.exists(views_file):
-        return load_dict(views_file, is_counter=True)
-    
-    views = Counter()
+def load_views(filepath, url, domain_code='en'):
+    return CountTable(count_views(filepath, url, domain_code))
+
+
+def daily_views_file(date, domain_code='en'):
+    return path.join(WIKIDATA_PAGEVIEWS_DIR, '%s_%s.views' % (format_date(date), domain_code))
+
+
+def hourly_files(date):
     url_base = date.strftime(WIKIDATA_PAGEVIEWS_URL)
     file_base = date.strftime(PAGEVIEWS_FILE)
     for hour in range(0, 24):
         filename = file_base % hour
-        url = url_base + filename
-        filepath = path.join(WIKIDATA_PAGEVIEWS_DIR, filename)
-        views += load_views(filepath, url, domain_code)
-    dump_counter(views_file, views)
-    return views
+        yield url_base + filename, path.join(WIKIDATA_PAGEVIEWS_DIR, filename)
+
+
+def count_hourly_views(task):
+    url, filepath, domain_code = task
+    return count_views(filepath, url, domain_code)
+
+
+def merge_dayly_views(task):
+    date, domain_code = task
+    logging.info("Merging pageviews of: %s" % date)
+    hourly_views = [load_views(filepath, url, domain_code) for url, filepath in hourly_files(date)]
+    write_count_table(daily_views_file(date, domain_code), sum_sorted_counts(*(views.items() for views in hourly_views)), presorted=True)
+    return date
+
+
+def get_dayly_pageviews_tables(days, domain_code='en', workers=1):
+    """
+    Returns the pageviews count table of each of the days.
+    The hourly files of all the missing days are counted by the same pool of workers, each into a table sorted by
+    page title, then the 24 tables of each day are merged by a streaming k-way merge, without building any Counter.
+    """
+    missing_days = [date for date in days if not path.exists(daily_views_file(date, domain_code))]
+    
+    tasks = [(url, filepath, domain_code) for date in missing_days for url, filepath in hourly_files(date)]
+    for _ in parallel_map(count_hourly_views, tasks, workers, ordered=False):
+        pass
+    
+    tasks = [(date, domain_code) for date in missing_days]
+    for _ in parallel_map(merge_dayly_views, tasks, workers, ordered=False):
+        pass
+    
+    return [CountTable(daily_views_file(date, domain_code)) for date in days]
 
 
-def download_pageviews_data(domain_code='en'):
+def get_dayly_pageviews(date, domain_code='en', workers=1):
+    """Counter of the pageviews of the day, see get_dayly_pageviews_tables to read them without loading them."""
+    logging.info("Getting pageviews for: %s" % date)
+    with get_dayly_pageviews_tables([date], domain_code, workers)[0] as views:
+        return Counter(dict(views.items()))
+
+
+def load_window_days(domain_code):
+    window_days = WIKIDATA_PAGEVIEWS_WINDOW + '.json'
+    if not path.exists(WIKIDATA_PAGEVIEWS_WINDOW) or not path.exists(window_days):
+        return None
+    
+    with open(window_days) as f:
+        window = json.load(f)
+    if window['domain_code'] != domain_code:
+        return None
+    return window['days']
+
+
+def save_window_days(days, domain_code):
+    window_days = WIKIDATA_PAGEVIEWS_WINDOW + '.json'
+    with open(window_days + '.tmp', 'w') as f:
+        json.dump({'domain_code': domain_code, 'days': [format_date(date) for date in days]}, f)
+    os.replace(window_days + '.tmp', window_days)
+
+
+def write_window(counts, days, domain_code):
+    """
+    Writes the window total from sorted (page, count) pairs, then the days it sums.
+    The days are removed first, so a window interrupted before they are saved is recomputed, never updated twice.
+    """
+    window_days = WIKIDATA_PAGEVIEWS_WINDOW + '.json'
+    if path.exists(window_days):
+        os.remove(window_days)
+    write_count_table(WIKIDATA_PAGEVIEWS_WINDOW, counts, presorted=True)
+    save_window_days(days, domain_code)
+
+
+def update_window(window_days, days, domain_code='en', workers=1):
+    """
+    Slides the window total to the given days, adding the pageviews of the new days and subtracting
+    the ones of the days that fell out of the window, so only the titles of those days are updated.
+    Returns False when the update is not possible and the window has to be recomputed.
+    """
+    current_days = {format_date(date): date for date in days}
+    added_days = [date for day, date in current_days.items() if day not in window_days]
+    removed_days = [parse_date(day) for day in window_days if day not in current_days]
+    if not added_days and not removed_days:
+        return True
+    if len(removed_days) == len(window_days):
+        return False
+    if any(not path.exists(daily_views_file(date, domain_code)) for date in removed_days):
+        return False
+    
+    logging.info(f"Adding {len(added_days)} days to the pageviews window, removing {len(removed_days)} days.")
+    added_views = get_dayly_pageviews_tables(added_days, domain_code, workers)
+    removed_views = [CountTable(daily_views_file(date, domain_code)) for date in removed_days]
+    delta = sum_sorted_counts(*(views.items() for views in added_views),
+                              *(((page, -count) for page, count in views.items()) for views in removed_views))
+    delta = [(page, count) for page, count in delta if count != 0]
+    logging.info(f"Updating the pageviews of {len(delta)} titles.")
+    
+    window = CountTable(WIKIDATA_PAGEVIEWS_WINDOW)
+    updated = ((page, count) for page, count in sum_sorted_counts(window.items(), delta) if count > 0)
+    write_window(updated, days, domain_code)
+    return True
+
+
+def download_pageviews_data(domain_code='en', workers=1, export_tsv=False, num_days=NUM_DAYS, incremental=False):
     mkdir(WIKIDATA_PAGEVIEWS_DIR)
     end_date = datetime.now() - timedelta(days=1)
-    start_date = end_date - timedelta(days=(NUM_DAYS - 1))
-    views = Counter()
+    start_date = end_date - timedelta(days=(num_days - 1))
     days = list(dates(start_date, end_date))
     days.reverse()
-    for date in days:
-        views += get_dayly_pageviews(date, domain_code)
     
-    dump_counter(WIKIDATA_PAGEVIEWS, views)
+    window_days = load_window_days(domain_code) if incremental else None
+    if window_days is None or not update_window(window_days, days, domain_code, workers):
+        dayly_views = get_dayly_pageviews_tables(days, domain_code, workers)
+        write_window(sum_sorted_counts(*(views.items() for views in dayly_views)), days, domain_code)
+    
+    if export_tsv:
+        for date in days:
+            views = CountTable(daily_views_file(date, domain_code))
+            dump_count_items(views.filepath + '.tsv', views.items())
+    
+    dump_count_items(WIKIDATA_PAGEVIEWS, CountTable(WIKIDATA_PAGEVIEWS_WINDOW).items())
 
 
 if __name__ == '__main__':
     init_logging()
-    download_pageviews_data()
+    
+    parser = argparse.ArgumentParser("Download Wikipedia Pageviews")
+    parser.add_argument('--domain', default='en', help="Wikipedia domain code.")
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes counting the hourly files.")
+    parser.add_argument('--export-tsv', action='store_true', help="Also export the daily counts as tab-separated files.")
+    parser.add_argument('--days', type=int, default=NUM_DAYS, help="Number of days in the pageviews window.")
+    parser.add_argument('--incremental', action='store_true', help="Slide the previous window instead of summing all its days again.")
+    args = parser.parse_args()
+    
+    download_pageviews_data(args.domain, args.workers, args.export_tsv, args.days, args.incremental)
@@ -0,0 +1,212 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Prefix search over the gazetteer denotationals, for type-ahead entity suggestions.
+
+Two memory-mapped tables are built from the denotationals in the order of iter_denotationals:
+- gazetteer.suggest: the candidates of every denotational with their pageviews, as (qid, pageviews) pairs;
+- gazetteer.prefixes: the top entities of every prefix shared by more than PREFIX_MIN_DENOTATIONALS
+  denotationals: whether the list was cut to the top k, then (denotational index, qid, pageviews) triples.
+Popular prefixes are answered from their precomputed list, the others by scanning their range of
+denotationals, so that a search scans at most PREFIX_MIN_DENOTATIONALS denotationals. Searches for more
+than PREFIX_TOP_K entities of a popular prefix only return its precomputed ones. Prefixes longer than
+MAX_PREFIX_LENGTH are answered from the list of their first MAX_PREFIX_LENGTH characters when it has k
+entities of denotationals starting with them, and otherwise by scanning their range, however large.
+"""
+import heapq
+import logging
+from os import path
+
+from wd_semantic_parsing.wikidata import WIKIDATA_DIR
+from wd_semantic_parsing.wikidata.entity_db import numeric_id, ID_TYPECODE
+from wd_semantic_parsing.sorted_table import ArrayTable, SortedTableWriter
+
+
+SUGGEST_PATH = path.join(WIKIDATA_DIR, 'gazetteer.suggest')
+PREFIXES_PATH = path.join(WIKIDATA_DIR, 'gazetteer.prefixes')
+PREFIX_MIN_DENOTATIONALS = 256
+# Number of entities precomputed for a prefix, and the most returned for it
+PREFIX_TOP_K = 20
+# Longer prefixes are counted in the one of this length, see PrefixSearch.search
+MAX_PREFIX_LENGTH = 32
+MAX_PAGEVIEWS = (1 << 32) - 1
+# Above any byte of a UTF-8 string, so that the keys starting with a prefix are lower than prefix + KEY_END
+KEY_END = b'\xff'
+
+
+class SuggestTable(ArrayTable):
+    MAGIC = b'WDSUGGS1'
+    ITEM_TYPECODE = ID_TYPECODE
+
+
+class PrefixTable(ArrayTable):
+    MAGIC = b'WDPREFX1'
+    ITEM_TYPECODE = ID_TYPECODE
+
+
+class TopEntities:
+    """The k entities with the most pageviews, each with the first denotational it was added with."""
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+        self.qids = set()
+        self.count = 0
+        # Whether entities were left out
+        self.truncated = False
+    
+    def add(self, views, qid, index):
+        """Adds an entity, returns False when it has too few pageviews to be in the top k."""
+        if qid in self.qids:
+            return True
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (views, -index, qid))
+        elif views > self.heap[0][0]:
+            _, _, evicted = heapq.heapreplace(self.heap, (views, -index, qid))
+            self.qids.discard(evicted)
+            self.truncated = True
+        else:
+            self.truncated = True
+            return False
+        self.qids.add(qid)
+        return True
+    
+    def add_candidates(self, index, candidates):
+        """Adds the (qid, pageviews) candidates of a denotational, sorted by decreasing pageviews."""
+        self.count += 1
+        for qid, views in candidates:
+            if not self.add(views, qid, index):
+                break
+    
+    def top(self):
+        """(pageviews, qid, denotational index) by decreasing pageviews."""
+        return [(views, qid, -neg_index) for views, neg_index, qid in sorted(self.heap, reverse=True)]
+
+
+class PrefixSearchWriter:
+    """
+    Builds the prefix search tables from the (denotational, [(entity, pageviews), ...]) items of
+    iter_denotationals(with_pageviews=True), added in order.
+    
+    The denotationals sharing a prefix are contiguous, so the top entities of a prefix are collected while
+    its range is read, from its own denotational and from the top entities of its longer prefixes.
+    """
+    def __init__(self, suggest_path=SUGGEST_PATH, prefixes_path=PREFIXES_PATH, top_k=PREFIX_TOP_K,
+                 min_denotationals=PREFIX_MIN_DENOTATIONALS):
+        self.prefixes_path = prefixes_path
+        self.top_k = top_k
+        self.min_denotationals = min_denotationals
+        self.suggest = SortedTableWriter(suggest_path, SuggestTable)
+        # Prefixes of the last denotational, with the top entities of their range so far
+        self.open_prefixes = []
+        self.prefixes = []
+    
+    def add(self, denotational, entities):
+        index = len(self.suggest)
+        candidates = [(numeric_id(entity), min(views, MAX_PAGEVIEWS)) for entity, views in entities]
+        self.suggest.add(denotational, (item for candidate in candidates for item in candidate))
+        
+        prefix = denotational[:MAX_PREFIX_LENGTH]
+        shared = 0
+        while (shared < len(self.open_prefixes) and shared < len(prefix)
+               and self.open_prefixes[shared][0] == prefix[:shared + 1]):
+            shared += 1
+        self.close_prefixes(shared)
+        for length in range(shared + 1, len(prefix) + 1):
+            self.open_prefixes.append((prefix[:length], TopEntities(self.top_k)))
+        
+        if self.open_prefixes:
+            self.open_prefixes[-1][1].add_candidates(index, candidates)
+    
+    def close_prefixes(self, length):
+        """Closes the open prefixes longer than length, passing their top entities to the shorter ones."""
+        while len(self.open_prefixes) > length:
+            prefix, top = self.open_prefixes.pop()
+            entities = top.top()
+            if self.open_prefixes:
+                parent = self.open_prefixes[-1][1]
+                parent.count += top.count
+                parent.truncated |= top.truncated
+                for views, qid, index in entities:
+                    if not parent.add(views, qid, index):
+                        break
+            if top.count > self.min_denotationals:
+                self.prefixes.append((prefix, [int(top.truncated)] + [item for views, qid, index in entities
+                                                                      for item in (index, qid, views)]))
+    
+    def close(self):
+        self.close_prefixes(0)
+        self.suggest.close()
+        
+        logging.info(f"Prefix search: {len(self.suggest)} denotationals, {len(self.prefixes)} precomputed prefixes")
+        with SortedTableWriter(self.prefixes_path, PrefixTable, hash_index=True) as writer:
+            for prefix, items in sorted(self.prefixes, key=lambda prefix_items: prefix_items[0]):
+                writer.add(prefix, items)
+        self.prefixes = []
+
+
+class PrefixSearch:
+    """Top entities by pageviews of the denotationals starting with a prefix, from the memory-mapped tables."""
+    def __init__(self, suggest_path=SUGGEST_PATH, prefixes_path=PREFIXES_PATH):
+        self.suggest = SuggestTable(suggest_path)
+        self.prefixes = PrefixTable(prefixes_path)
+    
+    def search(self, prefix, k=10):
+        """
+        Up to k (denotational, QID, pageviews) suggestions, by decreasing pageviews. The precomputed prefixes
+        return at most the PREFIX_TOP_K entities of their list, longer prefixes are scanned for more.
+        """
+        prefix = prefix.lstrip().lower()
+        if not prefix:
+            return []
+        
+        if len(prefix) > MAX_PREFIX_LENGTH:
+            # When many denotationals start with it, answered from the list of its first MAX_PREFIX_LENGTH
+            # characters if it has k entities added with a denotational starting with it, otherwise scanned
+            start, end = self.range(prefix)
+            i = self.prefixes.find(prefix[:MAX_PREFIX_LENGTH])
+            if end - start > PREFIX_MIN_DENOTATIONALS and i >= 0:
+                suggestions = self.precomputed(i, k, prefix)
+                if len(suggestions) == k:
+                    return suggestions
+            return self.scan(prefix, k)
+        
+        i = self.prefixes.find(prefix)
+        if i >= 0:
+            return self.precomputed(i, k)
+        return self.scan(prefix, k)
+    
+    def range(self, prefix):
+        """Start and end indices of the denotationals starting with the prefix."""
+        prefix_bytes = prefix.encode('utf-8')
+        return self.suggest.bisect(prefix_bytes), self.suggest.bisect(prefix_bytes + KEY_END)
+    
+    def precomputed(self, i, k, prefix=None):
+        """First k entities of the list of the i-th prefix, with prefix only those of denotationals starting with it."""
+        items = self.prefixes.array(i)[1:]
+        suggestions = []
+        for j in range(0, len(items), 3):
+            if len(suggestions) == k:
+                break
+            denotational = self.suggest.key(items[j])
+            if prefix is None or denotational.startswith(prefix):
+                suggestions.append((denotational, 'Q%d' % items[j + 1], items[j + 2]))
+        return suggestions
+    
+    def scan(self, prefix, k):
+        """Search by scanning the range of denotationals starting with the prefix."""
+        start, end = self.range(prefix)
+        top = TopEntities(k)
+        for index in range(start, end):
+            items = self.suggest.array(index)
+            top.add_candidates(index, zip(items[::2], items[1::2]))
+        return [(self.suggest.key(index), 'Q%d' % qid, views) for views, qid, index in top.top()]
+    
+    def close(self):
+        self.suggest.close()
+        self.prefixes.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *_):
+        self.close()
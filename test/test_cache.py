@@ -0,0 +1,99 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from wd_semantic_parsing.utils import LRUCache, CachedStore, JsonSQLite
+from wd_semantic_parsing.wikidata.gazetteer import Gazetteer
+
+
+def test_lru_cache():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    # b was the least recently used
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert cache.stats() == {'entries': 2, 'bytes': 0, 'hits': 2, 'misses': 1, 'evictions': 1}
+
+
+def test_lru_cache_bytes():
+    cache = LRUCache(max_bytes=100, sizeof=len)
+    cache.put('a', 'x' * 60)
+    cache.put('b', 'x' * 30)
+    cache.put('c', 'x' * 30)
+    assert len(cache) == 2 and cache.get('a') is None
+    cache.put('d', 'x' * 200)
+    assert len(cache) == 0 and cache.stats()['evictions'] == 4
+
+
+def build(filepath, items):
+    with JsonSQLite(filepath + '.tmp', bulk_load=True) as db:
+        db.write_many(items)
+    os.replace(filepath + '.tmp', filepath)
+
+
+def test_cached_store_rebuild(tmp_path):
+    filepath = str(tmp_path / 'store.sqlite3')
+    build(filepath, [('a', 1), ('b', 2)])
+    
+    store = CachedStore(JsonSQLite(filepath, read_only=True), LRUCache(max_entries=10), check_interval=0)
+    assert store.read('a') == 1
+    assert store.read_many(['a', 'b', 'c']) == {'a': 1, 'b': 2}
+    assert store.read('c') is None
+    assert store.cache.stats()['hits'] == 2
+    
+    build(filepath, [('a', 10), ('c', 3)])
+    assert store.read_many(['a', 'b', 'c']) == {'a': 10, 'c': 3}
+    assert store.generation == 1
+    store.close()
+
+
+def test_cached_store_threads(tmp_path):
+    filepath = str(tmp_path / 'store.sqlite3')
+    build(filepath, [('a', 1), ('b', 2)])
+    store = CachedStore(JsonSQLite(filepath, read_only=True), LRUCache(max_entries=10), check_interval=0)
+    assert store.read('a') == 1
+    
+    reopens = []
+    reopen = store.store.reopen
+    
+    def slow_reopen():
+        reopens.append(threading.get_ident())
+        # Gives the other threads the time to find the rebuilt file too
+        time.sleep(0.05)
+        reopen()
+    
+    store.store.reopen = slow_reopen
+    build(filepath, [('a', 10), ('b', 20)])
+    with ThreadPoolExecutor(8) as executor:
+        values = list(executor.map(lambda key: store.read(key), ['a', 'b'] * 16))
+    # Reopened once, and no value of the old file cached after it
+    assert len(reopens) == 1 and store.generation == 1
+    assert values == [10, 20] * 16
+    assert store.read_many(['a', 'b']) == {'a': 10, 'b': 20}
+    store.close()
+
+
+def test_cached_read_head(tmp_path):
+    filepath = str(tmp_path / 'gazetteer.sqlite3')
+    with Gazetteer(filepath) as db:
+        db.write_many([('paris', [('Q90', 800), ('Q167646', 50)])])
+    
+    store = CachedStore(Gazetteer(filepath, read_only=True), LRUCache(max_entries=10), check_interval=0)
+    assert list(store.read_head('paris', 1)) == [90, 800]
+    assert list(store.read_head('paris', 1)) == [90, 800]
+    assert list(store.read_head('paris')) == [90, 800, 167646, 50]
+    assert store.read_head('rome') is None
+    assert store.cache.stats()['hits'] == 1
+    
+    with Gazetteer(filepath + '.tmp') as db:
+        db.write_many([('paris', [('Q90', 900)])])
+    os.replace(filepath + '.tmp', filepath)
+    assert list(store.read_head('paris', 1)) == [90, 900]
+    assert store.generation == 1
+    store.close()
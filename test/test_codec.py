@@ -0,0 +1,35 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+from wd_semantic_parsing import codec
+
+
+ENTITY = {'id': 'Q90', 'label': 'Paris', 'aliases': ['Lutèce', 'パリ', 'City of Light'], 'pageviews': 123456,
+          'coordinates': [48.8566, 2.3522], 'url': 'https://fr.wikipedia.org/wiki/Paris', 'capital': True,
+          'dissolved': None, 'quote': 'say "bonjour"\n'}
+ENCODED = ('{"id":"Q90","label":"Paris","aliases":["Lutèce","パリ","City of Light"],"pageviews":123456,'
+           '"coordinates":[48.8566,2.3522],"url":"https://fr.wikipedia.org/wiki/Paris","capital":true,'
+           '"dissolved":null,"quote":"say \\"bonjour\\"\\n"}')
+
+
+@pytest.fixture(params=codec.CODECS)
+def codec_name(request):
+    pytest.importorskip(request.param)
+    previous = codec.codec_name
+    codec.set_codec(request.param)
+    yield request.param
+    codec.set_codec(previous)
+
+
+def test_round_trip(codec_name):
+    assert codec.codec_name == codec_name
+    assert codec.loads(codec.dumps(ENTITY)) == ENTITY
+    assert codec.loads(codec.dumpb(ENTITY)) == ENTITY
+    assert codec.loads(codec.dumps(ENTITY).encode('utf-8')) == ENTITY
+
+
+def test_output_form(codec_name):
+    # Every codec writes the same compact, non-ASCII form, so that the files do not depend on the codec
+    assert codec.dumps(ENTITY) == ENCODED
+    assert codec.dumpb(ENTITY) == ENCODED.encode('utf-8')
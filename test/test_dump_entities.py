@@ -0,0 +1,170 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import gc
+import gzip
+import json
+
+import pytest
+
+from wd_semantic_parsing.wikidata import dump_entities
+from wd_semantic_parsing.wikidata.dump_entities import DumpPrefilter, extract_entity_data, has_disambiguation_class
+
+
+DISAMBIGUATION = 'Q4167410'
+
+
+def snak(qid, prop='P31'):
+    return {'snaktype': 'value', 'property': prop,
+            'datavalue': {'value': {'entity-type': 'item', 'id': qid}, 'type': 'wikibase-entityid'}}
+
+
+def statement(qid, prop='P31', qualifiers=None, references=None):
+    statement = {'mainsnak': snak(qid, prop), 'type': 'statement', 'rank': 'normal'}
+    if qualifiers:
+        statement['qualifiers'] = qualifiers
+    if references:
+        statement['references'] = references
+    return statement
+
+
+def entity(qid, claims, label='Paris', lang='en'):
+    return {'type': 'item', 'id': qid, 'labels': {lang: {'language': lang, 'value': label}}, 'claims': claims}
+
+
+ENTRIES = {
+    'city': entity('Q90', {'P31': [statement('Q515')]}),
+    'disambiguation': entity('Q1', {'P31': [statement(DISAMBIGUATION)]}),
+    'other_language': entity('Q2', {'P31': [statement('Q515')]}, lang='fr'),
+    'no_classes': entity('Q3', {}),
+    'qualifier_only': entity('Q4', {'P17': [statement('Q142', 'P17', qualifiers={'P31': [snak(DISAMBIGUATION)]})]}),
+    'qualifier_first': entity('Q5', {
+        'P17': [statement('Q142', 'P17', qualifiers={'P31': [snak(DISAMBIGUATION)]})],
+        'P31': [statement('Q515')]}),
+    'reference_first': entity('Q6', {
+        'P17': [statement('Q142', 'P17', references=[{'snaks': {'P31': [snak(DISAMBIGUATION)]}}])],
+        'P31': [statement('Q515')]}),
+    'class_elsewhere': entity('Q7', {'P279': [statement(DISAMBIGUATION, 'P279')], 'P31': [statement('Q5')]},
+                              label=DISAMBIGUATION),
+    'statements_in_label': entity('Q8', {'P31': [statement('Q515')]},
+                                  label=json.dumps({'P31': [statement(DISAMBIGUATION)]}, separators=(',', ':'))),
+    'escaped_key': entity('Q9', {'x"P31': [statement(DISAMBIGUATION)], 'P31': [statement('Q515')]}),
+    'empty_statements': entity('Q10', {'P31': [], 'P17': [statement('Q142', 'P17')]}),
+    'non_ascii': entity('Q11', {'P31': [statement('Q515')]}, label='Pàrís "𝔓"'),
+}
+ENCODINGS = {
+    'compact': dict(separators=(',', ':'), ensure_ascii=False),
+    'spaced': dict(ensure_ascii=False),
+    'ascii': dict(separators=(',', ':')),
+}
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+@pytest.mark.parametrize("name", ENTRIES)
+def test_prefilter_keeps_extracted(name, encoding):
+    # The prefilter only screens the lines: it never drops an entity that the full decode keeps
+    entry = ENTRIES[name]
+    line = json.dumps(entry, **ENCODINGS[encoding]).encode('utf-8')
+    kept = extract_entity_data(json.loads(line), ['en']) is not None
+    prefilter = DumpPrefilter(['en'])
+    assert prefilter.accept(line) or not kept, (name, encoding)
+    assert has_disambiguation_class(line) == (name == 'disambiguation' and encoding != 'spaced')
+
+
+def test_prefilter_drops():
+    prefilter = DumpPrefilter(['en'])
+    for name in ('disambiguation', 'other_language'):
+        line = json.dumps(ENTRIES[name], separators=(',', ':')).encode('utf-8')
+        assert extract_entity_data(json.loads(line), ['en']) is None
+        assert not prefilter.accept(line)
+    assert prefilter.skipped == {'disambiguation': 1, 'languages': 1}
+
+
+@pytest.mark.parametrize("prefilter", [True, False])
+def test_extract_entities_workers(tmp_path, monkeypatch, prefilter):
+    # Several batches of BATCH_SIZE lines, mapped in order whatever the number of workers
+    entries = [dict(entry, id=f'Q{i}') for i in range(250) for entry in ENTRIES.values()]
+    dump_path = tmp_path / 'dump.json'
+    dump_path.write_text('[\n' + ',\n'.join(json.dumps(entry, ensure_ascii=False) for entry in entries) + '\n]\n',
+                         encoding='utf-8')
+    
+    outputs = []
+    for workers in (1, 3):
+        entities_path = tmp_path / f'entities_{workers}.jsonl'
+        monkeypatch.setattr(dump_entities, 'WIKIDATA_DIR', str(tmp_path))
+        monkeypatch.setattr(dump_entities, 'WIKIDATA_ENTITIES', str(entities_path))
+        dump_entities.extract_entities(['en'], workers=workers, prefilter=prefilter, dump_path=str(dump_path))
+        outputs.append(entities_path.read_bytes())
+    
+    assert outputs[0] == outputs[1]
+    expected = [extract_entity_data(entry, ['en']) for entry in entries]
+    assert [json.loads(line) for line in outputs[0].splitlines()] == [entity for entity in expected if entity]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_extract_entities_resume(tmp_path, monkeypatch):
+    entries = [dict(entry, id=f'Q{i}') for i in range(250) for entry in ENTRIES.values()]
+    dump_path = tmp_path / 'dump.json'
+    dump_path.write_text('[\n' + ',\n'.join(json.dumps(entry, ensure_ascii=False) for entry in entries) + '\n]\n',
+                         encoding='utf-8')
+    entities_path = tmp_path / 'entities.jsonl'
+    checkpoint_path = tmp_path / 'entities.jsonl.checkpoint'
+    monkeypatch.setattr(dump_entities, 'WIKIDATA_DIR', str(tmp_path))
+    monkeypatch.setattr(dump_entities, 'WIKIDATA_ENTITIES', str(entities_path))
+    dump_entities.extract_entities(['en'], dump_path=str(dump_path))
+    expected = entities_path.read_bytes()
+    entities_path.unlink()
+    
+    # A checkpoint every 2 batches, and a failure in the 4th one, after the 3rd batch was written
+    monkeypatch.setattr(dump_entities, 'CHECKPOINT_LINES', 2 * dump_entities.BATCH_SIZE)
+    extract_batch = dump_entities.extract_batch
+    
+    def failing_batch(max_batches):
+        calls = 0
+        
+        def batch(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            if calls > max_batches:
+                raise Interrupted()
+            return extract_batch(*args, **kwargs)
+        return batch
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(dump_entities, 'extract_batch', failing_batch(3))
+        with pytest.raises(Interrupted):
+            dump_entities.extract_entities(['en'], dump_path=str(dump_path))
+        gc.collect()
+        checkpoint = json.loads(checkpoint_path.read_text())
+        assert checkpoint['line_no'] == 2 * dump_entities.BATCH_SIZE
+        assert entities_path.stat().st_size > checkpoint['output_size']
+        
+        # The resumed extraction truncates the output written after the checkpoint
+        patch.setattr(dump_entities, 'extract_batch', failing_batch(0))
+        with pytest.raises(Interrupted):
+            dump_entities.extract_entities(['en'], resume=True, dump_path=str(dump_path))
+        gc.collect()
+        assert entities_path.read_bytes() == expected[:checkpoint['output_size']]
+    
+    dump_entities.extract_entities(['en'], resume=True, workers=2, dump_path=str(dump_path))
+    assert entities_path.read_bytes() == expected
+    assert not checkpoint_path.exists()
+
+
+def test_load_dump_gzipped(tmp_path):
+    # The gzipped flag of load_dump is deprecated, by keyword or in the position of compression
+    lines = [json.dumps(entry) for entry in ENTRIES.values()]
+    plain_path, gzip_path = tmp_path / 'dump', tmp_path / 'dump.gzip'
+    plain_path.write_text('[\n' + ',\n'.join(lines) + '\n]\n')
+    with gzip.open(gzip_path, 'wt') as f:
+        f.write('[\n' + ',\n'.join(lines) + '\n]\n')
+    
+    expected = list(ENTRIES.values())
+    for filepath, gzipped in ((plain_path, False), (gzip_path, True)):
+        with pytest.warns(DeprecationWarning):
+            assert list(dump_entities.load_dump(str(filepath), gzipped=gzipped)) == expected
+        with pytest.warns(DeprecationWarning):
+            assert list(dump_entities.load_dump(str(filepath), gzipped)) == expected
+    assert list(dump_entities.load_dump(str(gzip_path), 'gzip')) == expected
@@ -0,0 +1,41 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import random
+import weakref
+from operator import attrgetter, itemgetter
+
+import pytest
+
+from wd_semantic_parsing.external_sort import ExternalSorter
+
+
+rng = random.Random(0)
+RECORDS = [(rng.randint(0, 100), i) for i in range(5000)]
+
+
+@pytest.mark.parametrize("memory_budget", [1, 1000, 100000, 1 << 30])
+def test_sort(memory_budget):
+    sorter = ExternalSorter(memory_budget, key=itemgetter(0)).extend(RECORDS)
+    # The sort is stable, as sorted()
+    assert list(sorter) == sorted(RECORDS, key=itemgetter(0))
+    assert sorter.count == len(RECORDS)
+
+
+def test_empty():
+    assert list(ExternalSorter()) == []
+
+
+class Record:
+    __slots__ = ('key', '__weakref__')
+    
+    def __init__(self, key):
+        self.key = key
+
+
+def test_records_released():
+    sorter = ExternalSorter(key=attrgetter('key')).extend(Record(key) for key in range(100, 0, -1))
+    records = [weakref.ref(record) for record in sorter.buffer]
+    iterator = iter(sorter)
+    assert [next(iterator).key for _ in range(10)] == list(range(1, 11))
+    # The records consumed are no longer held by the sorter
+    assert sum(record() is not None for record in records) == 90
@@ -0,0 +1,80 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import random
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+
+from wd_semantic_parsing.wikidata import fuzzy_index as fuzzy_index_module
+from wd_semantic_parsing.wikidata.fuzzy_index import FuzzyIndex, build_fuzzy_index, edit_distance
+from wd_semantic_parsing.wikidata.prefix_search import PrefixSearchWriter
+
+
+def reference_distance(a, b):
+    distances = [[i + j if i * j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            distances[i][j] = min(distances[i - 1][j] + 1, distances[i][j - 1] + 1, distances[i - 1][j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                distances[i][j] = min(distances[i][j], distances[i - 2][j - 2] + 1)
+    return distances[len(a)][len(b)]
+
+
+def test_edit_distance():
+    rng = random.Random(0)
+    for _ in range(5000):
+        a = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 7)))
+        b = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 7)))
+        for max_distance in range(4):
+            assert edit_distance(a, b, max_distance) == min(reference_distance(a, b), max_distance + 1)
+
+
+DENOTATIONALS = [
+    ('barack obama', [('Q76', 1000)]),
+    ('berlin', [('Q64', 900), ('Q821244', 20)]),
+    ('bern', [('Q70', 300)]),
+    ('brelin', [('Q1', 1)]),
+    ('paris', [('Q90', 800)]),
+    ('parish', [('Q102496', 50)]),
+]
+
+
+@pytest.fixture
+def fuzzy_index(tmp_path):
+    suggest_path, fuzzy_path = str(tmp_path / 'suggest'), str(tmp_path / 'fuzzy')
+    writer = PrefixSearchWriter(suggest_path, str(tmp_path / 'prefixes'))
+    for denotational, entities in DENOTATIONALS:
+        writer.add(denotational, entities)
+    writer.close()
+    build_fuzzy_index(suggest_path, fuzzy_path, max_distance=2, prefix_length=4)
+    with FuzzyIndex(suggest_path, fuzzy_path) as index:
+        yield index
+
+
+def test_lookup(fuzzy_index):
+    # Ranked by distance, then pageviews
+    assert [(denotational, distance) for denotational, distance, _ in fuzzy_index.lookup('Berlni')] == \
+        [('berlin', 1), ('bern', 2), ('brelin', 2)]
+    assert fuzzy_index.lookup('barak obama')[0] == ('barack obama', 1, [('Q76', 1000)])
+    assert [denotational for denotational, _, _ in fuzzy_index.lookup('pari', max_distance=1)] == ['paris']
+    assert fuzzy_index.lookup('tokyo') == []
+
+
+def test_partial_lookup(tmp_path, monkeypatch):
+    # Sorted by key, the least viewed denotationals of the deletion 'pari' come first
+    denotationals = [('parie', [('Q1', 5)]), ('paris', [('Q90', 800)]), ('parisa', [('Q2', 10)]),
+                     ('parix', [('Q3', 400)])]
+    suggest_path, fuzzy_path = str(tmp_path / 'suggest'), str(tmp_path / 'fuzzy')
+    writer = PrefixSearchWriter(suggest_path, str(tmp_path / 'prefixes'))
+    for denotational, entities in denotationals:
+        writer.add(denotational, entities)
+    writer.close()
+    build_fuzzy_index(suggest_path, fuzzy_path, max_distance=1, prefix_length=4)
+    
+    with FuzzyIndex(suggest_path, fuzzy_path) as index:
+        assert [denotational for denotational, _, _ in index.lookup('pariz')] == ['paris', 'parix', 'parie']
+        # A clock ticking once per check: the budget is exceeded after two denotationals are verified
+        monkeypatch.setattr(fuzzy_index_module, 'time', SimpleNamespace(perf_counter=count().__next__))
+        assert [denotational for denotational, _, _ in index.lookup('pariz', time_budget=2.5)] == ['paris', 'parix']
@@ -0,0 +1,39 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+from wd_semantic_parsing import codec
+from wd_semantic_parsing.wikidata import gazetteer
+from wd_semantic_parsing.wikidata.gazetteer import Gazetteer, iter_denotationals, pack_candidates
+
+
+def entity(wikidata_id, label, pageviews):
+    return {'id': wikidata_id, 'classes': [], 'properties': [], 'wiki_title': {}, 'labels': {'en': label},
+            'aliases': {}, 'pageviews': pageviews}
+
+
+ENTITIES = [
+    entity('Q90', 'Paris', 100),
+    # Not items: they would be read back as Q31, Q7 and Q5
+    entity('P31', 'Paris', 1000),
+    entity('L7', 'Paris', 1000),
+    entity('Q5a', 'Paris', 1000),
+    entity('Q167646', 'Paris', 10),
+]
+
+
+def test_iter_denotationals_qids(tmp_path, monkeypatch):
+    entities_path = tmp_path / 'entities_pageviews.jsonl'
+    entities_path.write_text(''.join(codec.dumps(entity) + '\n' for entity in ENTITIES), encoding='utf-8')
+    monkeypatch.setattr(gazetteer, 'WIKIDATA_ENTITIES_WITH_PAGEVIEWS', str(entities_path))
+    assert list(iter_denotationals(with_pageviews=True)) == [('paris', [('Q90', 100), ('Q167646', 10)])]
+
+
+@pytest.mark.parametrize("wikidata_id", ['P31', 'L7', 'Q5a', 'Q', 'Q4294967296'])
+def test_pack_candidates_rejects(tmp_path, wikidata_id):
+    assert list(pack_candidates([('Q90', 100), ('Q167646', 10)])) == [90, 100, 167646, 10]
+    with pytest.raises(ValueError):
+        pack_candidates([('Q90', 100), (wikidata_id, 10)])
+    with Gazetteer(str(tmp_path / 'gazetteer.sqlite3')) as db:
+        with pytest.raises(ValueError):
+            db.write('paris', [(wikidata_id, 10)])
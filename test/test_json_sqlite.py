@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from wd_semantic_parsing.utils import JsonSQLite
+
+
+ITEMS = [('Q%d' % i, {'id': 'Q%d' % i, 'labels': ['label %d' % i]}) for i in range(1000)]
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    filepath = str(tmp_path / 'store.sqlite3')
+    with JsonSQLite(filepath, bulk_load=True) as db:
+        db.write_many(ITEMS, batch_size=64)
+    return filepath
+
+
+def test_bulk_load(store_path):
+    with JsonSQLite(store_path) as db:
+        assert len(db) == len(ITEMS)
+        assert dict(db.iteritems()) == dict(ITEMS)
+
+
+def test_bulk_load_duplicates(tmp_path):
+    filepath = str(tmp_path / 'store.sqlite3')
+    with JsonSQLite(filepath, bulk_load=True) as db:
+        db.write_many([('a', 1), ('b', 2), ('a', 3)])
+        # Left uncommitted until the store is closed
+        db.write_encoded([('c', db.encode(4)), ('b', db.encode(5))])
+    
+    with JsonSQLite(filepath) as db:
+        # The last value wins, as with write()
+        assert dict(db.iteritems()) == {'a': 3, 'b': 5, 'c': 4}
+        # The key index is unique
+        with pytest.raises(sqlite3.IntegrityError):
+            db.cursor.execute("INSERT INTO data VALUES ('a', '4')")
+
+
+def test_read_only_threads(store_path):
+    db = JsonSQLite(store_path, read_only=True)
+    with ThreadPoolExecutor(4) as executor:
+        values = list(executor.map(db.read, [key for key, _ in ITEMS] * 4))
+    assert values == [value for _, value in ITEMS] * 4
+    assert db.read('missing') is None
+    
+    with pytest.raises(sqlite3.OperationalError):
+        db.cursor.execute("INSERT INTO data VALUES ('a', '1')")
+    db.close()
+
+
+def test_read_many(store_path):
+    keys = ['Q%d' % i for i in range(0, 2000, 3)] + ['Q0', 'missing']
+    with JsonSQLite(store_path) as db:
+        assert db.read_many(keys) == {key: db.read(key) for key in keys if db.read(key) is not None}
+        assert db.read_many([]) == {}
+
+
+def test_entity_types(tmp_path):
+    from wd_semantic_parsing.wikidata.entity_db import EntityTypes
+    
+    filepath = str(tmp_path / 'entity_types.sqlite3')
+    with EntityTypes(filepath, bulk_load=True) as db:
+        db.write_many([('Q1', (['Q5', 'Q215627'], ['P31', 'P569'])), ('Q2', ([], ['P1082']))])
+    
+    with EntityTypes(filepath, read_only=True) as db:
+        assert db.read('Q1') == ({5, 215627}, {31, 569})
+        assert db.read_many(['Q2', 'Q3']) == {'Q2': (frozenset(), {1082})}
+
+
+def test_gazetteer(tmp_path, store_path):
+    from wd_semantic_parsing.wikidata.gazetteer import Gazetteer
+    
+    filepath = str(tmp_path / 'gazetteer.sqlite3')
+    with Gazetteer(filepath, bulk_load=True) as db:
+        db.write_many([('paris', [('Q90', 5000), ('Q830149', 1 << 40), ('Q3', 0)]), ('rome', [('Q220', 10)])])
+    
+    assert Gazetteer.has_format(filepath)
+    assert not Gazetteer.has_format(store_path)
+    with Gazetteer(filepath, read_only=True) as db:
+        assert db.read('paris') == ['Q90', 'Q830149', 'Q3']
+        assert db.read_many(['rome', 'london']) == {'rome': ['Q220']}
+        assert list(db.read_ids('paris')) == [90, 830149, 3]
+        assert list(db.read_ids('paris', 2)) == [90, 830149]
+        # Pageviews are saturated to uint32
+        assert db.read_scored('paris') == [('Q90', 5000), ('Q830149', (1 << 32) - 1), ('Q3', 0)]
+        assert db.read_scored('paris', 1) == [('Q90', 5000)]
+        assert db.read_scored('rome', 5) == [('Q220', 10)]
+        assert db.read_scored('london', 5) is None
+
+
+def test_link_entity_top_k(tmp_path):
+    from wd_semantic_parsing.wikidata.entity_db import EntityTypes
+    from wd_semantic_parsing.wikidata.gazetteer import Gazetteer
+    from wd_semantic_parsing.wikidata.linker import EntityLinker
+    
+    candidates = [('Q%d' % i, 1000 - i) for i in range(1, 101)]
+    with Gazetteer(str(tmp_path / 'gazetteer.sqlite3'), bulk_load=True) as db:
+        db.write_many([('paris', candidates)])
+    with EntityTypes(str(tmp_path / 'entity_types.sqlite3'), bulk_load=True) as db:
+        # Every third entity is a city, the entities after Q50 have a population
+        db.write_many([(qid, (['Q515'] if i % 3 == 0 else [], ['P1082'] if i > 50 else []))
+                       for i, (qid, _) in enumerate(candidates, 1)])
+    
+    linker = EntityLinker.__new__(EntityLinker)
+    linker.link_cache = None
+    linker.gazetteer = Gazetteer(str(tmp_path / 'gazetteer.sqlite3'), read_only=True)
+    linker.entity_types = EntityTypes(str(tmp_path / 'entity_types.sqlite3'), read_only=True)
+    
+    assert linker.link_entity('Paris', top_k=2) == ['Q1', 'Q2']
+    assert linker.link_entity('Paris', top_k=2, with_scores=True) == [('Q1', 999), ('Q2', 998)]
+    assert linker.link_entity('Paris', with_scores=True) == candidates
+    assert linker.link_entity('Paris', class_name='Q515', top_k=3) == ['Q3', 'Q6', 'Q9']
+    assert linker.link_entity('Paris', class_name='Q515', property_name='P1082', top_k=2,
+                              with_scores=True) == [('Q51', 949), ('Q54', 946)]
+    assert (linker.link_entity('Paris', class_name='Q515', top_k=1000)
+            == linker.link_entity('Paris', class_name='Q515') == ['Q%d' % i for i in range(3, 101, 3)])
+    assert linker.link_entity('London', top_k=3) == []
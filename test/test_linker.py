@@ -0,0 +1,124 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from wd_semantic_parsing.utils import JsonSQLite
+from wd_semantic_parsing.wikidata import linker as linker_module
+from wd_semantic_parsing.wikidata.gazetteer import Gazetteer
+from wd_semantic_parsing.wikidata.entity_db import EntityTypes
+from wd_semantic_parsing.wikidata.fuzzy_index import FuzzyIndex, build_fuzzy_index
+from wd_semantic_parsing.wikidata.linker import EntityLinker
+from wd_semantic_parsing.wikidata.prefix_search import PrefixSearchWriter
+
+
+GAZETTEER = {
+    'paris': [('Q483020', 900), ('Q90', 800), ('Q830149', 50)],
+    'rome': [('Q220', 700)],
+    'berlin': [('Q64', 600)],
+}
+ENTITY_TYPES = {
+    'Q483020': (['Q476028'], ['P17', 'P115']),
+    'Q90': (['Q515', 'Q5119'], ['P17', 'P1082']),
+    'Q830149': (['Q1093829'], ['P17', 'P1082']),
+    'Q220': (['Q515'], ['P17', 'P1082']),
+    'Q64': (['Q515'], ['P17', 'P1082']),
+}
+
+
+@pytest.fixture
+def linker(tmp_path, monkeypatch):
+    gazetteer_path, entity_types_path = str(tmp_path / 'gazetteer.sqlite3'), str(tmp_path / 'entity_types.sqlite3')
+    entities_path = str(tmp_path / 'entities.sqlite3')
+    with JsonSQLite(entities_path) as db:
+        db.write_many((qid, {'id': qid, 'classes': classes, 'properties': properties})
+                      for qid, (classes, properties) in ENTITY_TYPES.items())
+    with Gazetteer(gazetteer_path) as db:
+        db.write_many(GAZETTEER.items())
+    with EntityTypes(entity_types_path) as db:
+        db.write_many(ENTITY_TYPES.items())
+    
+    monkeypatch.setattr(linker_module, 'get_gazetteer', lambda *_, **__: Gazetteer(gazetteer_path, read_only=True))
+    monkeypatch.setattr(linker_module, 'get_entity_db', lambda *_, **__: JsonSQLite(entities_path, read_only=True))
+    monkeypatch.setattr(linker_module, 'get_entity_types',
+                        lambda *_, **__: EntityTypes(entity_types_path, read_only=True))
+    return EntityLinker()
+
+
+def test_link_entity(linker):
+    assert linker.link_entity(' Paris ') == ['Q483020', 'Q90', 'Q830149']
+    assert linker.link_entity('paris', class_name='Q515') == ['Q90']
+    assert linker.link_entity('paris', property_name='P1082', top_k=1, with_scores=True) == [('Q90', 800)]
+    assert linker.link_entity('tokyo') == []
+    assert linker.link_entities(['Rome', 'tokyo', 'paris'], class_name='Q515') == [['Q220'], [], ['Q90']]
+    assert linker.link_entities(['Rome', 'tokyo', 'paris'], top_k=2, with_scores=True) == \
+        [[('Q220', 700)], [], [('Q483020', 900), ('Q90', 800)]]
+    assert linker.link_entities(['paris'], property_name='P1082', top_k=1) == [['Q90']]
+
+
+@pytest.mark.parametrize("constraints", [dict(class_name='P515'), dict(property_name='Q17'),
+                                         dict(class_name='wd:Q515'), dict(class_name='Q'), dict(class_name='Q5x'),
+                                         dict(property_name='P 17'), dict(property_name='P99999999999')])
+def test_malformed_constraints(linker, constraints):
+    # Ids of the wrong kind would otherwise match the numeric id of another kind, e.g. P515 the class Q515
+    assert linker.link_entity('paris', **constraints) == []
+    assert linker.link_entity('paris', top_k=1, **constraints) == []
+    assert linker.link_entities(['rome', 'paris'], **constraints) == [[], []]
+
+
+def test_link_entity_fuzzy(linker, tmp_path, monkeypatch):
+    suggest_path, fuzzy_path = str(tmp_path / 'suggest'), str(tmp_path / 'fuzzy')
+    writer = PrefixSearchWriter(suggest_path, str(tmp_path / 'prefixes'))
+    for denotational in sorted(GAZETTEER):
+        writer.add(denotational, GAZETTEER[denotational])
+    writer.close()
+    build_fuzzy_index(suggest_path, fuzzy_path)
+    monkeypatch.setattr(linker_module, 'get_fuzzy_index', lambda *_, **__: FuzzyIndex(suggest_path, fuzzy_path))
+    
+    # Only the mentions without any exact match are looked up in the fuzzy index
+    assert linker.link_entity('Pariss', fuzzy=True) == ['Q483020', 'Q90', 'Q830149']
+    assert linker.link_entity('paris', fuzzy=True) == linker.link_entity('paris')
+    assert linker.link_entity('Pariss') == []
+    assert linker.link_entity('pairs', class_name='Q515', fuzzy=True) == ['Q90']
+    assert linker.link_entity('berln', property_name='P1082', fuzzy=True, with_scores=True) == [('Q64', 600)]
+    assert linker.link_entity('pariss', fuzzy=True, top_k=2, with_scores=True) == [('Q483020', 900), ('Q90', 800)]
+    assert linker.link_entity('roma', class_name='P515', fuzzy=True) == []
+    assert linker.link_entity('tokyo', fuzzy=True) == []
+
+
+def test_cached_linker(linker, monkeypatch):
+    cached = EntityLinker(cache_entries=100)
+    for mention in ['Paris', 'paris', 'Rome', 'tokyo']:
+        for top_k in (None, 1):
+            for with_scores in (False, True):
+                assert cached.link_entity(mention, top_k=top_k, with_scores=with_scores) == \
+                    linker.link_entity(mention, top_k=top_k, with_scores=with_scores)
+    
+    # The gazetteer reads go through its cache
+    monkeypatch.setattr(cached.gazetteer.store, 'read_head', None)
+    cached.link_cache.clear()
+    assert cached.link_entity('paris', top_k=1, with_scores=True) == [('Q483020', 900)]
+
+
+def test_lazy_builds(linker, monkeypatch):
+    builds = []
+    lock = threading.Lock()
+    
+    def build(result):
+        def slow_build(*_):
+            with lock:
+                builds.append(result)
+            time.sleep(0.05)
+            return result
+        return slow_build
+    
+    monkeypatch.setattr(linker_module, 'get_fuzzy_index', build('fuzzy index'))
+    monkeypatch.setattr(linker_module.mention_detection, 'get_automaton', build('automaton'))
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda i: linker.get_fuzzy_index() if i % 2 else linker.get_automaton(),
+                                    range(16)))
+    assert sorted(builds) == ['automaton', 'fuzzy index']
+    assert sorted(set(results)) == ['automaton', 'fuzzy index']
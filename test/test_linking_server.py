@@ -0,0 +1,101 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import asyncio
+import threading
+import time
+
+from wd_semantic_parsing import codec
+from wd_semantic_parsing.wikidata.linker import AsyncEntityLinker
+from wd_semantic_parsing.wikidata.linking_server import LinkingServer
+
+
+class FakeLinker:
+    GAZETTEER = {'paris': ['Q90', 'Q167646'], 'rome': ['Q220']}
+    
+    def __init__(self):
+        self.lookups = 0
+        self.lock = threading.Lock()
+    
+    def link_entity(self, mention, class_name=None, property_name=None, fuzzy=False, top_k=None, with_scores=False):
+        with self.lock:
+            self.lookups += 1
+        time.sleep(0.05)
+        candidates = self.GAZETTEER.get(mention, [])
+        candidates = (candidates[:1] if class_name else candidates)[:top_k]
+        return [(candidate, 100) for candidate in candidates] if with_scores else candidates
+    
+    def detect_mentions(self, text, longest=False, class_name=None, property_name=None):
+        start = text.lower().find('paris')
+        return [(start, start + 5, self.GAZETTEER['paris'])] if start >= 0 else []
+
+
+def test_coalescing():
+    async def run(linker):
+        return await asyncio.gather(*(linker.link_entity(mention) for mention in ['Paris', ' paris', 'Rome']),
+                                    linker.link_entity('Paris', class_name='Q515'))
+    
+    linker = AsyncEntityLinker(FakeLinker())
+    assert asyncio.run(run(linker)) == [['Q90', 'Q167646'], ['Q90', 'Q167646'], ['Q220'], ['Q90']]
+    assert linker.linker.lookups == 3
+    assert linker.coalesced == 1
+    assert not linker.in_flight
+    linker.close()
+
+
+async def request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    responses = []
+    for _ in range(2):
+        # Two requests on the same keep-alive connection
+        payload = codec.dumpb(body) if body is not None else b''
+        writer.write(b'%s %s HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % (method, path, len(payload)) + payload)
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (line := await reader.readline()) != b'\r\n':
+            name, _, value = line.decode().partition(':')
+            headers[name.lower()] = value.strip()
+        responses.append((status, codec.loads(await reader.readexactly(int(headers['content-length'])))))
+    writer.close()
+    assert responses[0] == responses[1]
+    return responses[0]
+
+
+def test_server():
+    async def run():
+        linker = AsyncEntityLinker(FakeLinker())
+        server = await asyncio.start_server(LinkingServer(linker).handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            responses = [
+                await request(port, b'GET', b'/health'),
+                await request(port, b'POST', b'/link', {'mention': 'Paris'}),
+                await request(port, b'POST', b'/link', {'mentions': ['Paris', 'Rome'], 'class_name': 'Q515'}),
+                await request(port, b'POST', b'/link', [{'mention': 'Rome'}, {'mention': 'Nowhere'}]),
+                await request(port, b'POST', b'/link', {'mention': 'Paris', 'top_k': 1, 'with_scores': True}),
+                await request(port, b'POST', b'/link', {'mention': 'Paris', 'top_k': -1}),
+                await request(port, b'POST', b'/detect', {'text': 'Where is Paris?'}),
+                await request(port, b'POST', b'/link', {'mentions': 'Paris'}),
+                await request(port, b'POST', b'/link', {'mention': 'Paris', 'class_name': 515}),
+                await request(port, b'POST', b'/link', {'mentions': ['Paris'], 'property_name': ['P17']}),
+                await request(port, b'POST', b'/detect', {'text': 'Where is Paris?', 'class_name': {'id': 'Q515'}}),
+                await request(port, b'POST', b'/detect', {'text': 5}),
+                await request(port, b'POST', b'/unknown', {}),
+            ]
+        linker.close()
+        return responses
+    
+    assert asyncio.run(run()) == [
+        (200, {'status': 'ok'}),
+        (200, {'candidates': ['Q90', 'Q167646']}),
+        (200, {'candidates': [['Q90'], ['Q220']]}),
+        (200, [{'candidates': ['Q220']}, {'candidates': []}]),
+        (200, {'candidates': [['Q90', 100]]}),
+        (400, {'error': "'top_k' must be a non-negative integer"}),
+        (200, {'mentions': [{'start': 9, 'end': 14, 'candidates': ['Q90', 'Q167646']}]}),
+        (400, {'error': "'mentions' must be a list of strings"}),
+        (400, {'error': "'class_name' must be a string or null"}),
+        (400, {'error': "'property_name' must be a string or null"}),
+        (400, {'error': "'class_name' must be a string or null"}),
+        (400, {'error': "'text' is required"}),
+        (404, {'error': 'Unknown path /unknown'}),
+    ]
@@ -0,0 +1,59 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pickle
+import random
+import sys
+
+import pytest
+
+from wd_semantic_parsing.wikidata.mention_detection import Automaton, build_automaton, detect_mentions
+
+
+def make_automaton(words):
+    automaton = Automaton()
+    for word in words:
+        automaton.add_word(word, len(word))
+    automaton.make_automaton()
+    return automaton
+
+
+def test_automaton():
+    rng = random.Random(0)
+    for _ in range(200):
+        words = {''.join(rng.choice('ab ') for _ in range(rng.randint(1, 5))) for _ in range(rng.randint(1, 20))}
+        text = ''.join(rng.choice('ab c') for _ in range(rng.randint(0, 40)))
+        automaton = pickle.loads(pickle.dumps(make_automaton(words)))
+        matches = sorted((end + 1 - length, end + 1) for end, length in automaton.iter(text))
+        assert matches == sorted((i, i + len(word)) for word in words for i in range(len(text))
+                                 if text.startswith(word, i))
+
+
+AUTOMATON = make_automaton(['new york', 'new york city', 'york', 'city', 'paris', 'ny'])
+
+
+def test_detect_mentions():
+    text = 'Is New York City bigger than Paris, or Sunny Paris?'
+    assert [(text[start:end], mention) for start, end, mention in detect_mentions(AUTOMATON, text)] == [
+        ('New York', 'new york'), ('New York City', 'new york city'), ('York', 'york'), ('City', 'city'),
+        ('Paris', 'paris'), ('Paris', 'paris')]
+    assert [text[start:end] for start, end, _ in detect_mentions(AUTOMATON, text, longest=True)] == [
+        'New York City', 'Paris', 'Paris']
+
+
+def test_detect_mentions_offsets():
+    # Lowercasing İ adds a combining character, the spans are still offsets in the text
+    text = 'İİ New York'
+    assert [(text[start:end], mention) for start, end, mention in detect_mentions(AUTOMATON, text)] == [
+        ('New York', 'new york'), ('York', 'york')]
+
+
+def test_build_automaton(monkeypatch):
+    # Without pyahocorasick
+    monkeypatch.setitem(sys.modules, 'ahocorasick', None)
+    automaton = build_automaton([' paris', 'new york ', 'york', ' '])
+    text = 'Paris, New York'
+    assert [(text[start:end], mention) for start, end, mention in detect_mentions(automaton, text)] == [
+        ('Paris', 'paris'), ('New York', 'new york'), ('York', 'york')]
+    
+    with pytest.raises(ImportError, match='pip install pyahocorasick'):
+        build_automaton(['paris', 'rome', 'york'], max_python_keys=2)
@@ -0,0 +1,44 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+from wd_semantic_parsing import codec
+from wd_semantic_parsing.wikidata import merge_entities_pageviews as merge
+
+
+ENTITIES = [
+    {'id': 'Q1', 'wiki_title': {'en': 'Paris', 'fr': 'Paris'}},
+    {'id': 'Q2', 'wiki_title': {'fr': 'Rome'}},
+    {'id': 'Q3', 'wiki_title': {'en': 'New York City'}},
+    {'id': 'Q4', 'wiki_title': {'en': 'Zürich'}},
+    {'id': 'Q5', 'wiki_title': {'en': 'Paris'}},
+    {'id': 'Q6', 'wiki_title': {'en': 'Atlantis'}},
+    {'id': 'Q7', 'wiki_title': {}},
+]
+PAGEVIEWS = ['Paris\t10', 'New_York_City\t7', 'Zürich\t3', 'Rome\t5', 'Paris\t12', 'Berlin\t1']
+
+
+@pytest.fixture
+def data_files(tmp_path, monkeypatch):
+    entities, pageviews = tmp_path / 'entities.jsonl', tmp_path / 'pageviews.counts'
+    entities.write_text(''.join(codec.dumps(entity) + '\n' for entity in ENTITIES), encoding='utf-8')
+    pageviews.write_text(''.join(line + '\n' for line in PAGEVIEWS), encoding='utf-8')
+    monkeypatch.setattr(merge, 'WIKIDATA_ENTITIES', str(entities))
+    monkeypatch.setattr(merge, 'WIKIDATA_PAGEVIEWS', str(pageviews))
+    return tmp_path
+
+
+@pytest.mark.parametrize("skip_missing", [True, False])
+@pytest.mark.parametrize("memory_budget", [1, 1 << 20])
+def test_external_merge(data_files, monkeypatch, skip_missing, memory_budget):
+    outputs = []
+    for external in (False, True):
+        output = data_files / f'entities_pageviews_{external}.jsonl'
+        monkeypatch.setattr(merge, 'WIKIDATA_ENTITIES_WITH_PAGEVIEWS', str(output))
+        merge.merge_entities_pageviews(skip_missing=skip_missing, memory_budget=memory_budget if external else None)
+        outputs.append(output.read_bytes())
+    
+    assert outputs[0] == outputs[1]
+    entities = [codec.loads(line) for line in outputs[1].decode('utf-8').splitlines()]
+    assert [(e['id'], e.get('pageviews')) for e in entities if skip_missing or 'pageviews' in e] == [
+        ('Q1', 12), ('Q3', 7), ('Q4', 3), ('Q5', 12)]
@@ -1,9 +1,12 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import pickle
+import random
+
 import pytest
 
-from wd_semantic_parsing.mrl.data import MRL
-from wd_semantic_parsing.mrl.parser import parse_mrl
+from wd_semantic_parsing.mrl.data import MRL, Object, Predicate
+from wd_semantic_parsing.mrl.parser import parse_mrl, parse_mrl_obj, parse_mrl_obj_recursive
 
 
 TESTS = (
@@ -17,3 +20,88 @@ def test_parser(mrl_str, mrl_type):
     mrl = parse_mrl(mrl_str)
     assert type(mrl) == mrl_type
     assert str(mrl) == mrl_str
+
+
+def tree(obj):
+    """Structure of a parsed MRL, for comparisons."""
+    if isinstance(obj, MRL):
+        predicate = obj.predicate
+        return ('MRL', predicate.ns, predicate.ptype, predicate.reverse, tree(predicate.obj),
+                [tree(arg) for arg in obj.args], [tree(condition) for condition in obj.conditions],
+                tree(obj.temporal_condition))
+    if isinstance(obj, Object):
+        return ('Object', obj.prefix, obj.name)
+    return obj
+
+
+def parse_or_error(parse, *args):
+    try:
+        obj, i = parse(*args)
+        return tree(obj), i
+    except Exception as e:
+        return type(e)
+
+
+FRAGMENTS = ['wd.predicate.wdt:P31', 'wd.predicate.*p:P39', 'wd.operator.year', 'wd:Q5', '2009', 'x', ':',
+             '(', '(', ')', ')', ',', ', ', ' ', ' & ', '&', ' ^ ', '"en"', '"a, b"', '"', '[', ']', '[wd:Q1 "]"]']
+
+
+def test_parser_differential():
+    rng = random.Random(0)
+    for _ in range(20000):
+        text = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 12)))
+        for gobble_operator in (True, False):
+            i = rng.randint(0, len(text))
+            assert (parse_or_error(parse_mrl_obj, text, i, gobble_operator)
+                    == parse_or_error(parse_mrl_obj_recursive, text, i, 0, gobble_operator)), (text, i)
+
+
+def random_mrl(rng, depth=0):
+    """A well-formed MRL, mostly in the canonical form parsed by parse_canonical."""
+    terms = ['wd:Q5', '2009', 'DESC', '"en"', '"a, b"', '[wd:Q1]', '[wd:Q1 "]"]', 'x y']
+    args = [random_mrl(rng, depth + 1) if depth < 3 and rng.random() < 0.4 else rng.choice(terms)
+            for _ in range(rng.randint(0, 3))]
+    spaces = ['', ' ', '  ', '\t']
+    mrl = rng.choice(FRAGMENTS[:3]) + rng.choice(['(', '(', '(', ' (']) + rng.choice(spaces)
+    mrl += (rng.choice(spaces) + ',' + rng.choice(spaces)).join(args) + rng.choice(spaces) + ')'
+    for _ in range(rng.choice([0, 0, 1, 2])):
+        mrl += rng.choice(spaces) + rng.choice('&&^') + rng.choice(spaces) + random_mrl(rng, 3)
+    return mrl
+
+
+def test_parser_differential_mrls():
+    rng = random.Random(0)
+    for _ in range(5000):
+        text = random_mrl(rng) + rng.choice(['', '', ' ', ')', ', wd:Q5', ' & '])
+        for gobble_operator in (True, False):
+            assert (parse_or_error(parse_mrl_obj, text, 0, gobble_operator)
+                    == parse_or_error(parse_mrl_obj_recursive, text, 0, 0, gobble_operator)), text
+
+
+def test_parser_depth():
+    depth = 5000
+    mrl_str = 'wd.predicate.wdt:P31(' * depth + 'wd:Q5' + ')' * depth + ' & wd.predicate.wdt:P17(wd:Q142)'
+    mrl = parse_mrl(mrl_str)
+    assert str(mrl.conditions[0]) == 'wd.predicate.wdt:P17(wd:Q142)'
+    for _ in range(depth - 1):
+        assert str(mrl.predicate) == 'wd.predicate.wdt:P31' and len(mrl.args) == 1
+        mrl = mrl.args[0]
+    assert str(mrl) == 'wd.predicate.wdt:P31(wd:Q5)'
+
+
+def test_interned_nodes():
+    mrl_1 = parse_mrl('wd.predicate.*wdt:P31(wd:Q5)')
+    mrl_2 = parse_mrl('wd.predicate.*wdt:P31(wd:Q5) & wd.predicate.wdt:P17(wd:Q142)')
+    assert mrl_1.predicate is mrl_2.predicate and mrl_1.args[0] is mrl_2.args[0]
+    assert mrl_1.predicate == Predicate(Object('P31', 'wdt'), True)
+    assert mrl_1.predicate.forward() == Predicate.parse('wd.predicate.wdt:P31')
+    assert mrl_1.predicate != mrl_1.predicate.forward() and mrl_1.predicate != str(mrl_1.predicate)
+    
+    counts = {mrl_1.predicate: 1, mrl_1.args[0]: 2}
+    assert counts[Predicate.parse('wd.predicate.*wdt:P31')] == 1 and counts[Object('Q5', 'wd')] == 2
+    assert pickle.loads(pickle.dumps(mrl_2)).conditions[0].predicate is mrl_2.conditions[0].predicate
+    
+    with pytest.raises(AttributeError):
+        mrl_1.predicate.reverse = False
+    with pytest.raises(AttributeError):
+        mrl_1.args[0].name = 'Q6'
@@ -0,0 +1,103 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import bz2
+import gc
+import gzip
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from wd_semantic_parsing.utils import get_json_lines, open_input
+
+
+LINES = ['{"id": "Q%d"}' % i for i in range(1000)]
+IDS = ['Q%d' % i for i in range(1000)]
+
+
+def zstd_open(filepath, mode):
+    zstandard = pytest.importorskip('zstandard')
+    return zstandard.open(filepath, mode)
+
+
+COMPRESSIONS = {
+    'gzip': ('.json.gz', gzip.open, 'gzip -dc'),
+    'bz2': ('.json.bz2', bz2.open, 'bzip2 -dc'),
+    'zstd': ('.json.zst', zstd_open, 'zstd -dc'),
+    None: ('.json', open, 'cat'),
+}
+
+
+def write_dump(tmp_path, compression):
+    extension, open_dump, _ = COMPRESSIONS[compression]
+    filepath = tmp_path / ('dump' + extension)
+    with open_dump(filepath, 'wt') as f:
+        f.write('\n'.join(LINES) + '\n')
+    return str(filepath)
+
+
+@pytest.fixture
+def dump(tmp_path):
+    return write_dump(tmp_path, 'gzip')
+
+
+@pytest.fixture
+def stdin(monkeypatch):
+    def set_stdin(filepath):
+        f = open(filepath)
+        monkeypatch.setattr(sys, 'stdin', f)
+        return f
+    return set_stdin
+
+
+@pytest.mark.parametrize("decompressor", [None, 'gzip -dc'])
+def test_open_input(dump, decompressor):
+    assert [e['id'] for e in get_json_lines(dump, decompressor=decompressor)] == IDS
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_compressions(tmp_path, compression):
+    filepath = write_dump(tmp_path, compression)
+    assert [e['id'] for e in get_json_lines(filepath)] == IDS
+    assert [e['id'] for e in get_json_lines(filepath, compression=compression)] == IDS
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_stdin(tmp_path, stdin, compression):
+    # Without an extension to infer it from, the compression of the standard input is given
+    with stdin(write_dump(tmp_path, compression)):
+        assert [e['id'] for e in get_json_lines('-', compression=compression)] == IDS
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_stdin_decompressor(tmp_path, stdin, compression):
+    decompressor = COMPRESSIONS[compression][2]
+    if shutil.which(decompressor.split()[0]) is None:
+        pytest.skip(f"{decompressor} is not installed")
+    with stdin(write_dump(tmp_path, compression)):
+        assert [e['id'] for e in get_json_lines('-', decompressor=decompressor)] == IDS
+
+
+@pytest.mark.parametrize("decompressor", ["sh -c 'gzip -dc | head -c 100; exit 3'", "sh -c 'kill -9 $$'", 'gzip -dc --no-such-option'])
+def test_failed_decompressor(dump, stdin, decompressor):
+    with stdin(dump):
+        with pytest.raises(subprocess.CalledProcessError):
+            for _ in get_json_lines('-', throw_errors=False, decompressor=decompressor):
+                pass
+
+
+def test_closed_before_end(dump):
+    f = open_input(dump, decompressor='yes')
+    assert f.readline() == (dump + '\n').encode()
+    f.close()
+
+
+@pytest.mark.filterwarnings('error')
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_closes_file(tmp_path, compression):
+    # Closing the stream closes the file under the decompression, which would otherwise warn when collected
+    f = open_input(write_dump(tmp_path, compression))
+    f.readline()
+    f.close()
+    gc.collect()
@@ -0,0 +1,130 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import gzip
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from os import path
+
+import pytest
+
+from wd_semantic_parsing.sorted_table import CountTable
+from wd_semantic_parsing.utils import load_dict
+from wd_semantic_parsing.wikidata import pageviews
+
+
+PAGES = ['Paris', 'Rome', 'Berlin', 'Barack_Obama', 'Zürich', 'Москва']
+FIRST_DAY = datetime(2024, 1, 1)
+
+
+class FixedDatetime(datetime):
+    today = datetime(2024, 1, 8)
+    
+    @classmethod
+    def now(cls, tz=None):
+        return cls.today
+
+
+@pytest.fixture
+def hourly_views(tmp_path, monkeypatch):
+    """Writes the hourly files of 15 days, and returns the en counts of each (day, hour)."""
+    monkeypatch.setattr(pageviews, 'WIKIDATA_PAGEVIEWS_DIR', str(tmp_path))
+    monkeypatch.setattr(pageviews, 'WIKIDATA_PAGEVIEWS', str(tmp_path / 'pageviews.counts'))
+    monkeypatch.setattr(pageviews, 'WIKIDATA_PAGEVIEWS_WINDOW', str(tmp_path / 'pageviews.window'))
+    monkeypatch.setattr(pageviews, 'wget', None)
+    
+    rng = random.Random(0)
+    counts = {}
+    for day in range(15):
+        date = FIRST_DAY + timedelta(days=day)
+        for hour, (_, filepath) in enumerate(pageviews.hourly_files(date)):
+            views = counts[date, hour] = Counter()
+            with gzip.open(filepath, 'wt', encoding='utf-8') as f:
+                for page in rng.sample(PAGES, rng.randint(0, len(PAGES))):
+                    count = rng.randint(1, 5)
+                    views[page] += count
+                    f.write(f"en {page} {count} 0\n")
+                    f.write(f"fr {page} {count + 1} 0\n")
+                f.write("en malformed\n")
+    return counts
+
+
+def dayly_counts(counts, date):
+    return sum((counts[date, hour] for hour in range(24)), Counter())
+
+
+def test_count_views(hourly_views):
+    url, filepath = next(pageviews.hourly_files(FIRST_DAY))
+    views_table = pageviews.count_views(filepath, url)
+    with CountTable(views_table) as views:
+        assert dict(views.items()) == hourly_views[FIRST_DAY, 0]
+        assert list(views) == sorted(views, key=lambda page: page.encode('utf-8'))
+
+
+def test_merge_dayly_views(hourly_views):
+    pageviews.get_dayly_pageviews_tables([FIRST_DAY], workers=1)
+    with CountTable(pageviews.daily_views_file(FIRST_DAY)) as views:
+        assert dict(views.items()) == dayly_counts(hourly_views, FIRST_DAY)
+    
+    views = pageviews.get_dayly_pageviews(FIRST_DAY)
+    assert isinstance(views, Counter)
+    assert views == dayly_counts(hourly_views, FIRST_DAY)
+
+
+def test_window_totals(hourly_views, monkeypatch):
+    monkeypatch.setattr(pageviews, 'datetime', FixedDatetime)
+    pageviews.download_pageviews_data(num_days=7)
+    
+    expected = sum((dayly_counts(hourly_views, FIRST_DAY + timedelta(days=day)) for day in range(7)), Counter())
+    assert load_dict(pageviews.WIKIDATA_PAGEVIEWS, is_counter=True) == expected
+    assert path.exists(pageviews.daily_views_file(FIRST_DAY + timedelta(days=6)))
+    assert not path.exists(pageviews.daily_views_file(FIRST_DAY + timedelta(days=7)))
+
+
+
+def window_counts():
+    with CountTable(pageviews.WIKIDATA_PAGEVIEWS_WINDOW) as window:
+        return dict(window.items())
+
+
+def recompute(monkeypatch, today):
+    monkeypatch.setattr(FixedDatetime, 'today', today)
+    pageviews.download_pageviews_data(num_days=7)
+    return window_counts()
+
+
+@pytest.mark.parametrize("slide", [1, 3, 8])
+def test_update_window(hourly_views, monkeypatch, slide):
+    monkeypatch.setattr(pageviews, 'datetime', FixedDatetime)
+    pageviews.download_pageviews_data(num_days=7)
+    
+    updates = []
+    update_window = pageviews.update_window
+    monkeypatch.setattr(pageviews, 'update_window', lambda *args: updates.append(update_window(*args)) or updates[-1])
+    today = FixedDatetime.today + timedelta(days=slide)
+    monkeypatch.setattr(FixedDatetime, 'today', today)
+    pageviews.download_pageviews_data(num_days=7, incremental=True)
+    # Sliding the window by its whole length recomputes it
+    assert updates == [slide < 7]
+    updated = window_counts()
+    assert updated == recompute(monkeypatch, today)
+    assert pageviews.load_window_days('en')[0] == pageviews.format_date(today - timedelta(days=1))
+
+
+def test_update_window_crash(hourly_views, monkeypatch):
+    monkeypatch.setattr(pageviews, 'datetime', FixedDatetime)
+    pageviews.download_pageviews_data(num_days=7)
+    
+    def crash(*_):
+        raise KeyboardInterrupt()
+    
+    monkeypatch.setattr(FixedDatetime, 'today', FixedDatetime.today + timedelta(days=1))
+    with monkeypatch.context() as m:
+        m.setattr(pageviews, 'save_window_days', crash)
+        with pytest.raises(KeyboardInterrupt):
+            pageviews.download_pageviews_data(num_days=7, incremental=True)
+    
+    # The window was replaced without its days, so it is recomputed instead of updated again
+    assert pageviews.load_window_days('en') is None
+    pageviews.download_pageviews_data(num_days=7, incremental=True)
+    assert window_counts() == recompute(monkeypatch, FixedDatetime.today)
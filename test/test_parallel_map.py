@@ -0,0 +1,51 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import time
+
+import pytest
+
+from wd_semantic_parsing.utils import parallel_map
+
+
+def square(x):
+    return x * x
+
+
+def slow_first(x):
+    # The first item finishes last, so that the unordered results are not in the input order
+    if x == 0:
+        time.sleep(0.5)
+    return x * x
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+def test_ordered(workers):
+    assert list(parallel_map(square, range(50), workers)) == [x * x for x in range(50)]
+    assert list(parallel_map(square, [], workers)) == []
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_unordered(workers):
+    results = list(parallel_map(slow_first, range(8), workers, ordered=False))
+    assert sorted(results) == [x * x for x in range(8)]
+    if workers > 1:
+        assert results[0] != 0
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+@pytest.mark.parametrize("max_pending", [1, 3])
+def test_max_pending(ordered, max_pending):
+    pulled = 0
+    
+    def items():
+        nonlocal pulled
+        for x in range(20):
+            pulled += 1
+            yield x
+    
+    results = []
+    for result in parallel_map(square, items(), workers=2, max_pending=max_pending, ordered=ordered):
+        results.append(result)
+        # At most max_pending items are submitted ahead of the results consumed, this one included
+        assert pulled - len(results) < max_pending
+    assert sorted(results) == [x * x for x in range(20)]
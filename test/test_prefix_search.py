@@ -0,0 +1,102 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import random
+
+import pytest
+
+from wd_semantic_parsing.wikidata.prefix_search import (PrefixSearch, PrefixSearchWriter, MAX_PREFIX_LENGTH,
+                                                         PREFIX_MIN_DENOTATIONALS)
+
+
+def make_denotationals():
+    rng = random.Random(0)
+    denotationals = {}
+    for _ in range(500):
+        denotational = ''.join(rng.choice('abcé ') for _ in range(rng.randint(1, 8))).strip()
+        if denotational:
+            entities = {'Q%d' % rng.randint(1, 300) for _ in range(rng.randint(1, 4))}
+            denotationals[denotational] = sorted(((entity, int(entity[1:]) * 7 % 1000) for entity in entities),
+                                                 key=lambda entity_views: entity_views[1], reverse=True)
+    return sorted(denotationals.items())
+
+
+def brute_force(denotationals, prefix, k):
+    views = {}
+    for denotational, entities in denotationals:
+        if denotational.startswith(prefix):
+            views.update((entity, pageviews) for entity, pageviews in entities)
+    return sorted(views.values(), reverse=True)[:k]
+
+
+@pytest.mark.parametrize("min_denotationals", [2, 1000])
+def test_prefix_search(tmp_path, min_denotationals):
+    denotationals = make_denotationals()
+    suggest_path, prefixes_path = str(tmp_path / 'suggest'), str(tmp_path / 'prefixes')
+    writer = PrefixSearchWriter(suggest_path, prefixes_path, top_k=5, min_denotationals=min_denotationals)
+    for denotational, entities in denotationals:
+        writer.add(denotational, entities)
+    writer.close()
+    
+    with PrefixSearch(suggest_path, prefixes_path) as search:
+        for prefix in ['a', 'ab', 'é', 'c a', 'abcab', 'zz']:
+            for k in [1, 5, 10]:
+                suggestions = search.search(prefix, k)
+                expected = brute_force(denotationals, prefix, k)
+                # Precomputed prefixes return at most their top 5
+                assert len(suggestions) >= min(len(expected), 5)
+                assert [views for _, _, views in suggestions] == expected[:len(suggestions)]
+                assert all(denotational.startswith(prefix) for denotational, _, _ in suggestions)
+                # Each entity is suggested once
+                assert len({qid for _, qid, _ in suggestions}) == len(suggestions)
+
+
+def test_long_prefixes(tmp_path, monkeypatch):
+    rng = random.Random(0)
+    long_prefix = 'the list of the longest names of ' + 'a' * 10
+    assert len(long_prefix) > MAX_PREFIX_LENGTH
+    denotationals = {long_prefix + 'bcd' + str(i): [('Q%d' % i, rng.randint(1, 1000))]
+                     for i in range(2 * PREFIX_MIN_DENOTATIONALS)}
+    denotationals[long_prefix + 'x'] = [('Q1000000', 5)]
+    denotationals = sorted(denotationals.items())
+    suggest_path, prefixes_path = str(tmp_path / 'suggest'), str(tmp_path / 'prefixes')
+    writer = PrefixSearchWriter(suggest_path, prefixes_path, top_k=5)
+    for denotational, entities in denotationals:
+        writer.add(denotational, entities)
+    writer.close()
+    
+    with PrefixSearch(suggest_path, prefixes_path) as search:
+        # Few denotationals start with the prefix, they are scanned
+        assert search.search(long_prefix + 'x', 10) == [(long_prefix + 'x', 'Q1000000', 5)]
+        suggestions = search.search(long_prefix + 'bcd10', 20)
+        assert [views for _, _, views in suggestions] == brute_force(denotationals, long_prefix + 'bcd10', 20)
+        assert len(suggestions) == 11
+        
+        # Many do, they are answered from the list of the first MAX_PREFIX_LENGTH characters when it has k of them
+        monkeypatch.setattr(search, 'scan', None)
+        for prefix in [long_prefix, long_prefix + 'b']:
+            suggestions = search.search(prefix, 5)
+            assert [views for _, _, views in suggestions] == brute_force(denotationals, prefix, 5)
+            assert all(denotational.startswith(prefix) for denotational, _, _ in suggestions)
+
+
+def test_long_prefixes_diverging(tmp_path):
+    # The most viewed entities of the first MAX_PREFIX_LENGTH characters do not start with the longer prefixes
+    rng = random.Random(0)
+    long_prefix = 'the list of the longest names of ' + 'a' * 10
+    denotationals = {}
+    for i in range(2 * PREFIX_MIN_DENOTATIONALS):
+        denotationals[long_prefix + 'b' + str(i)] = [('Q%d' % i, rng.randint(1, 1000))]
+        denotationals[long_prefix + 'c' + str(i)] = [('Q%d' % (10000 + i), rng.randint(2000, 3000))]
+    denotationals = sorted(denotationals.items())
+    suggest_path, prefixes_path = str(tmp_path / 'suggest'), str(tmp_path / 'prefixes')
+    writer = PrefixSearchWriter(suggest_path, prefixes_path, top_k=5)
+    for denotational, entities in denotationals:
+        writer.add(denotational, entities)
+    writer.close()
+    
+    with PrefixSearch(suggest_path, prefixes_path) as search:
+        for prefix in [long_prefix, long_prefix + 'b', long_prefix + 'b1', long_prefix + 'c']:
+            for k in [1, 5, 30]:
+                suggestions = search.search(prefix, k)
+                assert [views for _, _, views in suggestions] == brute_force(denotationals, prefix, k)
+                assert all(denotational.startswith(prefix) for denotational, _, _ in suggestions)
@@ -0,0 +1,55 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+from wd_semantic_parsing.sorted_table import CountTable, ArrayTable, write_sorted_table, write_count_table
+
+
+COUNTS = {'Paris': 3, 'Rome': 1, 'Zürich': 7, 'Ängelholm': 2, 'a': 0}
+ARRAYS = {'paris': [90, 830149], 'rome': [220], 'empty': [], 'zürich': [72]}
+
+
+@pytest.mark.parametrize("hash_index", [False, True])
+def test_count_table(tmp_path, hash_index):
+    filepath = str(tmp_path / 'counts')
+    write_sorted_table(filepath, CountTable, COUNTS, hash_index=hash_index)
+    with CountTable(filepath) as table:
+        assert dict(table.items()) == COUNTS
+        assert list(table) == sorted(COUNTS, key=lambda key: key.encode('utf-8'))
+        assert table['Zürich'] == 7 and 'London' not in table
+        assert (table.slots is not None) == hash_index
+
+
+@pytest.mark.parametrize("hash_index", [False, True])
+def test_array_table(tmp_path, hash_index):
+    filepath = str(tmp_path / 'arrays')
+    write_sorted_table(filepath, ArrayTable, ARRAYS, hash_index=hash_index)
+    with ArrayTable(filepath) as table:
+        assert {key: list(value) for key, value in table.items()} == ARRAYS
+        assert list(table['paris']) == [90, 830149]
+        assert table.find('london') == -1
+        with pytest.raises(KeyError):
+            table['london']
+
+
+def test_unsorted(tmp_path):
+    with pytest.raises(ValueError):
+        write_count_table(str(tmp_path / 'counts'), [('b', 1), ('a', 2)], presorted=True)
+
+
+def test_static_gazetteer(tmp_path):
+    from wd_semantic_parsing.wikidata.gazetteer import StaticGazetteer, StaticGazetteerTable
+    
+    filepath = str(tmp_path / 'gazetteer.static')
+    # Interleaved QID numbers and pageviews
+    write_sorted_table(filepath, StaticGazetteerTable, {'paris': [90, 500, 830149, 20], 'rome': [220, 7], 'empty': []},
+                       hash_index=True)
+    assert StaticGazetteerTable.has_format(filepath) and not ArrayTable.has_format(filepath)
+    with StaticGazetteer(filepath) as gazetteer:
+        assert gazetteer.read('paris') == ['Q90', 'Q830149']
+        assert gazetteer.read('empty') == [] and gazetteer.read('london') is None
+        assert gazetteer.read_many(['rome', 'london']) == {'rome': ['Q220']}
+        assert gazetteer.read_scored('paris') == [('Q90', 500), ('Q830149', 20)]
+        assert gazetteer.read_scored('paris', 1) == [('Q90', 500)]
+        assert list(gazetteer.read_ids('paris', 1)) == [90]
+        assert len(gazetteer) == 3
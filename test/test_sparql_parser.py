@@ -0,0 +1,117 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import random
+from os import path
+
+import pytest
+from rdflib.term import Literal, Variable
+
+from wd_semantic_parsing.sparql.data import SPARQL, SparqlSubsetException, parse_subset
+
+from test_mrl_to_sparql import TESTS as MRL_TO_SPARQL_TESTS
+from test_sparql_to_mrl import TESTS as SPARQL_TO_MRL_TESTS
+
+
+LC_QUAD2_SAMPLE = path.join(path.dirname(__file__), 'data', 'lcquad2')
+QUERIES = [sparql for _, sparql in MRL_TO_SPARQL_TESTS] + [sparql for sparql, _ in SPARQL_TO_MRL_TESTS] + [
+    "select ?a where { ?a wdt:P1 wd:Q1 . ?a ?p ?b filter(?a) FILTER CONTAINS(YEAR(?b), \"x\") . ?b wdt:P2 ?a . }",
+    "ASK { wd:Q1 wdt:P2 ?x FILTER((?x) >= 1.5e3) } ORDER BY asc(?x) DESC(LCASE(?y)) limit 05",
+    "SELECT ?x (COUNT(?y) AS ?c) (SUM(?z) AS ?s) {?x wdt:P1 ?y.?y wdt:P2 ?z.FILTER(LANG(?x) != 'en')}",
+]
+
+
+def tree(obj):
+    """Structure of the parsed queries, with the types of their values."""
+    if isinstance(obj, (Variable, Literal)):
+        return type(obj).__name__, str(obj), getattr(obj, 'datatype', None)
+    if isinstance(obj, (list, tuple)):
+        return [tree(o) for o in obj]
+    if hasattr(obj, '__dict__'):
+        return type(obj).__name__, {k: tree(v) for k, v in vars(obj).items()}
+    return type(obj).__name__, str(obj)
+
+
+def parse_or_error(parse, sparql_str):
+    try:
+        return tree(parse(sparql_str))
+    except Exception as e:
+        return type(e).__name__
+
+
+@pytest.mark.parametrize("sparql_str", QUERIES)
+def test_subset(sparql_str):
+    assert tree(parse_subset(sparql_str)) == tree(SPARQL.parse_rdflib(sparql_str))
+
+
+def choice(rng, valid, invalid):
+    """Mostly valid fragments of the subset, otherwise invalid ones or ones outside of the subset."""
+    return rng.choice(valid if rng.random() < 0.95 else invalid)
+
+
+def random_expression(rng, depth=0):
+    if depth > 2 or rng.random() < 0.4:
+        return choice(rng, ['?x', '?y', "'en'", '"a b"', '0.1', '5', '1e5', '.5'],
+                      ["'a'@en", "'''a'''", 'true', '-5', 'wd:Q5', "'a\\'b'", '<http://x>'])
+    e1, e2 = random_expression(rng, depth + 1), random_expression(rng, depth + 1)
+    return choice(rng, [f'CONTAINS({e1}, {e2})', f'strstarts({e1},{e2})', f'YEAR({e1})', f'lcase({e1})',
+                        f'LANG({e1})', f'{e1} = {e2}', f'{e1}<{e2}', f'{e1} >= {e2}', f'{e1} != {e2}', f'({e1})'],
+                  [f'REGEX({e1}, {e2})', f'{e1} && {e2}', f'STR({e1})', f'{e1} + {e2}', f'{e1} IN ({e2})'])
+
+
+def random_query(rng):
+    node = lambda: choice(rng, ['?x', '?y', '?ans_0', 'wd:Q5', 'wdt:P31', 'rdfs:label', 'p:P1.2'],
+                          ['$x', '_:b', '<http://x>', "'a'", '5', 'a', 'wd:', 'wd:Q5:x', '[]'])
+    parts = [choice(rng, ['SELECT', 'select', 'ASK', 'Ask'], ['CONSTRUCT', 'PREFIX wd: <http://x> SELECT'])]
+    if parts[0].upper().endswith('SELECT'):
+        if rng.random() < 0.3:
+            parts.append(choice(rng, ['DISTINCT'], ['REDUCED']))
+        for _ in range(rng.randint(1, 3)):
+            parts.append(choice(rng, ['?x', '?y', '(COUNT(?x) AS ?c)', '(sum(?y) as ?s)'],
+                                ['*', '(COUNT(DISTINCT ?x) AS ?c)', '(COUNT(*) AS ?c)', '(MAX(?x) AS ?m)']))
+    if rng.random() < 0.7:
+        parts.append('WHERE')
+    parts.append('{')
+    for _ in range(rng.randint(1, 4)):
+        if rng.random() < 0.3:
+            parts.append(f'FILTER({random_expression(rng)})' if rng.random() < 0.8 else
+                         f'FILTER {random_expression(rng)}')
+        else:
+            parts.extend([node(), node(), node()])
+        parts.append(choice(rng, ['.', '.', ''], [';', ',', '. .', 'OPTIONAL { ?x ?y ?z }']))
+    parts.append('}')
+    if rng.random() < 0.3:
+        parts.append(choice(rng, ['ORDER BY DESC(?x)', 'order by asc(?y) desc(?x)'],
+                            ['ORDER BY ?x', 'ORDER BY DESC(5)', 'GROUP BY ?x']))
+    if rng.random() < 0.3:
+        parts.append(choice(rng, ['LIMIT 5', 'limit 25'], ['LIMIT 25 OFFSET 2', 'OFFSET 2', 'LIMIT ?x']))
+    
+    query = ''.join(p + rng.choice([' '] * 8 + ['', '\n']) for p in parts)
+    if rng.random() < 0.2:
+        i = rng.randint(0, len(query))
+        query = query[:i] + rng.choice(['', '#', ' ', '.', '(', '}', 'é', '\xa0']) + query[i + 1:]
+    return query
+
+
+def test_parser_differential():
+    rng = random.Random(0)
+    subset = 0
+    for _ in range(1000):
+        query = random_query(rng)
+        assert parse_or_error(SPARQL.parse, query) == parse_or_error(SPARQL.parse_rdflib, query), query
+        try:
+            parse_subset(query)
+            subset += 1
+        except SparqlSubsetException:
+            pass
+    assert subset > 200
+
+
+def test_lcquad2():
+    # A sample of LC-QuAD 2.0 queries in the layout of its checkout, or the full dataset with LC_QUAD2 set
+    from wd_semantic_parsing.datasets.lcquad2 import LC_QUAD2
+    dataset = LC_QUAD2(os.environ.get('LC_QUAD2', LC_QUAD2_SAMPLE))
+    for test in (False, True):
+        for entry in dataset.load_entries(test):
+            query = entry['sparql_wikidata']
+            assert parse_or_error(SPARQL.parse, query) == parse_or_error(SPARQL.parse_rdflib, query), query